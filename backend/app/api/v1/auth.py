@@ -1,6 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
-from supabase import Client
-from app.core.supabase_client import get_supabase
+from app.core.repositories import Repositories, get_repositories
 from app.schemas.auth import SignupIn, LoginIn, AuthOut
 from pydantic import BaseModel
 
@@ -12,10 +11,8 @@ class SignupOut(BaseModel):
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.post("/signup", response_model=SignupOut)
-def signup(payload: SignupIn, supabase: Client = Depends(get_supabase)):
-    res = supabase.auth.sign_up(
-            {"email": payload.email, "password": payload.password}
-        )
+async def signup(payload: SignupIn, repos: Repositories = Depends(get_repositories)):
+    res = await repos.auth.sign_up(payload.email, payload.password)
 
     if not res.user:
         raise HTTPException(status_code=400, detail="Signup failed, no user returned")
@@ -27,8 +24,8 @@ def signup(payload: SignupIn, supabase: Client = Depends(get_supabase)):
     )
 
 @router.post("/login", response_model=AuthOut)
-def login(payload: LoginIn, supabase: Client = Depends(get_supabase)):
-    session = supabase.auth.sign_in_with_password({"email": payload.email, "password": payload.password})
+async def login(payload: LoginIn, repos: Repositories = Depends(get_repositories)):
+    session = await repos.auth.sign_in(payload.email, payload.password)
     if not session.session:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     user = session.user
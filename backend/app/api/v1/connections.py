@@ -1,152 +1,169 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from supabase import Client
-from app.core.supabase_client import get_supabase
+from app.core.config import get_settings
+from app.core.connection_graph import ConnectionGraph, get_connection_graph, subgraph
+from app.core.fast_json import RowType, rows_response
+from app.core.pagination import decode_cursor, encode_cursor
+from app.core.profile_loader import ProfileLoader, get_profile_loader
+from app.core.repositories import Repositories, get_repositories
 from app.core.security import get_current_user
-from app.schemas.connections import ConnectionCreate, ConnectionRespond, ConnectionOut
+from app.schemas.connections import (
+    ConnectionCreate,
+    ConnectionRespond,
+    ConnectionOut,
+    ConnectionPage,
+    MutualOut,
+    SuggestionOut,
+)
 
 router = APIRouter(prefix="/connections", tags=["connections"])
 
+CONNECTION_ROWS = RowType(ConnectionOut)
+
+
+async def _enrich(connections: list[dict], user_id: str, profiles: ProfileLoader) -> list[dict]:
+    # attach self / other ProfileBriefs and the request direction
+    user_ids = {user_id}
+    for c in connections:
+        user_ids.add(c["requester_id"])
+        user_ids.add(c["addressee_id"])
+    briefs = await profiles.load_many(user_ids)
+
+    for c in connections:
+        outgoing = c["requester_id"] == user_id
+        c["self"] = briefs.get(user_id)
+        c["other"] = briefs.get(c["addressee_id"] if outgoing else c["requester_id"])
+        c["direction"] = "outgoing" if outgoing else "incoming"
+    return connections
+
+def _ready_graph() -> ConnectionGraph | None:
+    graph = get_connection_graph()
+    return graph if graph is not None and graph.ready else None
+
+async def _connection_changed(connection: dict) -> None:
+    graph = get_connection_graph()
+    if graph is not None:
+        await graph.record(connection)
+
 @router.post("", response_model=ConnectionOut)
-def request_connection(
+async def request_connection(
     payload: ConnectionCreate,
     user=Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    repos: Repositories = Depends(get_repositories),
+    profiles: ProfileLoader = Depends(get_profile_loader),
 ):
     if payload.addressee_id == user.id:
         raise HTTPException(status_code=400, detail="Cannot connect to self")
 
     try:
         # Try to insert a new connection
-        res = (
-            supabase.table("connections")
-            .insert({
-                "requester_id": user.id,
-                "addressee_id": payload.addressee_id,
-            })
-            .execute()
-        )
+        connection = await repos.connections.insert(user.id, payload.addressee_id)
 
     except Exception as e:
         # Catch Postgres duplicate key constraint (error code 23505)
         if "duplicate key value violates unique constraint" in str(e):
             # Fetch the existing connection and return it
-            existing = (
-                supabase.table("connections")
-                .select("*")
-                .or_(f"and(requester_id.eq.{user.id},addressee_id.eq.{payload.addressee_id}),and(requester_id.eq.{payload.addressee_id},addressee_id.eq.{user.id})")
-                .single()
-                .execute()
-            )
-            connection = existing.data
+            connection = await repos.connections.get_between(user.id, payload.addressee_id)
+            if connection is None:
+                # deleted between the insert and the lookup
+                raise HTTPException(status_code=409, detail="Connection changed concurrently, retry")
         else:
             raise e
-    else:
-        # No error, use the newly inserted record
-        connection = res.data[0]
-
-    # fetch profile info to enrich response
-    profiles_res = (
-        supabase.table("profiles")
-        .select("id, username, first_name, last_name")
-        .in_("id", [user.id, payload.addressee_id])
-        .execute()
-    )
-    profiles = {p["id"]: p for p in (profiles_res.data or [])}
-
-    connection["self"] = profiles.get(user.id)
-    connection["other"] = profiles.get(payload.addressee_id)
-    connection["direction"] = "outgoing" if connection["requester_id"] == user.id else "incoming"
 
+    await _connection_changed(connection)
+    await _enrich([connection], user.id, profiles)
     return connection
 
 @router.get("", response_model=list[ConnectionOut])
-def list_connections(
+async def list_connections(
     status: str | None = None,
     user=Depends(get_current_user),
-    supabase: Client = Depends(get_supabase),
+    repos: Repositories = Depends(get_repositories),
+    profiles: ProfileLoader = Depends(get_profile_loader),
 ):
-    # Base query to fetch user’s connections
-    query = (
-        supabase.table("connections")
-        .select("*")
-        .or_(f"requester_id.eq.{user.id},addressee_id.eq.{user.id}")
-    )
-    if status:
-        query = query.eq("status", status)
-
-    res = query.execute()
-
-    # Fetch profiles manually (safe even without FK)
-    connections = res.data or []
-    if not connections:
-        return []
-
-    # collect unique user ids
-    user_ids = set()
-    for c in connections:
-        user_ids.add(c["requester_id"])
-        user_ids.add(c["addressee_id"])
+    graph = _ready_graph()
+    if graph is not None:
+        connections = graph.page(user.id, status)[0]
+    else:
+        # Base query to fetch user’s connections
+        connections = await repos.connections.list_for_user(user.id, status)
 
-    # fetch profiles
-    profiles_res = supabase.table("profiles").select("id, username, first_name, last_name").in_("id", list(user_ids)).execute()
-    profiles = {p["id"]: p for p in (profiles_res.data or [])}
+    connections = await _enrich(connections, user.id, profiles)
+    return rows_response(connections, CONNECTION_ROWS) if get_settings().fast_responses else connections
 
-    # enrich connections with profile data
-    for c in connections:
-        #c["sender"] = profiles.get(c["requester_id"])
-        #c["addressee"] = profiles.get(c["addressee_id"])
-        if c["requester_id"] == user.id:
-            c["self"] = profiles.get(user.id)
-            c["other"] = profiles.get(c["addressee_id"])
-            c["direction"] = "outgoing"
-        else:
-            c["self"] = profiles.get(user.id)
-            c["other"] = profiles.get(c["requester_id"])
-            c["direction"] = "incoming"
+# Keyset pages in connection id order; the graph and the database fallback
+# order the same way, so a cursor from either works with the other.
+@router.get("/page", response_model=ConnectionPage)
+async def list_connections_page(
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    profiles: ProfileLoader = Depends(get_profile_loader),
+):
+    try:
+        after = decode_cursor(cursor, 1)[0] if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    graph = _ready_graph()
+    if graph is not None:
+        connections, next_key = graph.page(user.id, status, limit, after)
+    else:
+        rows = await repos.connections.page_for_user(user.id, status, limit + 1, after)
+        connections = rows[:limit]
+        next_key = connections[-1]["id"] if len(rows) > limit else None
+    return {
+        "items": await _enrich(connections, user.id, profiles),
+        "next_cursor": encode_cursor(next_key) if next_key else None,
+    }
+
+@router.get("/mutual/{other_user_id}", response_model=MutualOut)
+async def mutual_connections(
+    other_user_id: str,
+    user=Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+):
+    graph = _ready_graph() or await subgraph(repos, user.id, other_user_id)
+    return {"user_id": other_user_id, "mutual_count": graph.mutual_count(user.id, other_user_id)}
 
-    return connections
+# People your connections are connected to, most mutual connections first
+@router.get("/suggestions", response_model=list[SuggestionOut])
+async def suggestions(
+    limit: int = Query(20, ge=1, le=100),
+    user=Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+    profiles: ProfileLoader = Depends(get_profile_loader),
+):
+    graph = _ready_graph() or await subgraph(repos, user.id, depth=2)
+    found = graph.suggestions(user.id, limit)
+    briefs = await profiles.load_many([user_id for user_id, _ in found])
+    return [
+        {"user": briefs[user_id], "mutual_count": n}
+        for user_id, n in found if briefs.get(user_id)
+    ]
 
 
 @router.post("/respond", response_model=ConnectionOut)
-def respond_connection(
+async def respond_connection(
     payload: ConnectionRespond,
     user=Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    repos: Repositories = Depends(get_repositories),
+    profiles: ProfileLoader = Depends(get_profile_loader),
 ):
-    conn = supabase.table("connections").select("*").eq("id", payload.connection_id).execute()
+    conn = await repos.connections.get(payload.connection_id)
 
-    if not conn.data:
+    if not conn:
         raise HTTPException(status_code=404, detail="Connection not found")
 
-    if conn.data[0]["addressee_id"] != user.id:
+    if conn["addressee_id"] != user.id:
         raise HTTPException(status_code=403, detail="Not authorized to respond")
 
     new_status = "accepted" if payload.action == "accept" else "rejected"
-    res = (
-        supabase.table("connections")
-        .update({"status": new_status})
-        .eq("id", payload.connection_id)
-        .execute()
-    )
-
-    if not res.data:
-        raise HTTPException(status_code=400, detail=res.error.message)
-
-    connection = res.data[0]
-
-    # enrich with profiles
-    profiles_res = supabase.table("profiles").select("id, username, first_name, last_name").in_(
-        "id", [connection["requester_id"], connection["addressee_id"]]
-    ).execute()
-    profiles = {p["id"]: p for p in (profiles_res.data or [])}
-
-    if connection["requester_id"] == user.id:
-        connection["self"] = profiles.get(user.id)
-        connection["other"] = profiles.get(connection["addressee_id"])
-        connection["direction"] = "outgoing"
-    else:
-        connection["self"] = profiles.get(user.id)
-        connection["other"] = profiles.get(connection["requester_id"])
-        connection["direction"] = "incoming"
+    connection = await repos.connections.set_status(payload.connection_id, new_status)
+
+    if not connection:
+        raise HTTPException(status_code=400, detail="Failed to update connection")
 
+    await _connection_changed(connection)
+    await _enrich([connection], user.id, profiles)
     return connection
@@ -1,44 +1,53 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from supabase import Client
-from app.core.supabase_client import get_supabase
+from app.core.config import get_settings
+from app.core.connection_graph import ACCEPTED, REJECTED, get_connection_graph
+from app.core.conversation_cache import dm_pair, get_conversation_resolver
+from app.core.inbox import get_inbox
+from app.core.pagination import decode_keyset_cursor, encode_cursor
+from app.core.participants import ADMIN, MEMBER, get_participants
+from app.core.profile_loader import ProfileLoader, get_profile_cache, get_profile_loader
+from app.core.repositories import Repositories, get_repositories
 from app.core.security import get_current_user
-from app.schemas.conversations import ConversationOut, CreateDMOut
+from app.schemas.conversations import (
+    AddParticipantsIn,
+    CreateDMOut,
+    CreateGroupIn,
+    GroupOut,
+    InboxPage,
+    ParticipantOut,
+)
+from app.api.v1.ws import broadcast_to_users
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
-def _dm_pair(a: str, b: str) -> str:
-    return f"{min(a,b)}|{max(a,b)}"
-
 @router.post("/dm/{other_user_id}", response_model=CreateDMOut)
-def get_or_create_dm(other_user_id: str,
+async def get_or_create_dm(other_user_id: str,
                     user=Depends(get_current_user),
-                    supabase: Client = Depends(get_supabase)):
+                    repos: Repositories = Depends(get_repositories)):
 
     if other_user_id == user.id:
         raise HTTPException(status_code=400, detail="Cannot DM yourself")
 
-    pair = _dm_pair(user.id, other_user_id)
+    pair = dm_pair(user.id, other_user_id)
 
     # 1) find or create conversation with this dm_pair
-    existing = supabase.table("conversations").select("*").eq("dm_pair", pair).execute()
-    if existing.data:
-        convo = existing.data[0]
-    else:
-        # Optional: check settings/blocks to decide is_request
-        is_request = False  # set True if you want DM requests when not connected
-        ins = supabase.table("conversations").insert({
-            "type": "dm",
-            "dm_pair": pair,
-            "is_request": is_request
-        }).execute()
-        if not ins.data:
+    convo = await repos.conversations.get_by_dm_pair(pair)
+    if not convo:
+        # blocked pairs can't open a DM; anyone else not connected lands as a request
+        graph = get_connection_graph()
+        if graph is not None and graph.ready:
+            connection = graph.between(user.id, other_user_id)
+        else:
+            connection = await repos.connections.get_between(user.id, other_user_id)
+        status = connection["status"] if connection else None
+        if status == REJECTED:
+            raise HTTPException(status_code=403, detail="Cannot message this user")
+        # inserts both participants too
+        try:
+            convo = await get_conversation_resolver().create(
+                repos, user.id, other_user_id, is_request=status != ACCEPTED)
+        except RuntimeError:
             raise HTTPException(status_code=500, detail="Failed to create conversation")
-        convo = ins.data[0]
-        # add both participants
-        supabase.table("conversation_participants").insert([
-            {"conversation_id": convo["id"], "user_id": user.id},
-            {"conversation_id": convo["id"], "user_id": other_user_id},
-        ]).execute()
 
     return {
         "id": convo["id"],
@@ -46,22 +55,124 @@ def get_or_create_dm(other_user_id: str,
         "is_request": convo["is_request"],
     }
 
-@router.get("", response_model=list[ConversationOut])
-def list_inbox(
-    limit: int = 20,
-    supabase: Client = Depends(get_supabase),
+@router.get("", response_model=InboxPage)
+async def list_inbox(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    repos: Repositories = Depends(get_repositories),
+    profiles: ProfileLoader = Depends(get_profile_loader),
     user=Depends(get_current_user),
 ):
-    # conversations for this user ordered by updated_at desc
-    convos = supabase.rpc("exec_sql", {  # if you don't have rpc, use a join in app
-        "query": """
-        select c.id, c.type, c.is_request
-        from conversations c
-        join conversation_participants p on p.conversation_id = c.id
-        where p.user_id = %(uid)s
-        order by c.updated_at desc
-        limit %(lim)s
-        """,
-        "params": {"uid": user.id, "lim": limit}
-    }).execute()  # Alternative: do select on participants then fetch convos by ids
-    return convos.data or []
+    # conversations for this user, latest message first, with preview,
+    # unread count and the other participant's brief profile
+    try:
+        position = decode_keyset_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    items, has_more = await get_inbox().page(repos, profiles, user.id, limit, position)
+    last = items[-1]["last_message"] if items else None
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(last["created_at"], items[-1]["conversation_id"]) if has_more else None,
+        "has_more": has_more,
+    }
+
+async def _group_members(repos: Repositories, conversation_id: str, user_id: str) -> dict[str, str]:
+    # {user_id: role}; 404 unless it's a group the user belongs to
+    participants = get_participants()
+    if conversation_id not in await participants.groups_of(repos, user_id):
+        raise HTTPException(status_code=404, detail="Group not found")
+    return await participants.members(repos, conversation_id)
+
+async def _require_profiles(repos: Repositories, user_ids: list[str]):
+    briefs = await get_profile_cache().get_many(repos, user_ids)
+    unknown = [u for u in user_ids if briefs.get(u) is None]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown users: {', '.join(unknown[:10])}")
+
+@router.post("/group", response_model=GroupOut)
+async def create_group(payload: CreateGroupIn,
+                    user=Depends(get_current_user),
+                    repos: Repositories = Depends(get_repositories)):
+
+    members = list(dict.fromkeys([user.id, *payload.member_ids]))
+    if len(members) < 2:
+        raise HTTPException(status_code=400, detail="A group needs at least one other member")
+    limit = get_settings().group_max_members
+    if len(members) > limit:
+        raise HTTPException(status_code=400, detail=f"Groups are limited to {limit} members")
+    await _require_profiles(repos, members[1:])
+
+    convo = await repos.conversations.insert({"type": "group", "title": payload.title, "is_request": False})
+    if not convo:
+        raise HTTPException(status_code=500, detail="Failed to create conversation")
+    # the creator administers the group
+    await repos.conversations.add_participants(convo["id"], [user.id], role=ADMIN)
+    await repos.conversations.add_participants(convo["id"], members[1:], role=MEMBER)
+    await get_participants().invalidate(convo["id"], members)
+
+    await broadcast_to_users(members, {
+        "type": "group",
+        "action": "created",
+        "conversation_id": convo["id"],
+        "title": convo.get("title"),
+    })
+    return convo
+
+@router.get("/{conversation_id}/participants", response_model=list[ParticipantOut])
+async def list_participants(conversation_id: str,
+                    user=Depends(get_current_user),
+                    repos: Repositories = Depends(get_repositories)):
+
+    members = await _group_members(repos, conversation_id, user.id)
+    return [{"user_id": user_id, "role": role} for user_id, role in members.items()]
+
+@router.post("/{conversation_id}/participants", response_model=list[ParticipantOut])
+async def add_participants(conversation_id: str,
+                    payload: AddParticipantsIn,
+                    user=Depends(get_current_user),
+                    repos: Repositories = Depends(get_repositories)):
+
+    members = await _group_members(repos, conversation_id, user.id)
+    if members.get(user.id) != ADMIN:
+        raise HTTPException(status_code=403, detail="Only group admins can add members")
+    new = [u for u in dict.fromkeys(payload.user_ids) if u not in members]
+    limit = get_settings().group_max_members
+    if len(members) + len(new) > limit:
+        raise HTTPException(status_code=400, detail=f"Groups are limited to {limit} members")
+    if not new:
+        return []
+    await _require_profiles(repos, new)
+
+    await repos.conversations.add_participants(conversation_id, new, role=MEMBER)
+    await get_participants().invalidate(conversation_id, new)
+    await broadcast_to_users([*members, *new], {
+        "type": "group",
+        "action": "joined",
+        "conversation_id": conversation_id,
+        "user_ids": new,
+    })
+    return [{"user_id": u, "role": MEMBER} for u in new]
+
+@router.delete("/{conversation_id}/participants/{member_id}")
+async def remove_participant(conversation_id: str,
+                    member_id: str,
+                    user=Depends(get_current_user),
+                    repos: Repositories = Depends(get_repositories)):
+
+    # members may leave; admins may remove anyone
+    members = await _group_members(repos, conversation_id, user.id)
+    if member_id != user.id and members.get(user.id) != ADMIN:
+        raise HTTPException(status_code=403, detail="Only group admins can remove members")
+    if member_id not in members:
+        raise HTTPException(status_code=404, detail="Not a member")
+
+    await repos.conversations.remove_participant(conversation_id, member_id)
+    await get_participants().invalidate(conversation_id, [member_id])
+    await broadcast_to_users(list(members), {
+        "type": "group",
+        "action": "left",
+        "conversation_id": conversation_id,
+        "user_ids": [member_id],
+    })
+    return {"status": "success"}
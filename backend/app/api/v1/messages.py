@@ -1,112 +1,455 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from supabase import Client
-from app.core.supabase_client import get_supabase
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Literal
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.core.config import get_settings
+from app.core.conversation_cache import get_conversation_resolver
+from app.core.events import get_event_log
+from app.core.fast_json import RowType, rows_response
+from app.core.inbox import get_inbox
+from app.core.ingest import get_ingest
+from app.core.message_cache import get_message_cache
+from app.core.message_events import get_message_events
+from app.core.message_search import get_message_search, index_messages, snippet, tokenize
+from app.core.ndjson import LineTooLong, gzip_chunks, iter_lines
+from app.core.metrics import span
+from app.core.pagination import decode_cursor, decode_keyset_cursor, encode_cursor, parse_timestamp
+from app.core.participants import ADMIN, MEMBER, get_participants
+from app.core.repositories import Repositories, get_repositories
 from app.core.security import get_current_user
-from app.schemas.messages import MessageCreate, MessageOut
-from app.schemas.conversations import SendMessageIn, ReadPointerIn
-from app.api.v1.ws import broadcast_to_user
+from app.schemas.messages import (
+    ConversationMessageIn, ImportResult, MessageCreate, MessageOut, MessagePage, MessageSearchPage, SyncPage,
+)
+from app.schemas.conversations import SendMessageIn, ReadPointerIn, ReadPointerOut, UnreadOut
+from app.api.v1.ws import broadcast_to_users
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
+Direction = Literal["older", "newer"]
+Compression = Literal["none", "gzip"]
+
+EXPORT_FIELDS = tuple(MessageOut.model_fields)
+MESSAGE_ROWS = RowType(MessageOut)
+# invalid import lines reported back in full; the rest are only counted
+MAX_IMPORT_ERRORS = 20
+
+def _message_cursor(row: dict) -> str:
+    return encode_cursor(row["created_at"], row["id"])
+
+def _parse_cursor(cursor: str | None) -> tuple[str, str] | None:
+    if cursor is None:
+        return None
+    try:
+        return decode_keyset_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _members(repos: Repositories, user_id: str, conversation_id: str) -> tuple[bool, dict[str, str]]:
+    """(is a group, {member: role}) for a conversation `user_id` is in; 404 otherwise."""
+    participants = get_participants()
+    if conversation_id in await participants.groups_of(repos, user_id):
+        return True, await participants.members(repos, conversation_id)
+    pair = await participants.dm_pair(repos, conversation_id) or ()
+    if user_id not in pair:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return False, dict.fromkeys(pair, MEMBER)
+
+def _page(rows: list[dict], limit: int, cursor: str | None) -> dict:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": rows,
+        # with nothing new, hand the cursor back so a delta poll keeps its place
+        "next_cursor": _message_cursor(rows[-1]) if rows else cursor,
+        "prev_cursor": _message_cursor(rows[0]) if rows else None,
+        "has_more": has_more,
+    }
+
 @router.post("", response_model=MessageOut)
-async def send_message(payload: MessageCreate, user=Depends(get_current_user), supabase: Client = Depends(get_supabase)):
+async def send_message(payload: MessageCreate, user=Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
     if payload.receiver_id == user.id:
         raise HTTPException(status_code=400, detail="Cannot message yourself")
-    
-    # check if conversation already exists
-    convo = (
-        supabase.table("conversations")
-        .select("id")
-        .or_(f"and(user1_id.eq.{user.id},user2_id.eq.{payload.receiver_id}),and(user1_id.eq.{payload.receiver_id},user2_id.eq.{user.id})")
-        .limit(1)
-        .execute()
-    )
-
-    if convo.data:
-        conversation_id = convo.data[0]["id"]
-    else:
-        # create new conversation
-        new_convo = (
-            supabase.table("conversations")
-            .insert({
-                "user1_id": user.id,
-                "user2_id": payload.receiver_id,
-            })
-            .execute()
-        )
-        if not new_convo.data:
+
+    with span("send_message"):
+        # cached pair -> conversation_id; looked up / created once per pair
+        try:
+            conversation_id = await get_conversation_resolver().resolve(repos, user.id, payload.receiver_id)
+        except RuntimeError:
             raise HTTPException(status_code=500, detail="Failed to create conversation")
-        conversation_id = new_convo.data[0]["id"]
-        
-    res = supabase.table("messages").insert({
+
+        saved = await repos.messages.insert({
+            "sender_id": user.id,
+            "receiver_id": payload.receiver_id,
+            "body": payload.body,
+            "conversation_id": conversation_id,
+        })
+        if not saved:
+            raise HTTPException(status_code=400, detail="Insert failed")
+        await get_message_events().record(saved)
+
+        # 🔔 broadcast to the receiver (and optionally to sender too), encoded once
+        await broadcast_to_users([saved["receiver_id"], saved["sender_id"]], saved)
+
+    return saved
+
+# Send to a group conversation: stored, then fanned out to every member's
+# sockets (encoded once; see broadcast_to_users).
+@router.post("/{conversation_id}", response_model=MessageOut)
+async def send_to_conversation(conversation_id: str,
+            payload: ConversationMessageIn,
+            user=Depends(get_current_user),
+            repos: Repositories = Depends(get_repositories)):
+
+    participants = get_participants()
+    if conversation_id not in await participants.groups_of(repos, user.id):
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    saved = await repos.messages.insert({
         "sender_id": user.id,
-        "receiver_id": payload.receiver_id,
+        "receiver_id": None,
         "body": payload.body,
         "conversation_id": conversation_id,
-    }).execute()
-    if not res.data:
-        raise HTTPException(status_code=400, detail=getattr(res, "error", {"message": "Insert failed"}).get("message", "Insert failed"))
+    })
+    if not saved:
+        raise HTTPException(status_code=400, detail="Insert failed")
+    members = await participants.members(repos, conversation_id)
+    await get_message_events().record(saved, [m for m in members if m != user.id])
+    await broadcast_to_users([*members, user.id], saved)
+    return saved
 
-    saved = res.data[0]
+# Delta sync for clients whose socket resume gap was too large (a "resync"
+# event): everything they sent or received after the cursor, oldest first.
+# `seq` is read before the query, so resuming the socket from it afterwards
+# can only repeat events, never skip one.
+@router.get("/sync", response_model=SyncPage)
+async def sync(cursor: str | None = None,
+            limit: int = Query(200, ge=1, le=1000),
+            user=Depends(get_current_user),
+            repos: Repositories = Depends(get_repositories)):
 
-    # 🔔 broadcast to the receiver (and optionally to sender too)
-    await broadcast_to_user(saved["receiver_id"], saved)
-    await broadcast_to_user(saved["sender_id"], saved)
+    seq = await get_event_log().current(user.id)
+    position = _parse_cursor(cursor)
+    group_ids = await get_participants().groups_of(repos, user.id)
+    rows = await repos.messages.since_for_user(user.id, limit, position, group_ids)
+    # plus socket messages still waiting in the write-behind queue
+    pending = [r for r in get_ingest().pending_for_user(user.id)
+               if position is None or (r["created_at"], r["id"]) > tuple(position)]
+    if pending:
+        merged = {r["id"]: r for r in rows + pending}
+        rows = sorted(merged.values(), key=lambda r: (r["created_at"], r["id"]))[:limit + 1]
+    page = _page(rows, limit, cursor)
+    return {"seq": seq, "items": page["items"], "next_cursor": page["next_cursor"], "has_more": page["has_more"]}
 
-    return saved
+# Full-text search over the caller's DMs and groups (or one of them), best
+# match first. Served by the search index once it has loaded; until then a
+# substring match in the database, newest first and a single page.
+@router.get("/search", response_model=MessageSearchPage)
+async def search_messages(q: str = Query(..., min_length=1, max_length=200),
+            conversation_id: str | None = None,
+            cursor: str | None = None,
+            limit: int = Query(20, ge=1, le=100),
+            user=Depends(get_current_user),
+            repos: Repositories = Depends(get_repositories)):
+
+    index = get_message_search()
+    ready = index is not None and index.ready
+    if conversation_id is not None:
+        await _members(repos, user.id, conversation_id)
+        allowed = {conversation_id}
+    else:
+        groups = await get_participants().groups_of(repos, user.id)
+        # the index knows every DM that has messages, which is all a search can match
+        dms = index.dm_conversations(user.id) if ready else await repos.conversations.dm_ids_for(user.id)
+        allowed = {*dms, *groups}
+
+    if not ready:
+        if cursor is not None or not allowed:
+            return {"items": [], "next_cursor": None}
+        terms = tokenize(q)
+        items = []
+        for row in await repos.messages.search_body(allowed, q, limit):
+            text, highlights = snippet(row["body"], terms)
+            items.append({**row, "snippet": text, "highlights": highlights})
+        return {"items": items, "next_cursor": None}
+
+    position = None
+    if cursor is not None:
+        try:
+            position = decode_cursor(cursor, 3)
+            float(position[0]), int(position[1]), bytes.fromhex(position[2])
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    with span("message_search"):
+        items, next_key = index.search(q, allowed, limit, position)
+    return {"items": items, "next_cursor": encode_cursor(*next_key) if next_key else None}
 
 @router.get("/history/{other_user_id}", response_model=list[MessageOut])
-def history(
+async def history(
     other_user_id: str,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=200),
     before: str | None = Query(None, description="ISO timestamp to paginate back"),
     user=Depends(get_current_user),
-    supabase: Client = Depends(get_supabase),
+    repos: Repositories = Depends(get_repositories),
 ):
-    # two-way convo
-    filter_pair = f"and(sender_id.eq.{user.id},receiver_id.eq.{other_user_id})"
-    filter_pair_rev = f"and(sender_id.eq.{other_user_id},receiver_id.eq.{user.id})"
-    q = supabase.table("messages").select("*").or_(f"{filter_pair},{filter_pair_rev}").order("created_at", desc=True).limit(limit)
-    if before:
-        q = q.lt("created_at", before)
-    res = q.execute()
-    data = res.data or []
-    # newest first; frontend can reverse
-    return data
+    # two-way convo, newest first; frontend can reverse
+    conversation_id = get_conversation_resolver().peek(user.id, other_user_id)
+    if conversation_id and before is None:
+        rows = await get_message_cache().history(repos, conversation_id, limit)
+    else:
+        rows = await repos.messages.history_between(user.id, other_user_id, limit, before)
+    return rows_response(rows, MESSAGE_ROWS) if get_settings().fast_responses else rows
 
 @router.post("/read/{message_id}")
-def mark_read(message_id: str, user=Depends(get_current_user), supabase: Client = Depends(get_supabase)):
+async def mark_read(message_id: str, user=Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
     # only receiver can update read_at (policy)
-    res = (
-        supabase.table("messages")
-        .update({"read": True})
-        .eq("id", message_id)
-        .eq("receiver_id", user.id)  # only receiver can mark as read
-        .execute()
-    )
-
-    if not res.data:  # instead of checking res.error
+    message = await repos.messages.mark_read(message_id, user.id)
+
+    if not message:  # instead of checking res.error
         raise HTTPException(status_code=404, detail="Message not found or not yours")
 
-    return {"status": "success", "message": res.data[0]}
+    return {"status": "success", "message": message}
+
+# Read state is one "read up to" pointer per (conversation, user) rather than a
+# flag per message: opening a conversation is one write however much is unread.
+@router.post("/{conversation_id}/read", response_model=ReadPointerOut)
+async def read_up_to(conversation_id: str,
+            payload: ReadPointerIn,
+            user=Depends(get_current_user),
+            repos: Repositories = Depends(get_repositories)):
+
+    message_id = payload.last_read_message_id
+    # just-sent messages may not have reached the database yet
+    message = get_message_cache().find(conversation_id, message_id) or await repos.messages.get(message_id)
+    if not message or message.get("conversation_id") != conversation_id:
+        raise HTTPException(status_code=404, detail="Message not found in this conversation")
+    group = message.get("receiver_id") is None
+    if group:
+        if conversation_id not in await get_participants().groups_of(repos, user.id):
+            raise HTTPException(status_code=404, detail="Message not found in this conversation")
+    elif user.id not in (message["sender_id"], message["receiver_id"]):
+        raise HTTPException(status_code=404, detail="Message not found in this conversation")
+
+    pointer = {
+        "conversation_id": conversation_id,
+        "user_id": user.id,
+        "last_read_message_id": message["id"],
+        "last_read_at": message["created_at"],
+    }
+    current = await repos.conversations.get_read_pointer(conversation_id, user.id)
+    if current and current.get("last_read_at") and \
+            (current["last_read_at"], current["last_read_message_id"]) >= (pointer["last_read_at"], pointer["last_read_message_id"]):
+        return current  # pointers only move forward
+
+    await repos.conversations.set_read_pointer(pointer)
+    cursor = (pointer["last_read_at"], pointer["last_read_message_id"])
+    await get_inbox().record_read(pointer, get_message_cache().count_unread(conversation_id, user.id, cursor))
+
+    # one receipt for the whole range; the reader's other devices sync off it too.
+    # Group receipts stay with the reader: per-member receipts would be a
+    # fan-out per member per read.
+    recipients = [user.id]
+    if not group:
+        recipients.insert(0, message["receiver_id"] if message["sender_id"] == user.id else message["sender_id"])
+    await broadcast_to_users(recipients, {"type": "read", **pointer})
+    return pointer
+
+@router.get("/{conversation_id}/unread", response_model=UnreadOut)
+async def unread_count(conversation_id: str,
+            user=Depends(get_current_user),
+            repos: Repositories = Depends(get_repositories)):
+
+    await _members(repos, user.id, conversation_id)
+    pointer = await repos.conversations.get_read_pointer(conversation_id, user.id)
+    cursor = None
+    if pointer and pointer.get("last_read_at"):
+        cursor = (pointer["last_read_at"], pointer["last_read_message_id"])
+    unread = get_message_cache().count_unread(conversation_id, user.id, cursor)
+    if unread is None:
+        unread = await repos.messages.count_unread(conversation_id, user.id, cursor)
+    return {
+        "conversation_id": conversation_id,
+        "unread": unread,
+        "last_read_message_id": pointer.get("last_read_message_id") if pointer else None,
+    }
 
 
 @router.get("/{conversation_id}/history", response_model=list[MessageOut])
-def history(conversation_id: str,
-            limit: int = 50,
+async def history(conversation_id: str,
+            limit: int = Query(50, ge=1, le=200),
             before: str | None = Query(None, description="ISO timestamp to page back"),
-            supabase: Client = Depends(get_supabase),
+            repos: Repositories = Depends(get_repositories),
             user=Depends(get_current_user)):
 
-    q = (supabase.table("messages")
-        .select("*")
-        .eq("conversation_id", conversation_id)
-        .order("created_at", desc=True)
-        .limit(limit))
+    await _members(repos, user.id, conversation_id)
+    rows = await get_message_cache().history(repos, conversation_id, limit, before)
+    return rows_response(rows, MESSAGE_ROWS) if get_settings().fast_responses else rows
+
+
+# Keyset pagination on (created_at, id) with opaque cursors.
+#   direction=older: newest first, walking back from the cursor (or from the latest)
+#   direction=newer: oldest first after the cursor - a reconnecting client passes
+#   the cursor of the last message it has and gets only what it missed
+@router.get("/{conversation_id}/history/page", response_model=MessagePage)
+async def history_page(conversation_id: str,
+            cursor: str | None = None,
+            direction: Direction = "older",
+            limit: int = Query(50, ge=1, le=200),
+            repos: Repositories = Depends(get_repositories),
+            user=Depends(get_current_user)):
+
+    await _members(repos, user.id, conversation_id)
+    rows = await get_message_cache().page(repos, conversation_id, limit, _parse_cursor(cursor), newer=direction == "newer")
+    return _page(rows, limit, cursor)
+
+@router.get("/history/{other_user_id}/page", response_model=MessagePage)
+async def history_page_between(
+    other_user_id: str,
+    cursor: str | None = None,
+    direction: Direction = "older",
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+):
+    conversation_id = get_conversation_resolver().peek(user.id, other_user_id)
+    if conversation_id:
+        rows = await get_message_cache().page(repos, conversation_id, limit, _parse_cursor(cursor), newer=direction == "newer")
+    else:
+        rows = await repos.messages.page_between(user.id, other_user_id, limit, _parse_cursor(cursor), newer=direction == "newer")
+    return _page(rows, limit, cursor)
+
+# Whole-conversation export as NDJSON (one MessageOut per line, oldest first),
+# optionally gzipped. Streamed a keyset batch at a time, so memory stays flat
+# however long the history is, and the worker serves other requests between
+# batches.
+@router.get("/{conversation_id}/export")
+async def export_conversation(conversation_id: str,
+            compression: Compression = "none",
+            user=Depends(get_current_user),
+            repos: Repositories = Depends(get_repositories)):
+
+    await _members(repos, user.id, conversation_id)
+
+    batch_size = get_settings().export_batch_size
+
+    async def lines():
+        cursor = None
+        while True:
+            rows = await repos.messages.page(conversation_id, batch_size, cursor, newer=True)
+            batch = rows[:batch_size]
+            if batch:
+                yield b"".join(orjson.dumps({k: r.get(k) for k in EXPORT_FIELDS}) + b"\n" for r in batch)
+                cursor = (batch[-1]["created_at"], batch[-1]["id"])
+            if len(rows) <= batch_size:
+                break
+        # socket messages still in the write-behind queue
+        pending = sorted((r for r in get_ingest().pending(conversation_id)
+                          if cursor is None or (r["created_at"], r["id"]) > cursor),
+                         key=lambda r: (r["created_at"], r["id"]))
+        if pending:
+            yield b"".join(orjson.dumps({k: r.get(k) for k in EXPORT_FIELDS}) + b"\n" for r in pending)
+
+    filename = f"conversation-{conversation_id}.ndjson"
+    if compression == "gzip":
+        body, media_type, filename = gzip_chunks(lines(), get_settings().export_gzip_level), "application/gzip", filename + ".gz"
+    else:
+        body, media_type = lines(), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def _timestamp(value) -> str:
+    parsed = parse_timestamp(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+def _import_row(line: bytes, conversation_id: str, group: bool, members: dict[str, str], user_id: str,
+                migrate: bool = False) -> dict:
+    """A messages row from one NDJSON line (an export line, or at least a body); ValueError if invalid."""
+    try:
+        data = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raise ValueError("not valid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    body = data.get("body")
+    if not isinstance(body, str) or not body:
+        raise ValueError("body must be a non-empty string")
+    sender_id = data.get("sender_id") or user_id
+    # your own messages; an admin migrating a group may bring in the other members' too
+    if sender_id != user_id and not (migrate and sender_id in members):
+        raise ValueError("sender_id must be you" + (" (admins may import members' messages with migrate=true)" if group else ""))
+    receiver_id = None if group else next(m for m in members if m != sender_id)
+    # read state belongs to whoever received the message
+    if receiver_id != user_id and (data.get("read") is True or data.get("read_at")):
+        raise ValueError("read / read_at can only be set on messages you received")
+    try:
+        row = {
+            "id": str(uuid.UUID(data["id"])) if data.get("id") else str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "body": body,
+            "created_at": _timestamp(data["created_at"]) if data.get("created_at") else datetime.now(timezone.utc).isoformat(),
+        }
+        if data.get("read_at"):
+            row["read_at"] = _timestamp(data["read_at"])
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("id must be a UUID and created_at / read_at ISO 8601 timestamps")
+    if isinstance(data.get("read"), bool):
+        row["read"] = data["read"]
+    return row
+
+# Bulk import of an NDJSON stream (e.g. an export, gzipped with
+# Content-Encoding: gzip) into a conversation, in batched inserts as the body
+# arrives. Rows keep their ids, so re-running an import skips what is already
+# stored; invalid lines are skipped and reported. Lines must be the caller's
+# own messages, unless a group admin passes migrate=true to bring in the
+# other members' history too.
+@router.post("/{conversation_id}/import", response_model=ImportResult)
+async def import_conversation(conversation_id: str,
+            request: Request,
+            migrate: bool = Query(False, description="group admins: also import other members' messages"),
+            user=Depends(get_current_user),
+            repos: Repositories = Depends(get_repositories)):
 
-    if before:
-        q = q.lt("created_at", before)
+    group, members = await _members(repos, user.id, conversation_id)
+    if migrate and not (group and members.get(user.id) == ADMIN):
+        raise HTTPException(status_code=403, detail="Only group admins can import other members' messages")
+    result = {"imported": 0, "duplicates": 0, "skipped": 0, "errors": []}
+    batch: list[dict] = []
 
-    res = q.execute()
-    return res.data or []
+    async def store() -> None:
+        stored = await repos.messages.insert_many(batch)
+        result["imported"] += len(stored)
+        result["duplicates"] += len(batch) - len(stored)
+        if stored:
+            await index_messages(stored)
+        batch.clear()
 
+    settings = get_settings()
+    compressed = request.headers.get("content-encoding", "").lower() in ("gzip", "deflate")
+    try:
+        async for number, line in iter_lines(request.stream(), settings.import_max_line_bytes, compressed):
+            try:
+                batch.append(_import_row(line, conversation_id, group, members, user.id, migrate))
+            except ValueError as e:
+                result["skipped"] += 1
+                if len(result["errors"]) < MAX_IMPORT_ERRORS:
+                    result["errors"].append({"line": number, "detail": str(e)})
+                continue
+            if len(batch) >= settings.import_batch_size:
+                await store()
+        if batch:
+            await store()
+    except LineTooLong as e:
+        raise HTTPException(status_code=413, detail=f"{e}; {result['imported']} rows were imported before it")
+    except zlib.error:
+        raise HTTPException(status_code=400, detail=f"Invalid compressed body; {result['imported']} rows were imported before it")
+    finally:
+        # whatever made it in, even if the stream broke off
+        if result["imported"]:
+            await get_message_cache().forget(conversation_id)
+    return result
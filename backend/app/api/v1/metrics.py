@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.core.config import get_settings
+from app.core.conversation_cache import get_conversation_resolver
+from app.core.inbox import get_inbox
+from app.core.message_cache import get_message_cache
+from app.core.metrics import REGISTRY, Callback
+from app.core.participants import get_participants
+from app.core.profile_loader import get_profile_cache
+
+router = APIRouter(tags=["metrics"])
+
+def _cache_counts() -> dict[str, tuple[int, int]]:
+    resolver, messages = get_conversation_resolver(), get_message_cache()
+    counts = {
+        "conversations": (resolver.hits, resolver.misses),
+        "messages": (messages.hits, messages.misses),
+    }
+    counts.update(get_profile_cache().cache_counts())
+    counts.update(get_inbox().cache_counts())
+    counts.update(get_participants().cache_counts())
+    return counts
+
+# hit rate = hits / (hits + misses), e.g. rate(cache_hits_total[5m]) / rate(cache_requests_total[5m])
+Callback("cache_hits_total", "Cache hits", lambda: {(name,): h for name, (h, _) in _cache_counts().items()},
+         labels=("cache",), kind="counter")
+Callback("cache_requests_total", "Cache lookups", lambda: {(name,): h + m for name, (h, m) in _cache_counts().items()},
+         labels=("cache",), kind="counter")
+Callback("message_cache_bytes", "Bytes held by the hot-conversation message cache",
+         lambda: get_message_cache().stats()["bytes"])
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics(authorization: str | None = Header(None)):
+    token = get_settings().metrics_token
+    if token and authorization != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.core.presence import get_presence, visible_to
+from app.core.repositories import Repositories, get_repositories
+from app.core.security import get_current_user
+from app.schemas.presence import PresenceOut
+
+router = APIRouter(prefix="/presence", tags=["presence"])
+
+# ids per lookup; an inbox page is at most 100 conversations
+MAX_LOOKUP = 200
+
+@router.get("", response_model=list[PresenceOut])
+async def lookup_presence(
+    ids: list[str] = Query(..., description="repeat for each user: ?ids=a&ids=b"),
+    user=Depends(get_current_user),
+    repos: Repositories = Depends(get_repositories),
+):
+    # one round trip for every user on an inbox page; users who aren't
+    # connected to the caller or in a conversation with them are left out
+    if len(ids) > MAX_LOOKUP:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP} ids")
+    visible = await visible_to(repos, user.id, ids)
+    return await get_presence().lookup([i for i in ids if i in visible])
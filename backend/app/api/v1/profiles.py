@@ -1,82 +1,114 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from supabase import Client
-from app.core.supabase_client import get_supabase
+from app.core.config import get_settings
+from app.core.fast_json import RowType, rows_response
+from app.core.pagination import decode_cursor, encode_cursor
+from app.core.profile_loader import get_profile_cache
+from app.core.repositories import Repositories, get_repositories
 from app.core.security import get_current_user
-from app.schemas.profiles import ProfileCreate, ProfileUpdate, ProfileOut
-from sqlalchemy.orm import Session
+from app.core.user_search import get_user_search
+from app.schemas.profiles import ProfileCreate, ProfileUpdate, ProfileOut, ProfileSearchPage
 
 router = APIRouter(prefix="/profiles", tags=["profiles"])
 
+PROFILE_ROWS = RowType(ProfileOut)
+
+async def _profile_changed(profile: dict) -> None:
+    # keep derived copies (brief cache, search index) in step with the row
+    await get_profile_cache().invalidate(profile["id"])
+    index = get_user_search()
+    if index is not None:
+        await index.record(profile)
+
 @router.post("", response_model=ProfileOut)
-def create_profile(payload: ProfileCreate, user=Depends(get_current_user), supabase: Client = Depends(get_supabase)):
+async def create_profile(payload: ProfileCreate, user=Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
     data = {"id": user.id, **payload.model_dump()}
     # Check if profile already exists
-    existing = supabase.table("profiles").select("id").eq("id", user.id).execute()
-    if existing.data:
+    if await repos.profiles.exists(user.id):
         raise HTTPException(status_code=400, detail="Profile already exists")
-    res = supabase.table("profiles").insert(data).execute()
-    if not res.data:
+    profile = await repos.profiles.insert(data)
+    if not profile:
         raise HTTPException(status_code=400, detail="Failed to create profile")
-    return res.data[0]
+    await _profile_changed(profile)
+    return profile
 
 @router.get("/me", response_model=ProfileOut)
-def get_me(user=Depends(get_current_user), supabase: Client = Depends(get_supabase)):
-    res = supabase.table("profiles").select("*").eq("id", user.id).single().execute()
-    if not res.data:
+async def get_me(user=Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
+    profile = await repos.profiles.get(user.id)
+    if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return res.data
+    return profile
 
 @router.post("", response_model=ProfileOut)
-def create_or_replace_profile(payload: ProfileCreate, user=Depends(get_current_user), supabase: Client = Depends(get_supabase)):
+async def create_or_replace_profile(payload: ProfileCreate, user=Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
     data = {"id": user.id, **payload.model_dump()}
-    res = supabase.table("profiles").upsert(data, on_conflict="id").select("*").single().execute()
-    return res.data
+    profile = await repos.profiles.upsert(data)
+    if profile:
+        await _profile_changed(profile)
+    return profile
 
 @router.patch("/me", response_model=ProfileOut)
-def update_me(payload: ProfileUpdate, user=Depends(get_current_user), supabase: Client = Depends(get_supabase)):
+async def update_me(payload: ProfileUpdate, user=Depends(get_current_user), repos: Repositories = Depends(get_repositories)):
     updates = payload.model_dump(exclude_unset=True)
 
     if not updates:
         raise HTTPException(status_code=400, detail="No updates provided")
 
-    res = (
-        supabase.table("profiles")
-        .update(updates)
-        .eq("id", user.id)
-        .execute()
-    )
+    profile = await repos.profiles.update(user.id, updates)
 
-    if not res.data:
+    if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
 
-    return res.data[0]  # updated profile row
+    await _profile_changed(profile)
+    return profile  # updated profile row
 
 @router.get("/search", response_model=list[ProfileOut])
-def search_users(
+async def search_users(
     q: str = Query(..., description="username or user_id"),
     limit: int = 20,
-    supabase: Client = Depends(get_supabase),
+    repos: Repositories = Depends(get_repositories),
 ):
     # if looks like UUID, search by id; else by username ilike
     import re
     is_uuid = bool(re.fullmatch(r"[0-9a-fA-F-]{36}", q))
     if is_uuid:
-        res = supabase.table("profiles").select("*").eq("id", q).limit(1).execute()
-        return res.data or []
+        profile = await get_profile_cache().get(repos, q)
+        profiles = [profile] if profile else []
     else:
-        res = supabase.table("profiles").select("*").ilike("username", f"%{q}%").limit(limit).execute()
-        return res.data or []
+        index = get_user_search()
+        if index is not None and index.ready:
+            profiles = await get_profile_cache().get_rows(repos, index.search(q, limit)[0])
+        else:
+            profiles = await get_profile_cache().search(repos, q, limit)
+    return rows_response(profiles, PROFILE_ROWS) if get_settings().fast_responses else profiles
+
+@router.get("/search/page", response_model=ProfileSearchPage)
+async def search_users_page(
+    q: str = Query(..., min_length=1),
+    cursor: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    repos: Repositories = Depends(get_repositories),
+):
+    # ranked exact -> prefix -> fuzzy; next_cursor continues where this page ended
+    index = get_user_search()
+    if index is None or not index.ready:
+        # database fallback while the index loads: first page only
+        return {"items": await get_profile_cache().search(repos, q, limit), "next_cursor": None}
+    try:
+        user_ids, next_key = index.search(q, limit, decode_cursor(cursor, 4) if cursor else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    items = await get_profile_cache().get_rows(repos, user_ids)
+    return {"items": items, "next_cursor": encode_cursor(*next_key) if next_key else None}
     
 @router.get("/by-id/{user_id}")
-def get_profile_by_id(user_id: str, supabase: Client = Depends(get_supabase)):
-    # Query the 'profiles' table in Supabase for this user
-    res = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
+async def get_profile_by_id(user_id: str, repos: Repositories = Depends(get_repositories)):
+    # Query the 'profiles' table in Supabase for this user (coalesced + cached)
+    profile = await get_profile_cache().get(repos, user_id)
     
-    if not res.data:
+    if not profile:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Return minimal safe data
-    profile = res.data
     return {
         "id": profile["id"],
         "username": profile.get("username"),
@@ -1,50 +1,391 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
-import json
-from app.core.supabase_client import get_supabase
+import asyncio
+import logging
+import time
+import uuid
+from functools import lru_cache
+import orjson
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from typing import Dict, Iterable, List
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.core.conversation_cache import get_conversation_resolver
+from app.core.events import get_event_log, with_seq
+from app.core.ingest import get_ingest
+from app.core.message_events import get_message_events
+from app.core.metrics import FANOUT_SIZE, Callback, span
+from app.core.participants import get_participants
+from app.core.presence import ONLINE, AWAY, get_presence, visible_to
+from app.core.pubsub import get_pubsub, user_channel, channel_user
+from app.core.ratelimit import TokenBucket
+from app.core.repositories import get_repositories
+from app.core.security import AuthUser, authenticate
+from app.core.sockets import SocketConnection
+from app.core.wire import Frame, decode_frame, encode_event, negotiate
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ws", tags=["websocket"])
 
-# Dictionary of active connections per user
-active_connections: Dict[str, List[WebSocket]] = {}
+# columns a client may set on a message sent over the socket: receiver_id for
+# a DM (its conversation is resolved server-side) or a group's conversation_id;
+# the sender is always the authenticated user
+MESSAGE_FIELDS = ("receiver_id", "conversation_id", "body")
+
+# large broadcasts: one message to every worker holding sockets, carrying the
+# recipients and their seqs, instead of one publish per user channel
+FANOUT_CHANNEL = "chat:fanout"
+
+# close codes: 1008 policy violation, 1009 frame too big, 1013 try again later
+CLOSE_POLICY = 1008
+CLOSE_TOO_BIG = 1009
+CLOSE_TRY_LATER = 1013
+# 1001 "going away": nothing heard from the client within WS_IDLE_TIMEOUT
+CLOSE_IDLE = 1001
+
+PING = Frame(encode_event({"type": "ping"}))
+PONG = Frame(encode_event({"type": "pong"}))
+
+class FrameTooLarge(Exception):
+    pass
+
+class InvalidFrame(Exception):
+    pass
+
+@lru_cache(maxsize=1)
+def _connect_buckets() -> TTLCache:
+    # user -> connection-attempt bucket
+    settings = get_settings()
+    return TTLCache(maxsize=100_000, ttl=max(60.0, settings.ws_connect_burst / settings.ws_connect_rate))
 
-async def connect_user(user_id: str, websocket: WebSocket):
-    await websocket.accept()
-    active_connections.setdefault(user_id, []).append(websocket)
-    print(f"✅ Connected: {user_id}")
+# Dictionary of active connections per user (sockets held by this worker only)
+active_connections: Dict[str, List[SocketConnection]] = {}
 
-def remove_user(user_id: str, websocket: WebSocket):
-    active_connections[user_id].remove(websocket)
-    if not active_connections[user_id]:
+def _sockets() -> list[SocketConnection]:
+    return [c for conns in active_connections.values() for c in conns]
+
+# read at scrape time only
+Callback("ws_connected_users", "Users with a socket on this worker", lambda: len(active_connections))
+Callback("ws_connections", "Open sockets on this worker", lambda: sum(len(c) for c in active_connections.values()))
+Callback("ws_send_queue_depth", "Outbound frames queued across sockets", lambda: sum(c.depth for c in _sockets()))
+Callback("ws_send_queue_depth_max", "Deepest outbound queue", lambda: max((c.depth for c in _sockets()), default=0))
+
+async def _on_published(channel: str, payload: bytes):
+    await deliver_local(channel_user(channel), payload)
+
+async def _on_fanout(channel: str, data: bytes):
+    # "<header json>\n<event json>"; deliver to the recipients this worker holds
+    header, _, payload = data.partition(b"\n")
+    header = orjson.loads(header)
+    seqs = header["seqs"]
+    frame = None
+    for i, user_id in enumerate(header["users"]):
+        conns = active_connections.get(user_id)
+        if not conns:
+            continue
+        if seqs:
+            user_frame = Frame(with_seq(seqs[i], payload))
+        else:
+            user_frame = frame = frame or Frame(payload)
+        for conn in conns:
+            conn.send(user_frame)
+
+async def _on_dead(conn: SocketConnection):
+    await remove_user(conn.user_id, conn)
+
+async def connect_user(user_id: str, websocket: WebSocket, hold: bool = False) -> SocketConnection:
+    wire_format, subprotocol = negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    conn = SocketConnection(user_id, websocket, on_dead=_on_dead, wire_format=wire_format)
+    conn.start()
+    if hold:
+        conn.hold()  # live events wait until the replay is queued
+    pubsub = get_pubsub()
+    if not active_connections:
+        # only workers holding sockets need group fan-out
+        pubsub.set_handler(_on_fanout, prefix=FANOUT_CHANNEL)
+        await pubsub.subscribe(FANOUT_CHANNEL)
+    first = user_id not in active_connections
+    active_connections.setdefault(user_id, []).append(conn)
+    if first:
+        pubsub.set_handler(_on_published)
+        await pubsub.subscribe(user_channel(user_id))
+    await get_presence().update(user_id, local_status(user_id))
+    logger.debug("connected: %s", user_id)
+    return conn
+
+async def remove_user(user_id: str, conn: SocketConnection):
+    conn.close()
+    get_presence().unwatch(conn)
+    conns = active_connections.get(user_id)
+    # may already be gone: the writer prunes sockets whose sends fail
+    if not conns or conn not in conns:
+        return
+    conns.remove(conn)
+    if not conns:
         del active_connections[user_id]
-    print(f"❌ Disconnected: {user_id}")
+        await get_pubsub().unsubscribe(user_channel(user_id))
+        if not active_connections:
+            await get_pubsub().unsubscribe(FANOUT_CHANNEL)
+    await get_presence().update(user_id, local_status(user_id))
+    logger.debug("disconnected: %s", user_id)
+
+def local_status(user_id: str) -> str | None:
+    # the user's presence as far as this worker's sockets go
+    conns = active_connections.get(user_id)
+    if not conns:
+        return None
+    return AWAY if all(c.away for c in conns) else ONLINE
 
-async def broadcast_to_user(user_id: str, message: dict):
-    if user_id in active_connections:
-        for ws in active_connections[user_id]:
-            await ws.send_text(json.dumps(message))
+async def heartbeat(interval: float | None = None):
+    # one sweep over every socket rather than a timer each: ping the quiet
+    # ones, drop those silent past WS_IDLE_TIMEOUT (dead peers behind NATs
+    # never send a close), mark the inactive ones away
+    settings = get_settings()
+    interval = settings.ws_ping_interval if interval is None else interval
+    presence = get_presence()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        for user_id, conns in list(active_connections.items()):
+            for conn in list(conns):
+                if now - conn.last_recv >= settings.ws_idle_timeout:
+                    conn.evict(CLOSE_IDLE)
+                    continue
+                if now - conn.last_recv >= interval / 2:
+                    conn.send(PING, key="ping")
+                if now - conn.last_active >= settings.presence_away_after:
+                    conn.away = True
+            await presence.update(user_id, local_status(user_id))
+        await presence.refresh()
+
+async def deliver_local(user_id: str, payload: bytes):
+    # enqueue only; each socket's writer task does the actual send
+    frame = Frame(payload)
+    for conn in active_connections.get(user_id, []):
+        conn.send(frame)
+
+async def broadcast_to_users(user_ids: Iterable[str], message: dict, durable: bool = True):
+    # encoded once, then published to every worker; whichever holds the
+    # users' sockets delivers. Durable events get the user's next seq and go
+    # into their replay log; ephemeral ones (e.g. typing) don't.
+    with span("broadcast"):
+        payload = encode_event(message)
+        user_ids = list(dict.fromkeys(user_ids))
+        FANOUT_SIZE.observe(len(user_ids))
+        pubsub = get_pubsub()
+        seqs = await get_event_log().append_many(user_ids, payload) if durable else None
+        # the same bytes for several users go out once, so each worker builds
+        # one Frame for all of them (see _on_fanout)
+        if len(user_ids) > get_settings().fanout_min_users or (seqs is None and len(user_ids) > 1):
+            header = orjson.dumps({"users": user_ids, "seqs": seqs})
+            await pubsub.publish(FANOUT_CHANNEL, header + b"\n" + payload)
+            return
+        for i, user_id in enumerate(user_ids):
+            await pubsub.publish(user_channel(user_id), with_seq(seqs[i], payload) if durable else payload)
+
+async def broadcast_to_user(user_id: str, message: dict, durable: bool = True):
+    await broadcast_to_users([user_id], message, durable)
+
+async def resume(conn: SocketConnection, resume_from: int):
+    # replay what the client missed, or tell it to catch up over REST
+    log = get_event_log()
+    events = await log.since(conn.user_id, resume_from)
+    if events is None:
+        conn.release([Frame(encode_event({
+            "type": "resync",
+            "resume_from": resume_from,
+            "seq": await log.current(conn.user_id),
+        }))])
+        return
+    conn.release([Frame(data) for _, data in events], after_seq=events[-1][0] if events else resume_from)
+
+async def receive_message(conn: SocketConnection) -> dict:
+    frame = await conn.websocket.receive()
+    if frame["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(frame.get("code", 1000))
+    # size check before any parsing; the limit is in bytes, so text is measured as UTF-8
+    limit = get_settings().ws_max_frame_bytes
+    data = frame.get("text")
+    if data is None:
+        size = len(frame.get("bytes") or b"")
+    elif len(data) > limit or len(data) * 4 <= limit:
+        size = len(data)  # decides the same as the encoded length would
+    else:
+        size = len(data.encode())
+    if size > limit:
+        raise FrameTooLarge()
+    try:
+        msg = decode_frame(frame, conn.wire_format)
+    except (ValueError, TypeError) as e:  # bad JSON / msgpack, bad utf-8
+        raise InvalidFrame() from e
+    if not isinstance(msg, dict):
+        raise InvalidFrame()
+    return msg
+
+async def authenticate_socket(websocket: WebSocket) -> AuthUser | None:
+    # browsers can't set headers on a WebSocket, so ?token= is accepted too
+    token = websocket.query_params.get("token")
+    header = websocket.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        token = header[7:]
+    if not token:
+        return None
+    try:
+        return await authenticate(token, await get_repositories())
+    except HTTPException:
+        return None
+
+def _is_uuid(value) -> bool:
+    try:
+        uuid.UUID(value)
+    except (AttributeError, TypeError, ValueError):
+        return False
+    return True
+
+def _error(conn: SocketConnection, code: str, client_id=None):
+    conn.send(Frame(encode_event({"type": "error", "code": code, "client_id": client_id})))
+
+async def _set_away(conn: SocketConnection, away: bool):
+    if conn.away != away:
+        conn.away = away
+        await get_presence().update(conn.user_id, local_status(conn.user_id))
 
 @router.websocket("/chat/{user_id}")
-async def chat_socket(websocket: WebSocket, user_id: str):
-    await connect_user(user_id, websocket)
+async def chat_socket(websocket: WebSocket, user_id: str, resume_from: int | None = None):
+    # rejected before accept, which the client sees as a failed handshake (403)
+    user = await authenticate_socket(websocket)
+    if user is None or user.id != user_id:
+        await websocket.close(code=CLOSE_POLICY)
+        return
+    settings = get_settings()
+    bucket = _connect_buckets().get(user.id)
+    if bucket is None:
+        bucket = TokenBucket(settings.ws_connect_rate, settings.ws_connect_burst)
+        _connect_buckets().set(user.id, bucket)
+    if not bucket.allow():
+        await websocket.close(code=CLOSE_TRY_LATER)
+        return
+    if len(active_connections.get(user.id, ())) >= settings.ws_max_connections_per_user:
+        await websocket.close(code=CLOSE_POLICY)
+        return
+
+    # resume_from: the last seq the client saw before it disconnected
+    conn = await connect_user(user.id, websocket, hold=resume_from is not None)
+    frames = TokenBucket(settings.ws_frame_rate, settings.ws_frame_burst)
+    throttled = False
+    typing_sent: Dict[str, float] = {}  # receiver -> when we last relayed typing to them
     try:
+        if resume_from is not None:
+            await resume(conn, resume_from)
         while True:
-            data = await websocket.receive_text()
-            msg = json.loads(data)
+            try:
+                msg = await receive_message(conn)
+            except InvalidFrame:
+                conn.touch(active=False)
+                if frames.allow():
+                    _error(conn, "invalid_message")
+                continue
+            kind = msg.get("type", "message")
+            conn.touch(active=kind not in ("pong", "ping", "presence"))
+            if kind == "pong":
+                continue
+            if not frames.allow():
+                # drop; tell the client once per run of dropped frames
+                if not throttled:
+                    _error(conn, "rate_limited", msg.get("client_id"))
+                throttled = True
+                continue
+            throttled = False
 
-            # message: { sender_id, receiver_id, body }
-            print(f"📩 Message from {msg['sender_id']} → {msg['receiver_id']}: {msg['body']}")
+            if kind == "ping":
+                conn.send(PONG)
+                continue
+            if kind == "presence":
+                # { status: "online" | "away" }, e.g. when the tab is hidden / shown
+                if msg.get("status") in (ONLINE, AWAY):
+                    await _set_away(conn, msg["status"] == AWAY)
+                continue
+            if kind == "watch":
+                # { user_ids: [...] }: replaces the set this socket gets presence updates for
+                user_ids = msg.get("user_ids")
+                if not isinstance(user_ids, list) or not all(isinstance(u, str) for u in user_ids):
+                    _error(conn, "invalid_message", msg.get("client_id"))
+                    continue
+                # only users the socket's owner is connected to or talks with
+                presence = get_presence()
+                user_ids = list(dict.fromkeys(user_ids))[:presence.max_watch]
+                visible = await visible_to(await get_repositories(), user.id, user_ids)
+                users = await presence.watch(conn, [u for u in user_ids if u in visible])
+                conn.send(Frame(encode_event({"type": "presence", "users": users})))
+                continue
+            await _set_away(conn, False)
+            if kind == "typing":
+                # { receiver_id, conversation_id? }: relayed at most once per TYPING_INTERVAL, never logged
+                receiver_id = msg.get("receiver_id")
+                if not _is_uuid(receiver_id) or receiver_id == user.id:
+                    continue
+                now = time.monotonic()
+                if now - typing_sent.get(receiver_id, 0.0) < settings.typing_interval:
+                    continue
+                if len(typing_sent) > 100:
+                    typing_sent.clear()
+                typing_sent[receiver_id] = now
+                if receiver_id not in await visible_to(await get_repositories(), user.id, [receiver_id]):
+                    continue
+                await broadcast_to_user(receiver_id, {
+                    "type": "typing",
+                    "user_id": user.id,
+                    "conversation_id": msg.get("conversation_id") if isinstance(msg.get("conversation_id"), str) else None,
+                }, durable=False)
+                continue
 
-            # Send to receiver
-            await broadcast_to_user(msg["receiver_id"], msg)
+            # message: { receiver_id | conversation_id, body, client_id? }
+            row = {k: msg[k] for k in MESSAGE_FIELDS if k in msg}
+            if not isinstance(row.get("body"), str):
+                _error(conn, "invalid_message", msg.get("client_id"))
+                continue
+            row["sender_id"] = user.id
+            repos = await get_repositories()
+            if "receiver_id" in row:
+                # checked here: a row the database rejects would only surface in the flusher
+                if not _is_uuid(row["receiver_id"]) or row["receiver_id"] == user.id:
+                    _error(conn, "invalid_message", msg.get("client_id"))
+                    continue
+                try:
+                    row["conversation_id"] = await get_conversation_resolver().resolve(
+                        repos, row["sender_id"], row["receiver_id"]
+                    )
+                except Exception:
+                    # e.g. a receiver with no account: the conversation can't be created
+                    logger.warning("no conversation for %s -> %s", user.id, row["receiver_id"], exc_info=True)
+                    _error(conn, "invalid_message", msg.get("client_id"))
+                    continue
+                recipients = [row["receiver_id"]]
+            else:
+                # group message: the sender must be a member
+                participants = get_participants()
+                if row.get("conversation_id") not in await participants.groups_of(repos, user.id):
+                    _error(conn, "not_a_member", msg.get("client_id"))
+                    continue
+                row["receiver_id"] = None
+                members = await participants.members(repos, row["conversation_id"])
+                recipients = [m for m in members if m != user.id]
 
-            # Echo back to sender for instant appearance
-            await broadcast_to_user(msg["sender_id"], msg)
+            # journaled and queued for a batched insert; has its server id now
+            saved = await get_ingest().submit(row)
+            conn.send(Frame(encode_event({
+                "type": "ack",
+                "client_id": msg.get("client_id"),
+                "id": saved["id"],
+                "created_at": saved["created_at"],
+            })))
+            await get_message_events().record(saved, recipients)
 
-            # Optional: store message in Supabase
-            supabase = get_supabase()
-            supabase.table("messages").insert(msg).execute()
-            # You can later use your existing insert logic from messages.py
+            # Send to the recipients, and echo back to sender for instant appearance
+            await broadcast_to_users(recipients + [user.id], saved)
     except WebSocketDisconnect:
-        remove_user(user_id, websocket)
-
+        pass
+    except FrameTooLarge:
+        await conn.websocket.close(code=CLOSE_TOO_BIG)
+    finally:
+        await remove_user(user.id, conn)
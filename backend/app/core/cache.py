@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from app.core.config import get_settings
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a time-to-live."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one in-flight call.
+
+    The call runs as its own task, so a caller that is cancelled (e.g. its
+    client went away) doesn't cancel it for the others waiting on it.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class CoalescingCache:
+    """Read-through TTL cache whose misses go through a SingleFlight, so a burst
+    of identical reads costs one backend call."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.hits = 0
+        self.misses = 0
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight = SingleFlight()
+        # loads that straddle an invalidation of their key (or a clear) aren't
+        # cached; tracked per key, only while that key's load is in flight
+        self._loading: dict[Hashable, bool] = {}  # key -> invalidated since its load began
+        self._epoch = 0  # bumped by clear()
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        return self._cache.get(key, default)
+
+    async def get(self, key: Hashable, load: Callable[[], Awaitable[Any]], ttl: Callable[[Any], float | None] | None = None) -> Any:
+        """Cached value for key, else load() once for everyone asking; `ttl`
+        may pick a per-value lifetime (e.g. shorter for misses)."""
+        value = self._cache.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return await self._flight.do(key, lambda: self._load(key, load, ttl))
+
+    async def _load(self, key, load, ttl):
+        epoch = self._epoch
+        self._loading[key] = False  # the SingleFlight runs one load per key at a time
+        try:
+            value = await load()
+        finally:
+            invalidated = self._loading.pop(key)
+        if not invalidated and epoch == self._epoch:
+            self._cache.set(key, value, ttl=ttl(value) if ttl else None)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        self._cache.set(key, value, ttl=ttl)
+
+    def pop(self, key: Hashable) -> None:
+        if key in self._loading:
+            self._loading[key] = True
+        self._cache.pop(key)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._cache.clear()
+
+
+_redis = None
+
+
+def get_redis():
+    """Shared redis.asyncio client for caches with a cross-worker backend."""
+    global _redis
+    if _redis is None:
+        import redis.asyncio as redis  # optional dependency
+        _redis = redis.from_url(get_settings().redis_url)
+    return _redis
@@ -1,7 +1,230 @@
+import dataclasses
 import os
-from dotenv import load_dotenv
-load_dotenv()
+import types
+from typing import Mapping
 
-SUPABASE_URL = os.environ["SUPABASE_URL"]
-SUPABASE_ANON_KEY = os.environ["SUPABASE_ANON_KEY"]
-SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+
+class ConfigError(RuntimeError):
+    pass
+
+
+_BOOLEANS = {"1": True, "true": True, "yes": True, "on": True, "0": False, "false": False, "no": False, "off": False}
+
+
+def _setting(default=dataclasses.MISSING, *, positive: bool = False, minimum=0, maximum=None, choices=()):
+    """A Settings field read from the environment variable of the same name, upper-cased.
+
+    Numbers must be at least `minimum` (or above zero when `positive`) and at
+    most `maximum`; strings with `choices` must be one of them. Fields without
+    a default are required.
+    """
+    return dataclasses.field(default=default, metadata={
+        "positive": positive, "minimum": minimum, "maximum": maximum, "choices": choices,
+    })
+
+
+@dataclasses.dataclass(frozen=True)
+class Settings:
+    supabase_url: str = _setting()
+    supabase_anon_key: str = _setting()
+    supabase_service_role_key: str = _setting()
+
+    # Local JWT verification (see app/core/security.py). HS256 projects need the
+    # JWT secret; projects on asymmetric signing keys are verified against JWKS.
+    supabase_jwt_secret: str | None = _setting(None)
+    supabase_jwt_audience: str = _setting("authenticated")
+    auth_local_verify: bool = _setting(True)
+    auth_cache_ttl: float = _setting(300)
+    auth_cache_size: int = _setting(10000, positive=True)
+    jwks_cache_ttl: float = _setting(600)
+
+    # Pooled keep-alive HTTP connections shared by the async data-access layer
+    db_pool_size: int = _setting(50, positive=True)
+    db_keepalive_expiry: float = _setting(30)
+    db_timeout: float = _setting(10, positive=True)
+
+    # Cross-worker WebSocket fan-out: "memory" (single process) or "redis"
+    pubsub_backend: str = _setting("memory", choices=("memory", "redis"))
+    redis_url: str = _setting("redis://localhost:6379/0")
+
+    # Per-socket outbound queues (see app/core/sockets.py)
+    ws_send_queue_size: int = _setting(256, positive=True)
+    ws_slow_consumer_policy: str = _setting("drop", choices=("drop", "coalesce", "disconnect"))
+    ws_send_timeout: float = _setting(10, positive=True)
+
+    # Write-behind ingest of WebSocket messages (see app/core/ingest.py)
+    ingest_batch_size: int = _setting(200, positive=True)
+    ingest_flush_interval: float = _setting(0.05)
+    ingest_max_pending: int = _setting(10000, positive=True)
+    ingest_journal_dir: str = _setting(".ingest-journal")
+    ingest_journal_fsync: bool = _setting(False)
+
+    # user pair -> conversation_id cache for send_message; "redis" shares it across workers
+    conversation_cache_size: int = _setting(100000, positive=True)
+    conversation_cache_ttl: float = _setting(86400)
+    conversation_cache_backend: str = _setting("memory", choices=("memory", "redis"))
+
+    # Hot-conversation message cache (see app/core/message_cache.py)
+    message_cache_ring_size: int = _setting(200, positive=True)
+    message_cache_max_bytes: int = _setting(64 * 1024 * 1024, positive=True)
+    message_cache_ttl: float = _setting(600)
+
+    # ProfileBrief cache behind connection enrichment (see app/core/profile_loader.py)
+    profile_cache_size: int = _setting(100000, positive=True)
+    profile_cache_ttl: float = _setting(600)
+    profile_cache_miss_ttl: float = _setting(30)
+    # short-lived database search results; identical concurrent searches share one query
+    profile_search_cache_size: int = _setting(10000, positive=True)
+    profile_search_cache_ttl: float = _setting(10)
+
+    # In-memory user search index (see app/core/user_search.py)
+    user_search_index: bool = _setting(True)
+    user_search_fuzzy_threshold: float = _setting(0.3, maximum=1)
+    user_search_max_scan: int = _setting(20000, positive=True)
+    user_search_load_batch: int = _setting(1000, positive=True)
+
+    # Inbox unread counters (see app/core/inbox.py)
+    inbox_unread_cache_size: int = _setting(200000, positive=True)
+    inbox_unread_cache_ttl: float = _setting(3600)
+
+    # Per-user event sequence + replay log for resuming sockets (see app/core/events.py);
+    # shared through Redis when PUBSUB_BACKEND is "redis"
+    event_log_size: int = _setting(1000, positive=True)
+    event_log_ttl: float = _setting(86400)
+    event_log_users: int = _setting(100000, positive=True)
+    # payload bytes the in-process log keeps across all users
+    event_log_max_bytes: int = _setting(256 * 1024 * 1024, positive=True)
+
+    # /ws/chat limits: inbound frame size and rate per socket, sockets and
+    # connection attempts per user (per worker)
+    ws_max_frame_bytes: int = _setting(16384, positive=True)
+    ws_frame_rate: float = _setting(20, positive=True)
+    ws_frame_burst: float = _setting(40, positive=True)
+    ws_max_connections_per_user: int = _setting(10, positive=True)
+    ws_connect_rate: float = _setting(1, positive=True)
+    ws_connect_burst: float = _setting(10, positive=True)
+
+    # /ws/chat heartbeats: the server pings sockets quiet for WS_PING_INTERVAL
+    # seconds and drops those that have sent nothing for WS_IDLE_TIMEOUT
+    ws_ping_interval: float = _setting(25, positive=True)
+    ws_idle_timeout: float = _setting(60, positive=True)
+
+    # Presence (see app/core/presence.py); shared through Redis when PUBSUB_BACKEND is "redis"
+    presence_away_after: float = _setting(300)
+    presence_flush_interval: float = _setting(1, positive=True)
+    presence_min_interval: float = _setting(5)
+    presence_max_watch: int = _setting(500, positive=True)
+    presence_last_seen_ttl: float = _setting(30 * 86400)
+    presence_users: int = _setting(1000000, positive=True)
+    typing_interval: float = _setting(3)
+
+    # Group conversations (see app/core/participants.py)
+    group_max_members: int = _setting(5000, positive=True)
+    participant_cache_size: int = _setting(50000, positive=True)
+    participant_cache_ttl: float = _setting(600)
+    # broadcasts to more users than this go out as one message to every worker
+    # instead of one per user channel
+    fanout_min_users: int = _setting(8)
+
+    # Prometheus-style metrics at /metrics (see app/core/metrics.py); when
+    # METRICS_TOKEN is set, scrapes must send it as a bearer token
+    metrics_enabled: bool = _setting(True)
+    metrics_token: str = _setting("")
+
+    # In-memory connection graph (see app/core/connection_graph.py)
+    connection_graph: bool = _setting(True)
+    connection_graph_load_batch: int = _setting(5000, positive=True)
+    # friends-of-friends edges looked at per suggestions request
+    connection_suggest_max_scan: int = _setting(10000, positive=True)
+
+    # Full-text message search (see app/core/message_search.py)
+    message_search: bool = _setting(True)
+    message_search_dir: str = _setting(".search-index")
+    # messages held in memory before they're written out as a segment file
+    message_search_segment_docs: int = _setting(50000, positive=True)
+    message_search_flush_interval: float = _setting(30, positive=True)
+    # segments of a similar size merged at once
+    message_search_merge_factor: int = _setting(10, minimum=2)
+    message_search_load_batch: int = _setting(5000, positive=True)
+
+    # NDJSON conversation export / import (see /messages/{id}/export and /import)
+    export_batch_size: int = _setting(1000, positive=True)
+    export_gzip_level: int = _setting(6, maximum=9)
+    import_batch_size: int = _setting(500, positive=True)
+    import_max_line_bytes: int = _setting(65536, positive=True)
+
+    # Encode the high-volume list endpoints (history, connections, user search)
+    # straight from rows with orjson instead of validating them through their
+    # response_model (see app/core/fast_json.py); the JSON is the same
+    fast_responses: bool = _setting(False)
+
+    # Startup warmup (see app/core/warmup.py): before a worker starts serving it
+    # builds the Supabase clients, opens pooled connections and fills the message
+    # and profile caches for the most recently active conversations. Past
+    # WARMUP_TIMEOUT it stops and serves anyway.
+    warmup: bool = _setting(True)
+    warmup_connections: int = _setting(4)
+    warmup_conversations: int = _setting(200)
+    warmup_timeout: float = _setting(10, positive=True)
+
+
+def _parse(field: dataclasses.Field, raw: str, problems: list[str]):
+    name, kind, rules = field.name.upper(), field.type, field.metadata
+    if isinstance(kind, types.UnionType):
+        kind = str
+    if kind is bool:
+        value = _BOOLEANS.get(raw.strip().lower())
+        if value is None:
+            problems.append(f"{name}={raw!r} is not a boolean (1/0, true/false, yes/no, on/off)")
+        return value
+    if kind is str:
+        if rules["choices"] and raw not in rules["choices"]:
+            problems.append(f"{name}={raw!r} is not one of {', '.join(rules['choices'])}")
+        return raw
+    try:
+        value = kind(raw)
+    except ValueError:
+        problems.append(f"{name}={raw!r} is not a valid {kind.__name__}")
+        return None
+    if rules["positive"] and not value > 0:
+        problems.append(f"{name}={raw!r} must be greater than 0")
+    elif not value >= rules["minimum"]:
+        problems.append(f"{name}={raw!r} must be at least {rules['minimum']}")
+    elif rules["maximum"] is not None and value > rules["maximum"]:
+        problems.append(f"{name}={raw!r} must be at most {rules['maximum']}")
+    return value
+
+
+def load_settings(environ: Mapping[str, str]) -> Settings:
+    """Settings from `environ`; every problem is collected and raised as one ConfigError."""
+    values, problems = {}, []
+    for field in dataclasses.fields(Settings):
+        raw = environ.get(field.name.upper())
+        if not raw:
+            if field.default is dataclasses.MISSING:
+                problems.append(f"{field.name.upper()} is not set")
+            continue
+        values[field.name] = _parse(field, raw, problems)
+    if problems:
+        raise ConfigError("invalid configuration: " + "; ".join(problems))
+    return Settings(**values)
+
+
+_settings: Settings | None = None
+
+
+def get_settings() -> Settings:
+    """The process settings, read from the environment (and .env) on first use."""
+    global _settings
+    if _settings is None:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _settings = load_settings(os.environ)
+    return _settings
+
+
+def set_settings(settings: Settings | None) -> None:
+    # lets benchmarks and tests change settings; None reads the environment again
+    global _settings
+    _settings = settings
@@ -0,0 +1,257 @@
+import asyncio
+import gc
+import heapq
+import itertools
+import logging
+from collections import Counter
+
+import orjson
+from app.core.config import get_settings
+from app.core.pubsub import get_pubsub
+from app.core.repositories import Repositories, get_repositories
+
+logger = logging.getLogger(__name__)
+
+# connection writes on any worker are applied to every worker's graph
+GRAPH_CHANNEL = "chat:connections"
+
+PENDING, ACCEPTED, REJECTED = "pending", "accepted", "rejected"
+STATUSES = (PENDING, ACCEPTED, REJECTED)
+_CODES = {status: code for code, status in enumerate(STATUSES)}
+_ACCEPTED = _CODES[ACCEPTED]
+
+# the database fallback for suggestions reads at most this many connections' edges
+MAX_FALLBACK_FRIENDS = 1000
+
+# adjacency values pack (edge << 3) | (status code << 1) | outgoing
+_OUTGOING = 1
+
+
+def _status(packed: int) -> int:
+    return (packed >> 1) & 3
+
+
+class ConnectionGraph:
+    """In-memory adjacency of the connections table behind /connections and
+    the DM request / block checks.
+
+    User ids are interned to ints and each user has one dict of
+    neighbour -> packed int holding the edge number (its connection id is
+    kept once in a list), the status and the direction. That makes "how are
+    a and b connected" a dict lookup, mutual counts an intersection walk over
+    the smaller neighbour set, and suggestions a bounded friends-of-friends
+    count. Connection lists come out in connection id order, the same keyset
+    the database fallback pages on.
+
+    Loaded in the background at startup and kept current by `record` on every
+    connection write; until it is ready callers use the database.
+    """
+
+    def __init__(self, load_batch: int | None = None, max_scan: int | None = None):
+        settings = get_settings()
+        load_batch = settings.connection_graph_load_batch if load_batch is None else load_batch
+        max_scan = settings.connection_suggest_max_scan if max_scan is None else max_scan
+        self.load_batch = load_batch
+        self.max_scan = max_scan
+        self.ready = False
+        self._ids: dict[str, int] = {}
+        self._users: list[str] = []
+        self._adj: list[dict[int, int]] = []
+        self._edges: list[str] = []
+        self._edge_of: dict[str, int] = {}
+        self._started = False
+        self._task: asyncio.Task | None = None
+
+    # --- lifecycle
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_published, prefix=GRAPH_CHANNEL)
+        await pubsub.subscribe(GRAPH_CHANNEL)
+        self._started = True
+        self._task = asyncio.create_task(self._load_all())
+
+    async def _load_all(self) -> None:
+        try:
+            repos = await get_repositories()
+            after = None
+            while True:
+                rows = await repos.connections.scan(after, self.load_batch)
+                self.load(rows)
+                if len(rows) < self.load_batch:
+                    break
+                after = rows[-1]["id"]
+        except Exception:
+            logger.exception("connection graph load failed; using the database instead")
+            return
+        self.ready = True
+        logger.info("connection graph ready (%d users, %d connections)", len(self._users), len(self._edges))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # --- writes
+
+    async def _on_published(self, channel: str, payload: bytes) -> None:
+        self.apply(orjson.loads(payload))
+
+    async def record(self, connection: dict) -> None:
+        """Call after a connection row is created or its status changes."""
+        row = {k: connection[k] for k in ("id", "requester_id", "addressee_id", "status")}
+        if self._started:
+            await get_pubsub().publish(GRAPH_CHANNEL, orjson.dumps(row))
+        else:
+            self.apply(row)
+
+    def load(self, rows: list[dict]) -> None:
+        """Bulk add; connections already present (from a live write) are newer and kept."""
+        gc_was_enabled = gc.isenabled()
+        gc.disable()  # millions of small ints and dicts: don't let the cyclic GC rescan them mid-load
+        try:
+            for row in rows:
+                if row["id"] not in self._edge_of:
+                    self.apply(row)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def apply(self, row: dict) -> None:
+        code = _CODES.get(row.get("status") or PENDING)
+        if code is None:
+            return
+        edge = self._edge_of.get(row["id"])
+        if edge is None:
+            edge = self._edge_of[row["id"]] = len(self._edges)
+            self._edges.append(row["id"])
+        a, b = self._intern(row["requester_id"]), self._intern(row["addressee_id"])
+        self._adj[a][b] = (edge << 3) | (code << 1) | _OUTGOING
+        self._adj[b][a] = (edge << 3) | (code << 1)
+
+    def _intern(self, user_id: str) -> int:
+        n = self._ids.get(user_id)
+        if n is None:
+            n = self._ids[user_id] = len(self._users)
+            self._users.append(user_id)
+            self._adj.append({})
+        return n
+
+    # --- reads
+
+    def _row(self, user: int, other: int, packed: int) -> dict:
+        requester, addressee = (user, other) if packed & _OUTGOING else (other, user)
+        return {
+            "id": self._edges[packed >> 3],
+            "requester_id": self._users[requester],
+            "addressee_id": self._users[addressee],
+            "status": STATUSES[_status(packed)],
+        }
+
+    def between(self, a: str, b: str) -> dict | None:
+        """The connection row between two users, either direction, or None."""
+        ua, ub = self._ids.get(a), self._ids.get(b)
+        if ua is None or ub is None:
+            return None
+        packed = self._adj[ua].get(ub)
+        return self._row(ua, ub, packed) if packed is not None else None
+
+    def are_connected(self, a: str, b: str) -> bool:
+        row = self.between(a, b)
+        return row is not None and row["status"] == ACCEPTED
+
+    def is_blocked(self, a: str, b: str) -> bool:
+        row = self.between(a, b)
+        return row is not None and row["status"] == REJECTED
+
+    def page(self, user_id: str, status: str | None = None, limit: int | None = None,
+             after: str | None = None) -> tuple[list[dict], str | None]:
+        """`user_id`'s connections in connection id order after the cursor `after`,
+        up to `limit` (all when None), and the cursor for the next page."""
+        u = self._ids.get(user_id)
+        if u is None:
+            return [], None
+        code = _CODES.get(status, -1) if status else None
+        edges = self._edges
+        found = []
+        for other, packed in self._adj[u].items():
+            if code is not None and _status(packed) != code:
+                continue
+            connection_id = edges[packed >> 3]
+            if after is not None and connection_id <= after:
+                continue
+            found.append((connection_id, other, packed))
+        if limit is None:
+            found.sort()
+            return [self._row(u, other, packed) for _, other, packed in found], None
+        found = heapq.nsmallest(limit + 1, found)
+        has_more = len(found) > limit
+        found = found[:limit]
+        return [self._row(u, other, packed) for _, other, packed in found], (found[-1][0] if has_more else None)
+
+    def mutual_count(self, a: str, b: str) -> int:
+        ua, ub = self._ids.get(a), self._ids.get(b)
+        if ua is None or ub is None:
+            return 0
+        small, large = sorted((self._adj[ua], self._adj[ub]), key=len)
+        count = 0
+        for other, packed in small.items():
+            if _status(packed) == _ACCEPTED:
+                theirs = large.get(other)
+                if theirs is not None and _status(theirs) == _ACCEPTED:
+                    count += 1
+        return count
+
+    def suggestions(self, user_id: str, limit: int) -> list[tuple[str, int]]:
+        """(user_id, mutual count) for people connected to `user_id`'s connections
+        but not to them in any state, most mutuals first (ties in the order they
+        were found). At most max_scan second-degree edges are counted, so very
+        connected users get an approximate ranking rather than an expensive one."""
+        u = self._ids.get(user_id)
+        if u is None:
+            return []
+        mine = self._adj[u]
+        adj = self._adj
+        # least-connected friends first: their connections say more about us than a hub's
+        friends = sorted((f for f, p in mine.items() if _status(p) == _ACCEPTED), key=lambda f: len(adj[f]))
+        counts: Counter = Counter()
+        budget = self.max_scan
+        for friend in friends:
+            if budget <= 0:
+                break
+            theirs = adj[friend].items()
+            if len(adj[friend]) > budget:
+                theirs = itertools.islice(theirs, budget)
+            budget -= len(adj[friend])
+            counts.update([other for other, p in theirs if (p >> 1) & 3 == _ACCEPTED and other not in mine and other != u])
+        users = self._users
+        return [(users[other], n) for other, n in counts.most_common(limit)]
+
+    def __len__(self) -> int:
+        return len(self._edges)
+
+
+async def subgraph(repos: Repositories, user_id: str, *others: str, depth: int = 1) -> ConnectionGraph:
+    """A throwaway graph of just the edges around the given users, from the
+    database; depth=2 adds their connections' accepted edges too (suggestions).
+    Used while the shared graph is still loading."""
+    graph = ConnectionGraph()
+    rows = await repos.connections.list_for_users([user_id, *others])
+    graph.load(rows)
+    if depth > 1:
+        friends = [r["requester_id"] if r["addressee_id"] == user_id else r["addressee_id"]
+                   for r in rows if r["status"] == ACCEPTED and user_id in (r["requester_id"], r["addressee_id"])]
+        if friends:
+            graph.load(await repos.connections.list_for_users(friends[:MAX_FALLBACK_FRIENDS], ACCEPTED))
+    return graph
+
+
+_graph: ConnectionGraph | None = None
+
+
+def get_connection_graph() -> ConnectionGraph | None:
+    """The shared graph, or None when CONNECTION_GRAPH is off."""
+    global _graph
+    if _graph is None and get_settings().connection_graph:
+        _graph = ConnectionGraph()
+    return _graph
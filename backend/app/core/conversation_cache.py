@@ -0,0 +1,116 @@
+import logging
+
+from app.core.cache import SingleFlight, TTLCache, get_redis
+from app.core.config import get_settings
+from app.core.repositories import Repositories
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_VIOLATION = "23505"
+
+
+def dm_pair(a: str, b: str) -> str:
+    return f"{min(a,b)}|{max(a,b)}"
+
+
+class ConversationResolver:
+    """Resolves a user pair to its conversation_id, creating it on first use.
+
+    Lookups go local LRU -> optional shared cache -> database. Concurrent
+    misses for the same pair share one lookup/create, so two first messages
+    racing each other can't create two conversations in this worker; across
+    workers the unique dm_pair column catches the loser, which then reads
+    the winner's row. POST /conversations/dm creates through `create` too,
+    so every DM gets its conversation_participants rows.
+    """
+
+    def __init__(self, maxsize: int | None = None, ttl: float | None = None, shared=None):
+        settings = get_settings()
+        maxsize = settings.conversation_cache_size if maxsize is None else maxsize
+        ttl = settings.conversation_cache_ttl if ttl is None else ttl
+        self.ttl = ttl
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight = SingleFlight()
+
+    @staticmethod
+    def _shared_key(pair: str) -> str:
+        return f"chat:convo:{pair}"
+
+    async def resolve(self, repos: Repositories, a: str, b: str) -> str:
+        pair = dm_pair(a, b)
+        conversation_id = self._local.get(pair)
+        if conversation_id is not None:
+            self.hits += 1
+            return conversation_id
+        self.misses += 1
+        return await self._flight.do(pair, lambda: self._load(repos, a, b, pair))
+
+    def peek(self, a: str, b: str) -> str | None:
+        """conversation_id if this worker already knows it; never queries or creates."""
+        return self._local.get(dm_pair(a, b))
+
+    async def _load(self, repos: Repositories, a: str, b: str, pair: str) -> str:
+        if self.shared is not None:
+            try:
+                cached = await self.shared.get(self._shared_key(pair))
+            except Exception:
+                logger.warning("shared conversation cache unavailable", exc_info=True)
+                cached = None
+            if cached:
+                conversation_id = cached.decode() if isinstance(cached, bytes) else cached
+                self._local.set(pair, conversation_id)
+                return conversation_id
+
+        convo = await repos.conversations.find_between(a, b)
+        if convo is None:
+            return (await self.create(repos, a, b))["id"]
+        await self.remember(a, b, convo["id"])
+        return convo["id"]
+
+    async def create(self, repos: Repositories, a: str, b: str, is_request: bool = False) -> dict:
+        """Insert the DM between a and b with both participants and remember it.
+        Returns the existing row if another request created it first."""
+        pair = dm_pair(a, b)
+        try:
+            convo = await repos.conversations.insert({
+                "type": "dm",
+                "dm_pair": pair,
+                "user1_id": a,
+                "user2_id": b,
+                "is_request": is_request,
+            })
+        except Exception as e:
+            # unique_violation on dm_pair: the winner adds the participants
+            if getattr(e, "code", None) != UNIQUE_VIOLATION:
+                raise
+            convo = await repos.conversations.get_by_dm_pair(pair)
+        else:
+            if convo:
+                await repos.conversations.add_participants(convo["id"], [a, b])
+        if not convo:
+            raise RuntimeError("Failed to create conversation")
+        await self.remember(a, b, convo["id"])
+        return convo
+
+    async def remember(self, a: str, b: str, conversation_id: str) -> None:
+        pair = dm_pair(a, b)
+        self._local.set(pair, conversation_id)
+        if self.shared is not None:
+            try:
+                await self.shared.set(self._shared_key(pair), conversation_id, ex=int(self.ttl))
+            except Exception:
+                logger.warning("shared conversation cache unavailable", exc_info=True)
+
+
+_resolver: ConversationResolver | None = None
+
+
+def get_conversation_resolver() -> ConversationResolver:
+    global _resolver
+    if _resolver is None:
+        shared = get_redis() if get_settings().conversation_cache_backend == "redis" else None
+        _resolver = ConversationResolver(shared=shared)
+    return _resolver
@@ -0,0 +1,215 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+
+from app.core.cache import get_redis
+from app.core.config import get_settings
+
+
+def with_seq(seq: int, payload: bytes) -> bytes:
+    """Stamp an encoded JSON object with its sequence number without re-encoding it."""
+    return b'{"seq":%d,' % seq + payload[1:] if payload != b"{}" else b'{"seq":%d}' % seq
+
+
+class EventLog(ABC):
+    """Per-user event sequence plus the last EVENT_LOG_SIZE events, so a
+    reconnecting socket can replay what it missed.
+
+    `since` returns None when the events after `seq` aren't all retained any
+    more (or `seq` is from a log that has since been reset); the client then
+    catches up over REST.
+    """
+
+    @abstractmethod
+    async def append(self, user_id: str, payload: bytes) -> tuple[int, bytes]:
+        """Assign the user's next seq; returns (seq, payload stamped with it)."""
+
+    async def append_many(self, user_ids: list[str], payload: bytes) -> list[int]:
+        """append() for each user (one event, many recipients); returns their seqs in order."""
+        return [(await self.append(user_id, payload))[0] for user_id in user_ids]
+
+    @abstractmethod
+    async def since(self, user_id: str, seq: int) -> list[tuple[int, bytes]] | None: ...
+
+    @abstractmethod
+    async def current(self, user_id: str) -> int: ...
+
+
+class _UserLog:
+    __slots__ = ("seq", "events", "bytes", "expires_at")
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.events: deque[tuple[int, bytes]] = deque(maxlen=size)
+        self.bytes = 0
+        self.expires_at = 0.0
+
+
+class InProcessEventLog(EventLog):
+    """Single-process log. Users idle past EVENT_LOG_TTL are forgotten, and the
+    least recently active ones are dropped to stay within EVENT_LOG_USERS users
+    and EVENT_LOG_MAX_BYTES of stored events."""
+
+    def __init__(
+        self,
+        size: int | None = None,
+        users: int | None = None,
+        ttl: float | None = None,
+        max_bytes: int | None = None,
+    ):
+        settings = get_settings()
+        size = settings.event_log_size if size is None else size
+        users = settings.event_log_users if users is None else users
+        ttl = settings.event_log_ttl if ttl is None else ttl
+        max_bytes = settings.event_log_max_bytes if max_bytes is None else max_bytes
+        self.size = size
+        self.users = users
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._logs: OrderedDict[str, _UserLog] = OrderedDict()
+
+    def _get(self, user_id: str) -> _UserLog | None:
+        log = self._logs.get(user_id)
+        if log is not None and log.expires_at <= time.monotonic():
+            self._drop(user_id)
+            return None
+        return log
+
+    def _drop(self, user_id: str) -> None:
+        self.bytes -= self._logs.pop(user_id).bytes
+
+    def _evict(self) -> None:
+        # least recently active first; expired logs are always at the front
+        now = time.monotonic()
+        while self._logs:
+            user_id, log = next(iter(self._logs.items()))
+            over = len(self._logs) > self.users or (self.bytes > self.max_bytes and len(self._logs) > 1)
+            if not over and log.expires_at > now:
+                break
+            self._drop(user_id)
+
+    async def append(self, user_id: str, payload: bytes) -> tuple[int, bytes]:
+        return self._append(user_id, payload)
+
+    async def append_many(self, user_ids: list[str], payload: bytes) -> list[int]:
+        return [self._append(user_id, payload)[0] for user_id in user_ids]
+
+    def _append(self, user_id: str, payload: bytes) -> tuple[int, bytes]:
+        log = self._get(user_id)
+        if log is None:
+            log = self._logs[user_id] = _UserLog(self.size)
+        self._logs.move_to_end(user_id)
+        log.expires_at = time.monotonic() + self.ttl
+        log.seq += 1
+        data = with_seq(log.seq, payload)
+        if len(log.events) == self.size:
+            dropped = len(log.events[0][1])
+            log.bytes -= dropped
+            self.bytes -= dropped
+        log.events.append((log.seq, data))
+        log.bytes += len(data)
+        self.bytes += len(data)
+        self._evict()
+        return log.seq, data
+
+    async def since(self, user_id: str, seq: int) -> list[tuple[int, bytes]] | None:
+        log = self._get(user_id)
+        current = log.seq if log else 0
+        if seq > current:
+            return None
+        if seq == current:
+            return []
+        if not log.events or log.events[0][0] > seq + 1:
+            return None
+        return [e for e in log.events if e[0] > seq]
+
+    async def current(self, user_id: str) -> int:
+        log = self._get(user_id)
+        return log.seq if log else 0
+
+
+# INCR and the event write in one step, so a reader never sees a seq whose
+# event isn't stored yet and a failure can't leave a hole in the log.
+# KEYS: seq key, events key; ARGV: payload, size, ttl. Stamps like with_seq.
+_APPEND = """
+local seq = redis.call("INCR", KEYS[1])
+local data
+if ARGV[1] == "{}" then
+    data = '{"seq":' .. seq .. '}'
+else
+    data = '{"seq":' .. seq .. ',' .. string.sub(ARGV[1], 2)
+end
+redis.call("ZADD", KEYS[2], seq, data)
+redis.call("ZREMRANGEBYRANK", KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+redis.call("EXPIRE", KEYS[2], ARGV[3])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+return seq
+"""
+
+
+class RedisEventLog(EventLog):
+    """Log shared by all workers: INCR for the sequence, a sorted set scored by
+    seq for the events, both written by one Lua script per append."""
+
+    def __init__(self, client=None, size: int | None = None, ttl: float | None = None):
+        settings = get_settings()
+        size = settings.event_log_size if size is None else size
+        ttl = settings.event_log_ttl if ttl is None else ttl
+        if client is None:
+            client = get_redis()
+        self.client = client
+        self.size = size
+        self.ttl = int(ttl)
+        self._script = client.register_script(_APPEND)
+
+    @staticmethod
+    def _keys(user_id: str) -> tuple[str, str]:
+        return f"chat:seq:{user_id}", f"chat:events:{user_id}"
+
+    async def append(self, user_id: str, payload: bytes) -> tuple[int, bytes]:
+        seq = int(await self._script(keys=self._keys(user_id), args=[payload, self.size, self.ttl]))
+        return seq, with_seq(seq, payload)
+
+    async def append_many(self, user_ids: list[str], payload: bytes) -> list[int]:
+        # one round trip however many recipients
+        if not user_ids:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            await self._script(keys=self._keys(user_id), args=[payload, self.size, self.ttl], client=pipe)
+        return [int(seq) for seq in await pipe.execute()]
+
+    async def since(self, user_id: str, seq: int) -> list[tuple[int, bytes]] | None:
+        seq_key, events_key = self._keys(user_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(seq_key)
+        pipe.zrange(events_key, 0, 0, withscores=True)
+        pipe.zrangebyscore(events_key, f"({seq}", "+inf", withscores=True)
+        current, oldest, events = await pipe.execute()
+        current = int(current or 0)
+        if seq > current:
+            return None
+        if seq == current:
+            return []
+        if not oldest or int(oldest[0][1]) > seq + 1:
+            return None
+        return [(int(score), data) for data, score in events]
+
+    async def current(self, user_id: str) -> int:
+        return int(await self.client.get(self._keys(user_id)[0]) or 0)
+
+
+_log: EventLog | None = None
+
+
+def get_event_log() -> EventLog:
+    global _log
+    if _log is None:
+        _log = RedisEventLog() if get_settings().pubsub_backend == "redis" else InProcessEventLog()
+    return _log
+
+
+def set_event_log(log: EventLog | None) -> None:
+    global _log
+    _log = log
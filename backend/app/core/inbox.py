@@ -0,0 +1,146 @@
+import asyncio
+
+import orjson
+from app.core.cache import CoalescingCache
+from app.core.config import get_settings
+from app.core.message_cache import get_message_cache
+from app.core.participants import get_participants
+from app.core.profile_loader import ProfileLoader
+from app.core.pubsub import get_pubsub
+from app.core.repositories import Repositories
+
+# read events, so every worker's unread counters stay current (stored
+# messages come through app/core/message_events.py)
+INBOX_CHANNEL = "chat:inbox"
+
+
+def _other(convo: dict, user_id: str) -> str | None:
+    return convo["user2_id"] if convo.get("user1_id") == user_id else convo.get("user1_id")
+
+
+class Inbox:
+    """Per-user conversation list read model.
+
+    The last message of each conversation is denormalized onto its row by a
+    trigger on messages (migrations/0004), so a page of the inbox is one
+    keyset query; read pointers come in one more. Unread counts are kept per
+    (user, conversation) in memory, bumped by every new message and reset by
+    read pointers, and counted once on a miss - never more than a page's worth.
+    """
+
+    def __init__(self, maxsize: int | None = None, ttl: float | None = None):
+        settings = get_settings()
+        maxsize = settings.inbox_unread_cache_size if maxsize is None else maxsize
+        ttl = settings.inbox_unread_cache_ttl if ttl is None else ttl
+        self._unread = CoalescingCache(maxsize=maxsize, ttl=ttl)
+        self._started = False
+
+    def cache_counts(self) -> dict[str, tuple[int, int]]:
+        return {"inbox_unread": (self._unread.hits, self._unread.misses)}
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_published, prefix=INBOX_CHANNEL)
+        await pubsub.subscribe(INBOX_CHANNEL)
+        self._started = True
+
+    async def _on_published(self, channel: str, payload: bytes) -> None:
+        self.apply(orjson.loads(payload))
+
+    async def _record(self, event: dict) -> None:
+        if self._started:
+            await get_pubsub().publish(INBOX_CHANNEL, orjson.dumps(event))
+        else:
+            self.apply(event)
+
+    async def record_read(self, pointer: dict, unread: int | None) -> None:
+        """Call after a read pointer moves; `unread` is what's left after it, if known."""
+        await self._record({
+            "type": "read",
+            "conversation_id": pointer["conversation_id"],
+            "user_id": pointer["user_id"],
+            "unread": unread,
+        })
+
+    def apply(self, event: dict) -> None:
+        conversation_id = event["conversation_id"]
+        if event["type"] == "message":
+            for user_id in event["recipients"]:
+                key = (user_id, conversation_id)
+                unread = self._unread.peek(key)
+                if unread is None:
+                    self._unread.pop(key)  # don't let a count already in flight miss this one
+                else:
+                    self._unread.set(key, unread + 1)
+        elif event["type"] == "read":
+            key = (event["user_id"], conversation_id)
+            if event["unread"] is None:
+                self._unread.pop(key)
+            else:
+                self._unread.set(key, event["unread"])
+
+    async def unread(self, repos: Repositories, user_id: str, conversation_id: str, pointer: dict | None) -> int:
+        cursor = None
+        if pointer and pointer.get("last_read_at"):
+            cursor = (pointer["last_read_at"], pointer["last_read_message_id"])
+
+        async def count() -> int:
+            n = get_message_cache().count_unread(conversation_id, user_id, cursor)
+            if n is None:
+                n = await repos.messages.count_unread(conversation_id, user_id, cursor)
+            return n
+
+        return await self._unread.get((user_id, conversation_id), count)
+
+    async def page(
+        self,
+        repos: Repositories,
+        profiles: ProfileLoader,
+        user_id: str,
+        limit: int,
+        cursor: tuple[str, str] | None = None,
+    ) -> tuple[list[dict], bool]:
+        """One page of inbox entries, latest activity first, and whether there are more."""
+        group_ids = await get_participants().groups_of(repos, user_id)
+        rows = await repos.conversations.inbox_page(user_id, limit, cursor, group_ids)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            return [], False
+
+        pointer_rows, briefs = await asyncio.gather(
+            repos.conversations.read_pointers(user_id, [r["id"] for r in rows]),
+            profiles.load_many({o for o in (_other(r, user_id) for r in rows) if o}),
+        )
+        pointers = {p["conversation_id"]: p for p in pointer_rows}
+        unread = await asyncio.gather(*(self.unread(repos, user_id, r["id"], pointers.get(r["id"])) for r in rows))
+
+        entries = []
+        for row, count in zip(rows, unread):
+            pointer = pointers.get(row["id"]) or {}
+            entries.append({
+                "conversation_id": row["id"],
+                "type": row.get("type"),
+                "title": row.get("title"),
+                "is_request": row.get("is_request"),
+                "other": briefs.get(_other(row, user_id)),
+                "last_message": {
+                    "id": row["last_message_id"],
+                    "sender_id": row["last_sender_id"],
+                    "preview": row["last_message_preview"],
+                    "created_at": row["last_message_at"],
+                },
+                "unread": count,
+                "last_read_message_id": pointer.get("last_read_message_id"),
+            })
+        return entries, has_more
+
+
+_inbox: Inbox | None = None
+
+
+def get_inbox() -> Inbox:
+    global _inbox
+    if _inbox is None:
+        _inbox = Inbox()
+    return _inbox
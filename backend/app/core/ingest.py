@@ -0,0 +1,337 @@
+import asyncio
+import fcntl
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+import orjson
+from app.core.config import get_settings
+from app.core.repositories import get_repositories
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 30.0
+# rows the database rejected outright, one JSON object per line, next to the
+# worker journals
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+# SQLSTATE classes where retrying the same rows can't help: 22 data exception
+# (e.g. a malformed uuid), 23 integrity constraint (e.g. an unknown receiver)
+PERMANENT_SQLSTATE_CLASSES = ("22", "23")
+
+
+# staging directories older than this belong to a worker that died starting up
+STAGING_MAX_AGE = 60.0
+
+
+def _drain(worker_dir: Path) -> list[dict]:
+    rows = []
+    for segment in sorted(worker_dir.glob("*.jsonl")):
+        try:
+            data = segment.read_bytes()
+        except FileNotFoundError:
+            continue
+        for line in data.splitlines():
+            try:
+                rows.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                pass  # torn last write from the crash
+        segment.unlink(missing_ok=True)
+    return rows
+
+
+def _remove_dir(path: Path) -> None:
+    try:
+        path.rmdir()
+    except OSError:
+        pass  # already gone, or not empty: left for the next start
+
+
+def _permanent(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    return isinstance(code, str) and code[:2] in PERMANENT_SQLSTATE_CLASSES
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MessageIngest:
+    """Write-behind persistence for messages received over the WebSocket.
+
+    `submit` assigns the server id, appends the row to an on-disk journal and
+    returns; a background flusher drains pending rows into multi-row inserts
+    once INGEST_BATCH_SIZE rows are waiting or INGEST_FLUSH_INTERVAL has
+    passed. Journal segments are deleted once every row in them is stored,
+    and anything left over after a crash is replayed on the next start.
+    Inserts are upserts on id, so replaying a row that did land is harmless.
+    """
+
+    def __init__(
+        self,
+        journal_dir: str | None = None,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+        max_pending: int | None = None,
+        fsync: bool | None = None,
+    ):
+        settings = get_settings()
+        journal_dir = settings.ingest_journal_dir if journal_dir is None else journal_dir
+        batch_size = settings.ingest_batch_size if batch_size is None else batch_size
+        flush_interval = settings.ingest_flush_interval if flush_interval is None else flush_interval
+        max_pending = settings.ingest_max_pending if max_pending is None else max_pending
+        fsync = settings.ingest_journal_fsync if fsync is None else fsync
+        self.root = Path(journal_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.flushed = 0
+        self.dead_lettered = 0
+        self._rows: deque[tuple[int, dict]] = deque()
+        self._inflight: list[tuple[int, dict]] = []
+        self._batch_ready = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._pending: dict[int, int] = {}  # segment -> rows not yet stored
+        self._segment = 0
+        self._segment_rows = 0
+        self._file = None
+        self._dir: Path | None = None
+        self._lock_fd: int | None = None
+        self._task: asyncio.Task | None = None
+
+    # --- journal
+
+    def _segment_path(self, segment: int) -> Path:
+        return self._dir / f"{segment:012d}.jsonl"
+
+    def _open_segment(self) -> None:
+        self._segment += 1
+        self._segment_rows = 0
+        self._pending[self._segment] = 0
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def _rotate(self) -> None:
+        # new rows go to a fresh segment so the current one can be retired
+        if self._segment_rows:
+            self._file.close()
+            self._open_segment()
+
+    def _journal(self, row: dict) -> int:
+        self._file.write(orjson.dumps(row) + b"\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._segment_rows += 1
+        self._pending[self._segment] += 1
+        return self._segment
+
+    def _retire(self, segment: int) -> None:
+        self._pending[segment] -= 1
+        if self._pending[segment] == 0 and segment != self._segment:
+            del self._pending[segment]
+            self._segment_path(segment).unlink(missing_ok=True)
+
+    def _claim_orphans(self) -> list[dict]:
+        """Collect rows journaled by workers that died before flushing them."""
+        rows = []
+        for worker_dir in self.root.iterdir():
+            if worker_dir == self._dir or not worker_dir.is_dir():
+                continue
+            if worker_dir.name.startswith(".worker-"):
+                self._remove_staging(worker_dir)
+                continue
+            try:
+                fd = os.open(worker_dir / "lock", os.O_RDWR)
+            except FileNotFoundError:
+                _remove_dir(worker_dir)  # torn down but for the directory itself
+                continue
+            except OSError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # still owned by a live worker
+                rows.extend(_drain(worker_dir))
+                (worker_dir / "lock").unlink(missing_ok=True)
+            finally:
+                os.close(fd)
+            _remove_dir(worker_dir)
+        return rows
+
+    def _remove_staging(self, staging: Path) -> None:
+        # a worker that died between mkdir and rename; nothing was journaled there
+        try:
+            if time.time() - staging.stat().st_mtime < STAGING_MAX_AGE:
+                return  # may still be starting up
+            (staging / "lock").unlink(missing_ok=True)
+        except OSError:
+            return
+        _remove_dir(staging)
+
+    # --- lifecycle
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        # made and locked under a staging name, then renamed: a sibling
+        # claiming orphans never sees this directory before it's locked
+        name = f"worker-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        staging = self.root / f".{name}"
+        staging.mkdir()
+        self._lock_fd = os.open(staging / "lock", os.O_RDWR | os.O_CREAT)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._dir = self.root / name
+        staging.rename(self._dir)
+        self._open_segment()
+        recovered = self._claim_orphans()
+        for row in recovered:
+            self._enqueue(self._journal(row), row)
+        if recovered:
+            logger.info("replaying %d journaled messages", len(recovered))
+        self._task = asyncio.create_task(self._flusher())
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # one last attempt; whatever fails stays journaled for the next start
+        while self._rows:
+            batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+            if not await self._write(batch, retry=False):
+                break
+        self._file.close()
+        if not self._rows and not any(self._pending.values()):
+            for segment in list(self._pending):
+                self._segment_path(segment).unlink(missing_ok=True)
+            (self._dir / "lock").unlink(missing_ok=True)
+            _remove_dir(self._dir)
+        os.close(self._lock_fd)
+
+    # --- ingest
+
+    def _enqueue(self, segment: int, row: dict) -> None:
+        self._rows.append((segment, row))
+        # wake the flusher: to start the flush interval, or to flush a full batch now
+        if len(self._rows) == 1 or len(self._rows) >= self.batch_size:
+            self._batch_ready.set()
+        if len(self._rows) >= self.max_pending:
+            self._has_space.clear()
+
+    async def submit(self, row: dict) -> dict:
+        """Durably accept a message row; returns it with its server id set."""
+        if self._task is None:
+            await self.start()
+        while not self._has_space.is_set():
+            await self._has_space.wait()  # flusher is behind: backpressure
+        row = {**row, "id": row.get("id") or str(uuid.uuid4()), "created_at": _now()}
+        self._enqueue(self._journal(row), row)
+        return row
+
+    def pending(self, conversation_id: str) -> list[dict]:
+        """Accepted rows for a conversation that aren't in the database yet."""
+        return [row for _, row in itertools.chain(self._inflight, self._rows)
+                if row.get("conversation_id") == conversation_id]
+
+    def pending_for_user(self, user_id: str) -> list[dict]:
+        return [row for _, row in itertools.chain(self._inflight, self._rows)
+                if user_id in (row.get("sender_id"), row.get("receiver_id"))]
+
+    async def _flusher(self) -> None:
+        while True:
+            if not self._rows:
+                self._batch_ready.clear()
+                await self._batch_ready.wait()
+                continue  # first row in: now give the batch its interval to fill
+            elif len(self._rows) < self.batch_size:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if not self._rows:
+                continue
+            batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+            if len(self._rows) < self.max_pending:
+                self._has_space.set()
+            await self._write(batch)
+
+    async def _insert(self, repos, batch: list[tuple[int, dict]]) -> list[tuple[int, dict]]:
+        """Store a batch; returns what was stored. Transient errors raise."""
+        try:
+            await repos.messages.insert_many([row for _, row in batch])
+            return batch
+        except Exception as e:
+            if not _permanent(e):
+                raise
+            logger.warning("message batch rejected (%s), storing its %d rows one by one", e, len(batch))
+        # some row can never be stored; find it so the rest aren't held back
+        stored = []
+        for item in batch:
+            try:
+                await repos.messages.insert_many([item[1]])
+            except Exception as e:
+                if not _permanent(e):
+                    raise
+                self._dead_letter(item[1], e)
+            else:
+                stored.append(item)
+        return stored
+
+    def _dead_letter(self, row: dict, error: Exception) -> None:
+        logger.error("message %s rejected by the database, moved to %s: %s", row.get("id"), DEAD_LETTER_FILE, error)
+        with open(self.root / DEAD_LETTER_FILE, "ab") as f:
+            f.write(orjson.dumps({"row": row, "error": str(error), "at": _now()}) + b"\n")
+        self.dead_lettered += 1
+
+    async def _write(self, batch: list[tuple[int, dict]], retry: bool = True) -> bool:
+        self._rotate()
+        self._inflight = batch
+        delay = 0.5
+        while True:
+            try:
+                repos = await get_repositories()
+                stored = await self._insert(repos, batch)
+                break
+            except Exception:
+                logger.exception("message batch insert failed (%d rows)", len(batch))
+                if not retry:
+                    self._inflight = []
+                    return False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+        self._inflight = []
+        self.flushed += len(stored)
+        # dead-lettered rows are done with too: they're out of the journal
+        for segment, _ in batch:
+            self._retire(segment)
+        return True
+
+
+_ingest: MessageIngest | None = None
+
+
+def get_ingest() -> MessageIngest:
+    global _ingest
+    if _ingest is None:
+        _ingest = MessageIngest()
+    return _ingest
+
+
+async def close_ingest() -> None:
+    global _ingest
+    if _ingest is not None:
+        await _ingest.close()
+        _ingest = None
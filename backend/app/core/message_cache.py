@@ -0,0 +1,265 @@
+import bisect
+import time
+from collections import OrderedDict
+
+import orjson
+from app.core.cache import SingleFlight
+from app.core.config import get_settings
+from app.core.ingest import get_ingest
+from app.core.pubsub import get_pubsub
+from app.core.repositories import Repositories
+
+# drops a conversation's ring on every worker (stored messages come through
+# app/core/message_events.py)
+CACHE_CHANNEL = "chat:msgcache"
+
+
+def _key(row: dict) -> tuple[str, str]:
+    return (row["created_at"], row["id"])
+
+
+def _row_size(row: dict) -> int:
+    # rough per-row footprint: dict + fixed columns + the body text
+    return 400 + len(row.get("body") or "")
+
+
+class _Ring:
+    __slots__ = ("rows", "keys", "ids", "complete", "size", "loaded_at")
+
+    def __init__(self, rows: list[dict], complete: bool):
+        self.rows = sorted(rows, key=_key)
+        self.keys = [_key(r) for r in self.rows]
+        self.ids = {r["id"] for r in self.rows}
+        # complete: the ring holds the conversation's entire history
+        self.complete = complete
+        self.size = sum(_row_size(r) for r in self.rows)
+        self.loaded_at = time.monotonic()
+
+    def add(self, row: dict, maxlen: int) -> int:
+        if row["id"] in self.ids:
+            return 0
+        key = _key(row)
+        # the ring is the newest contiguous run; older stragglers don't belong
+        if not self.complete and self.keys and key < self.keys[0]:
+            return 0
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.rows.insert(i, row)
+        self.ids.add(row["id"])
+        grown = _row_size(row)
+        while len(self.rows) > maxlen:
+            self.keys.pop(0)
+            dropped = self.rows.pop(0)
+            self.ids.discard(dropped["id"])
+            grown -= _row_size(dropped)
+            self.complete = False
+        self.size += grown
+        return grown
+
+
+class MessageCache:
+    """Newest messages of recently read conversations, kept in memory.
+
+    A conversation gets a ring buffer the first time its latest page is read;
+    from then on every stored message is applied to it (via the pub/sub
+    backbone, so writes on other workers land too) and history reads that fall
+    inside the ring are answered without the database. Whole conversations
+    are evicted least-recently-read first to stay under max_bytes.
+    """
+
+    def __init__(
+        self,
+        ring_size: int | None = None,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+    ):
+        settings = get_settings()
+        ring_size = settings.message_cache_ring_size if ring_size is None else ring_size
+        max_bytes = settings.message_cache_max_bytes if max_bytes is None else max_bytes
+        ttl = settings.message_cache_ttl if ttl is None else ttl
+        self.ring_size = ring_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._rings: OrderedDict[str, _Ring] = OrderedDict()
+        # conversations being seeded -> writes that arrived meanwhile
+        self._loading: dict[str, list[dict]] = {}
+        self._flight = SingleFlight()
+        self._started = False
+
+    # --- sync across workers
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_published, prefix=CACHE_CHANNEL)
+        await pubsub.subscribe(CACHE_CHANNEL)
+        self._started = True
+
+    async def _on_published(self, channel: str, payload: bytes) -> None:
+        self._drop(orjson.loads(payload)["conversation_id"])
+
+    def apply(self, row: dict) -> None:
+        conversation_id = row.get("conversation_id")
+        pending = self._loading.get(conversation_id)
+        if pending is not None:
+            pending.append(row)
+        ring = self._rings.get(conversation_id)
+        if ring is not None:
+            self.bytes += ring.add(row, self.ring_size)
+            self._evict()
+
+    # --- reads
+
+    def _ring(self, conversation_id: str) -> _Ring | None:
+        ring = self._rings.get(conversation_id)
+        if ring is None:
+            return None
+        if time.monotonic() - ring.loaded_at > self.ttl:
+            self._drop(conversation_id)
+            return None
+        self._rings.move_to_end(conversation_id)
+        return ring
+
+    def _window(self, ring: _Ring, limit: int, cursor: tuple | None, newer: bool) -> list[dict] | None:
+        """limit + 1 rows in page order if the ring covers the window, else None."""
+        want = limit + 1
+        if newer:
+            if cursor is None:
+                return None
+            cursor = tuple(cursor)
+            # covered unless rows between the cursor and our oldest row may be missing
+            if not ring.complete and (not ring.keys or cursor < ring.keys[0]):
+                return None
+            start = bisect.bisect_right(ring.keys, cursor)
+            return ring.rows[start:start + want]
+        end = len(ring.rows) if cursor is None else bisect.bisect_left(ring.keys, tuple(cursor))
+        if end < want and not ring.complete:
+            return None
+        return ring.rows[max(0, end - want):end][::-1]
+
+    async def page(
+        self,
+        repos: Repositories,
+        conversation_id: str,
+        limit: int,
+        cursor: tuple[str, str] | None = None,
+        newer: bool = False,
+    ) -> list[dict]:
+        """Same contract as MessageRepository.page, served from the ring when it can be."""
+        ring = self._ring(conversation_id)
+        if ring is not None:
+            rows = self._window(ring, limit, cursor, newer)
+            if rows is not None:
+                self.hits += 1
+                return rows
+        self.misses += 1
+        if ring is None and cursor is None and not newer and limit < self.ring_size:
+            ring = await self._flight.do(conversation_id, lambda: self._seed(repos, conversation_id))
+            return self._window(ring, limit, None, False)
+        return await repos.messages.page(conversation_id, limit, cursor, newer)
+
+    async def history(self, repos: Repositories, conversation_id: str, limit: int, before: str | None = None) -> list[dict]:
+        """Same contract as MessageRepository.history; only the latest page is cached."""
+        if limit <= 0:
+            return []  # rows[-0:] would be the whole ring
+        if before is not None:
+            # client-supplied timestamps needn't match the stored text format
+            return await repos.messages.history(conversation_id, limit, before)
+        ring = self._ring(conversation_id)
+        if ring is not None and (len(ring.rows) >= limit or ring.complete):
+            self.hits += 1
+            return ring.rows[-limit:][::-1]
+        self.misses += 1
+        if ring is None and limit <= self.ring_size:
+            ring = await self._flight.do(conversation_id, lambda: self._seed(repos, conversation_id))
+            return ring.rows[-limit:][::-1]
+        return await repos.messages.history(conversation_id, limit)
+
+    def find(self, conversation_id: str, message_id: str) -> dict | None:
+        """A message still in the conversation's ring, or one waiting in the ingest queue."""
+        ring = self._ring(conversation_id)
+        if ring is not None and message_id in ring.ids:
+            return next(r for r in reversed(ring.rows) if r["id"] == message_id)
+        return next((r for r in get_ingest().pending(conversation_id) if r["id"] == message_id), None)
+
+    def count_unread(self, conversation_id: str, user_id: str, cursor: tuple | None) -> int | None:
+        """Same as MessageRepository.count_unread if the ring covers everything
+        after the cursor, else None."""
+        ring = self._ring(conversation_id)
+        if ring is None:
+            return None
+        if cursor is None:
+            if not ring.complete:
+                return None
+            start = 0
+        else:
+            cursor = tuple(cursor)
+            if not ring.complete and (not ring.keys or cursor < ring.keys[0]):
+                return None
+            start = bisect.bisect_right(ring.keys, cursor)
+        self.hits += 1
+        return sum(1 for r in ring.rows[start:] if r["sender_id"] != user_id)
+
+    async def _seed(self, repos: Repositories, conversation_id: str) -> _Ring:
+        self._loading[conversation_id] = []
+        try:
+            rows = await repos.messages.page(conversation_id, self.ring_size)
+        finally:
+            pending = self._loading.pop(conversation_id)
+        complete = len(rows) <= self.ring_size
+        ring = _Ring(rows[:self.ring_size], complete)
+        existing = self._rings.pop(conversation_id, None)
+        if existing is not None:
+            self.bytes -= existing.size
+        self._rings[conversation_id] = ring
+        self.bytes += ring.size
+        # writes that raced the load, and ones still waiting in the ingest queue
+        for row in pending + get_ingest().pending(conversation_id):
+            self.bytes += ring.add(row, self.ring_size)
+        self._evict()
+        return ring
+
+    # --- eviction
+
+    def _drop(self, conversation_id: str) -> None:
+        ring = self._rings.pop(conversation_id, None)
+        if ring is not None:
+            self.bytes -= ring.size
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and len(self._rings) > 1:
+            conversation_id, _ = next(iter(self._rings.items()))
+            self._drop(conversation_id)
+            self.evictions += 1
+
+    def invalidate(self, conversation_id: str) -> None:
+        self._drop(conversation_id)
+
+    async def forget(self, conversation_id: str) -> None:
+        """Drop a conversation's ring on every worker, e.g. after a bulk import."""
+        if self._started:
+            await get_pubsub().publish(CACHE_CHANNEL, orjson.dumps({"conversation_id": conversation_id}))
+        else:
+            self._drop(conversation_id)
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._rings),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_cache: MessageCache | None = None
+
+
+def get_message_cache() -> MessageCache:
+    global _cache
+    if _cache is None:
+        _cache = MessageCache()
+    return _cache
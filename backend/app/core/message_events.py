@@ -0,0 +1,57 @@
+import orjson
+from app.core.inbox import get_inbox
+from app.core.message_cache import get_message_cache
+from app.core.message_search import DOC_FIELDS, get_message_search
+from app.core.pubsub import get_pubsub
+
+# one event per stored message, applied by every worker to its message cache,
+# inbox unread counters and search index
+MESSAGE_CHANNEL = "chat:messages"
+
+
+class MessageEvents:
+    """Spreads each stored message to the per-worker read models in a single
+    publish, instead of one publish per model."""
+
+    def __init__(self):
+        self._started = False
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_published, prefix=MESSAGE_CHANNEL)
+        await pubsub.subscribe(MESSAGE_CHANNEL)
+        self._started = True
+
+    async def _on_published(self, channel: str, payload: bytes) -> None:
+        event = orjson.loads(payload)
+        self.apply(event["message"], event["recipients"])
+
+    async def record(self, message: dict, recipients: list[str] | None = None) -> None:
+        """Call after a message is stored (or durably queued); `recipients`
+        (whose unread counts go up) defaults to the DM receiver."""
+        if not message.get("conversation_id"):
+            return
+        if recipients is None:
+            recipients = [message["receiver_id"]]
+        if self._started:
+            await get_pubsub().publish(MESSAGE_CHANNEL, orjson.dumps({"message": message, "recipients": recipients}))
+        else:
+            self.apply(message, recipients)
+
+    @staticmethod
+    def apply(message: dict, recipients: list[str]) -> None:
+        get_message_cache().apply(message)
+        get_inbox().apply({"type": "message", "conversation_id": message["conversation_id"], "recipients": recipients})
+        search = get_message_search()
+        if search is not None:
+            search.add({k: message.get(k) for k in DOC_FIELDS})
+
+
+_events: MessageEvents | None = None
+
+
+def get_message_events() -> MessageEvents:
+    global _events
+    if _events is None:
+        _events = MessageEvents()
+    return _events
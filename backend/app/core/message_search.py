@@ -0,0 +1,795 @@
+import array
+import asyncio
+import bisect
+import fcntl
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable
+
+import orjson
+from app.core.config import get_settings
+from app.core.pagination import parse_timestamp
+from app.core.pubsub import get_pubsub
+from app.core.repositories import get_repositories
+
+logger = logging.getLogger(__name__)
+
+# imported batches on any worker are indexed by every worker (single stored
+# messages come through app/core/message_events.py)
+SEARCH_CHANNEL = "chat:search"
+
+TOKEN = re.compile(r"\w+")
+MAX_TOKEN_CHARS = 40
+MAX_QUERY_TERMS = 8
+SNIPPET_CHARS = 160
+BM25_K1, BM25_B = 1.2, 0.75
+# messages can reach the database after newer ones (write-behind ingest), so
+# catching up after a restart re-reads this far behind the newest indexed one
+CATCH_UP_MARGIN = timedelta(minutes=5)
+# the worker holding this lock writes the node's index; the others read its segments
+WRITER_LOCK = "writer.lock"
+# written by the writer once its first catch-up is flushed; readers search from then on
+READY_FILE = "ready"
+# how often readers look for segments the writer flushed or merged
+REFRESH_INTERVAL = 1.0
+
+# postings pack (conversation << 32) | (segment-local doc number << 4) | min(term frequency, 15),
+# so sorting a term's postings groups them by conversation
+_TF_BITS = 4
+_TF_MASK = (1 << _TF_BITS) - 1
+_CONV_SHIFT = 32
+_DOC_MASK = (1 << (_CONV_SHIFT - _TF_BITS)) - 1
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DOC_FIELDS = ("id", "conversation_id", "sender_id", "receiver_id", "created_at", "body")
+
+
+def tokenize(text: str | None) -> list[str]:
+    return [t for t in TOKEN.findall((text or "").lower()) if len(t) <= MAX_TOKEN_CHARS]
+
+
+def _micros(created_at: str) -> int:
+    dt = parse_timestamp(created_at)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _id_bytes(message_id: str) -> bytes:
+    # a fixed 16 bytes per doc for tie-breaking and dedupe
+    try:
+        return uuid.UUID(message_id).bytes
+    except ValueError:
+        return hashlib.md5(message_id.encode()).digest()
+
+
+def snippet(body: str, terms: Iterable[str], width: int = SNIPPET_CHARS) -> tuple[str, list[tuple[int, int]]]:
+    """A window of `body` around the first match, and [start, end) offsets of
+    every matched word inside it."""
+    terms = set(terms)
+    spans = [m.span() for m in TOKEN.finditer(body) if m.group().lower() in terms]
+    if not spans:
+        return body[:width], []
+    start = max(0, min(spans[0][0] - width // 4, len(body) - width))
+    end = min(len(body), start + width)
+    prefix = "…" if start > 0 else ""
+    text = prefix + body[start:end] + ("…" if end < len(body) else "")
+    shift = len(prefix) - start
+    return text, [(s + shift, e + shift) for s, e in spans if s >= start and e <= end]
+
+
+def _unpack(postings: Iterable[int], found: dict[int, int]) -> dict[int, int]:
+    for packed in postings:
+        found[(packed >> _TF_BITS) & _DOC_MASK] = packed & _TF_MASK
+    return found
+
+
+class _Live:
+    """Messages indexed since the last flush; searchable straight away."""
+
+    def __init__(self):
+        self.rows: list[dict] = []
+        self.times = array.array("q")
+        self.lens = array.array("H")
+        self.uids: list[bytes] = []
+        self.id_set: set[bytes] = set()
+        self.tokens = 0
+        # term -> packed postings, in doc order
+        self.postings: dict[str, list[int]] = {}
+        self.dms: dict[int, tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, row: dict, conv: int, uid: bytes) -> None:
+        doc = len(self.rows)
+        self.rows.append(row)
+        self.times.append(_micros(row["created_at"]))
+        self.uids.append(uid)
+        self.id_set.add(uid)
+        tokens = tokenize(row.get("body"))
+        self.lens.append(min(len(tokens), 0xFFFF))
+        self.tokens += len(tokens)
+        postings, base = self.postings, (conv << _CONV_SHIFT) | (doc << _TF_BITS)
+        for term, tf in Counter(tokens).items():
+            packed = base | (tf if tf < _TF_MASK else _TF_MASK)
+            found = postings.get(term)
+            if found is None:
+                postings[term] = [packed]
+            else:
+                found.append(packed)
+        if row.get("receiver_id"):
+            self.dms[conv] = (row["sender_id"], row["receiver_id"])
+
+    # --- the read interface shared with _Segment
+
+    def df(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def matches(self, term: str, convs: list[int], conv_set: set[int]) -> dict[int, int]:
+        """doc -> term frequency for the docs in `convs` containing `term`."""
+        postings = self.postings.get(term, ())
+        return _unpack((p for p in postings if p >> _CONV_SHIFT in conv_set), {})
+
+    def length(self, doc: int) -> int:
+        return self.lens[doc]
+
+    def time(self, doc: int) -> int:
+        return self.times[doc]
+
+    def uid(self, doc: int) -> bytes:
+        return self.uids[doc]
+
+    def row(self, doc: int) -> dict:
+        return self.rows[doc]
+
+
+def _map(path: Path, typecode: str):
+    """Read-only memory map of a binary array file, as a typed memoryview."""
+    if path.stat().st_size == 0:
+        return array.array(typecode)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm).cast(typecode)
+
+
+class _Segment:
+    """An immutable, flushed run of messages. Files, per segment:
+
+        .docs  one JSON row per message        .offs  byte offset of each row (+ end)
+        .time  created_at, epoch microseconds  .lens  tokens per message
+        .ids   16-byte message ids             .post  postings, term after term
+        .toff  where each term starts in .post (+ end)
+        .meta  sorted terms, DM pairs, counts; written last
+
+    A term's postings are sorted, i.e. grouped by conversation, so a search
+    binary-searches to the caller's conversations instead of reading them all.
+    """
+
+    SUFFIXES = (".docs", ".offs", ".time", ".lens", ".ids", ".post", ".toff", ".meta")
+
+    def __init__(self, prefix: Path):
+        self.prefix = prefix
+        meta = orjson.loads(prefix.with_suffix(".meta").read_bytes())
+        self.docs: int = meta["docs"]
+        self.tokens: int = meta["tokens"]
+        self.max_time: int = meta["max_time"]
+        self.terms: dict[str, int] = {term: i for i, term in enumerate(meta["terms"])}
+        self.dms: list[list] = meta["dms"]
+        # segments merged into this one; left behind if we crashed before deleting them
+        self.replaces: list[str] = meta.get("replaces", [])
+        self._post = _map(prefix.with_suffix(".post"), "Q")
+        self._toff = _map(prefix.with_suffix(".toff"), "Q")
+        self._offs = _map(prefix.with_suffix(".offs"), "Q")
+        self._time = _map(prefix.with_suffix(".time"), "q")
+        self._lens = _map(prefix.with_suffix(".lens"), "H")
+        self._ids = _map(prefix.with_suffix(".ids"), "B")
+        self._docs_map = _map(prefix.with_suffix(".docs"), "B")
+
+    def __len__(self) -> int:
+        return self.docs
+
+    def _span(self, term: str) -> tuple[int, int]:
+        i = self.terms.get(term)
+        return (0, 0) if i is None else (self._toff[i], self._toff[i + 1])
+
+    def df(self, term: str) -> int:
+        lo, hi = self._span(term)
+        return hi - lo
+
+    def matches(self, term: str, convs: list[int], conv_set: set[int]) -> dict[int, int]:
+        lo, hi = self._span(term)
+        post = self._post
+        if len(convs) * 16 >= hi - lo:
+            return _unpack((p for p in post[lo:hi] if p >> _CONV_SHIFT in conv_set), {})
+        # few conversations against a common term: binary-search to each
+        found = {}
+        for conv in convs:
+            start = bisect.bisect_left(post, conv << _CONV_SHIFT, lo, hi)
+            end = bisect.bisect_left(post, (conv + 1) << _CONV_SHIFT, start, hi)
+            if start < end:
+                _unpack(post[start:end], found)
+        return found
+
+    def length(self, doc: int) -> int:
+        return self._lens[doc]
+
+    def time(self, doc: int) -> int:
+        return self._time[doc]
+
+    def uid(self, doc: int) -> bytes:
+        return bytes(self._ids[doc * 16:doc * 16 + 16])
+
+    def row(self, doc: int) -> dict:
+        return orjson.loads(self._docs_map[self._offs[doc]:self._offs[doc + 1]])
+
+    def uids_since(self, micros: int) -> set[bytes]:
+        return {self.uid(doc) for doc in range(self.docs) if self._time[doc] >= micros}
+
+    def release(self) -> None:
+        for view in (self._post, self._toff, self._offs, self._time, self._lens, self._ids, self._docs_map):
+            if isinstance(view, memoryview):
+                try:
+                    view.release()
+                except BufferError:
+                    pass  # still sliced somewhere; the map closes when that is collected
+
+    def delete(self) -> None:
+        self.release()
+        for suffix in self.SUFFIXES:
+            self.prefix.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def _write_segment(prefix: Path, parts, postings, dms, tokens: int, replaces: list[str] = ()) -> _Segment:
+    """Write a segment. `parts` yields runs of docs as (json rows, row end
+    offsets, created micros, lengths, 16-byte ids) buffers; `postings` yields
+    (term, sorted packed postings) in term order."""
+    files = {s: open(prefix.with_suffix(s), "wb") for s in (".docs", ".offs", ".time", ".lens", ".ids", ".post", ".toff")}
+    try:
+        count, base, max_time = 0, 0, 0
+        array.array("Q", [0]).tofile(files[".offs"])
+        for docs, ends, times, lens, ids in parts:
+            files[".docs"].write(docs)
+            array.array("Q", map(base.__add__, ends)).tofile(files[".offs"])
+            for suffix, data in ((".time", times), (".lens", lens), (".ids", ids)):
+                files[suffix].write(data)
+            count += len(lens)
+            base += len(docs)
+            max_time = max(max_time, max(times, default=0))
+        terms, toff, at = [], array.array("Q", [0]), 0
+        for term, packed in postings:
+            files[".post"].write(packed)
+            at += len(packed)
+            terms.append(term)
+            toff.append(at)
+        toff.tofile(files[".toff"])
+    finally:
+        for f in files.values():
+            f.close()
+    meta = {"docs": count, "tokens": tokens, "max_time": max_time, "terms": terms, "dms": dms, "replaces": list(replaces)}
+    tmp = prefix.with_suffix(".meta.tmp")
+    tmp.write_bytes(orjson.dumps(meta))
+    os.replace(tmp, prefix.with_suffix(".meta"))  # the segment exists once this lands
+    return _Segment(prefix)
+
+
+def _flush_live(prefix: Path, live: _Live) -> _Segment:
+    lines = [orjson.dumps({k: row.get(k) for k in DOC_FIELDS}) for row in live.rows]
+    part = (
+        b"".join(lines),
+        itertools.accumulate(map(len, lines)),
+        live.times,
+        live.lens,
+        b"".join(live.uids),
+    )
+    postings = ((term, array.array("Q", sorted(live.postings[term]))) for term in sorted(live.postings))
+    dms = [[conv, a, b] for conv, (a, b) in live.dms.items()]
+    return _write_segment(prefix, [part], postings, dms, live.tokens)
+
+
+def _merge_segments(prefix: Path, segments: list[_Segment]) -> _Segment:
+    shifts, base = [], 0
+    for segment in segments:
+        shifts.append(base << _TF_BITS)
+        base += segment.docs
+    parts = (
+        (s._docs_map, s._offs[1:], s._time, s._lens, s._ids)
+        for s in segments
+    )
+
+    def postings():
+        for term in sorted(set().union(*(s.terms for s in segments))):
+            runs = []
+            for segment, shift in zip(segments, shifts):
+                lo, hi = segment._span(term)
+                if lo < hi:
+                    runs.append(map(shift.__add__, segment._post[lo:hi]) if shift else segment._post[lo:hi])
+            if len(runs) == 1 and isinstance(runs[0], memoryview):
+                yield term, runs[0]
+            else:
+                # each run is sorted already, which timsort merges cheaply
+                yield term, array.array("Q", sorted(itertools.chain.from_iterable(runs)))
+
+    dms = {conv: (a, b) for segment in segments for conv, a, b in segment.dms}
+    return _write_segment(
+        prefix, parts, postings(), [[conv, a, b] for conv, (a, b) in dms.items()],
+        sum(s.tokens for s in segments), [s.prefix.name for s in segments],
+    )
+
+
+class MessageSearchIndex:
+    """Full-text index over message bodies behind /messages/search.
+
+    New messages go to an in-memory live segment, searchable immediately,
+    which is written out as an immutable segment file every
+    MESSAGE_SEARCH_FLUSH_INTERVAL seconds or once it holds
+    MESSAGE_SEARCH_SEGMENT_DOCS messages; segments of similar size are merged
+    MESSAGE_SEARCH_MERGE_FACTOR at a time in a background thread. Segment
+    files are memory-mapped, so resident memory is mostly the term
+    dictionaries. Posting lists are grouped per conversation and searches
+    take the conversations the caller may see, so results never leave them.
+
+    There is one index directory per node. The worker holding its writer
+    lock catches up from the database, flushes and merges; the others map the
+    same segment files, pick up new ones every REFRESH_INTERVAL and keep only
+    the messages not flushed yet in their live segment. When the writer exits
+    the next worker to get the lock catches up and carries on. Conversation
+    numbers are shared through conversations.log, appended to under a lock.
+
+    Matching is AND over the query's words, ranked by BM25 then recency. On
+    start the writer reads messages stored since the newest segment (or the
+    whole table, the first time); until that is flushed, callers search the
+    database.
+    """
+
+    def __init__(
+        self,
+        root: str | None = None,
+        segment_docs: int | None = None,
+        flush_interval: float | None = None,
+        merge_factor: int | None = None,
+        load_batch: int | None = None,
+    ):
+        settings = get_settings()
+        root = settings.message_search_dir if root is None else root
+        segment_docs = settings.message_search_segment_docs if segment_docs is None else segment_docs
+        flush_interval = settings.message_search_flush_interval if flush_interval is None else flush_interval
+        merge_factor = settings.message_search_merge_factor if merge_factor is None else merge_factor
+        load_batch = settings.message_search_load_batch if load_batch is None else load_batch
+        self.root = Path(root)
+        self.segment_docs = segment_docs
+        self.flush_interval = flush_interval
+        self.merge_factor = merge_factor
+        self.load_batch = load_batch
+        self.ready = False
+        self._convs: dict[str, int] = {}
+        self._conv_ids: list[str] = []
+        self._dms: dict[str, set[int]] = {}
+        self._segments: list[_Segment] = []
+        self._live = _Live()
+        self._flushing: list[_Live] = []
+        self._catch_up_ids: set[bytes] | None = None
+        # recently flushed messages; a reader drops them if pub/sub delivers them late
+        self._recent_ids: set[bytes] = set()
+        self._gen = 0
+        self._writer_fd: int | None = None
+        self._conv_fd: int | None = None
+        self._conv_log_pos = 0
+        self._full = asyncio.Event()
+        self._started = False
+        self._task: asyncio.Task | None = None
+
+    # --- lifecycle
+
+    @property
+    def writer(self) -> bool:
+        return self._writer_fd is not None
+
+    def open(self) -> None:
+        """Open the node's index directory, as its writer if no other worker is, and map its segments."""
+        # segments hold message bodies in plain text; keep them to this user
+        self.root.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.chmod(self.root, 0o700)
+        self._conv_fd = os.open(self.root / "conversations.log", os.O_RDWR | os.O_CREAT | os.O_APPEND)
+        self._claim_writer()
+        self._apply(*self._scan(self._live_since()))
+
+    def _claim_writer(self) -> bool:
+        """Take the writer lock if no live worker holds it; True if we did."""
+        fd = os.open(self.root / WRITER_LOCK, os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._writer_fd = fd
+        self._clean()
+        return True
+
+    def _clean(self) -> None:
+        names = {p.name.split(".")[0] for p in self.root.glob("seg-*")}
+        complete = {p.stem for p in self.root.glob("seg-*.meta")}
+        for orphan in names - complete:
+            orphan = self.root / orphan
+            for suffix in _Segment.SUFFIXES + (".meta.tmp",):
+                orphan.with_suffix(suffix).unlink(missing_ok=True)  # half-written when the last writer died
+        self._gen = max((int(name.split("-")[1]) for name in complete), default=self._gen)
+        for old in self.root.glob("shard-*"):
+            # per-worker copies from before workers shared one index
+            try:
+                fd = os.open(old / "lock", os.O_RDWR | os.O_CREAT)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(old, ignore_errors=True)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    def _live_since(self) -> int:
+        # flushed messages from here on may still be in a live segment or arrive late
+        recent = (datetime.now(timezone.utc) - CATCH_UP_MARGIN - _EPOCH) // timedelta(microseconds=1)
+        return min(min(self._live.times, default=recent), recent)
+
+    def _scan(self, since: int) -> tuple[list[_Segment], list[_Segment], set[bytes]]:
+        """Segments written since we last looked, loaded ones deleted since,
+        and the ids of messages from `since` on that the new segments hold."""
+        loaded = {s.prefix.name for s in self._segments}
+        added = []
+        for path in sorted(self.root.glob("seg-*.meta")):
+            if path.stem not in loaded:
+                try:
+                    added.append(_Segment(path.with_suffix("")))
+                except FileNotFoundError:
+                    pass  # merged away while we looked
+        gone = [s for s in self._segments if not s.prefix.with_suffix(".meta").exists()]
+        covered = set()
+        for segment in added:
+            # a merge of segments we had loaded holds nothing new
+            merged = segment.replaces and loaded.issuperset(segment.replaces)
+            if segment.max_time >= since and not merged:
+                covered |= segment.uids_since(since)
+        return added, gone, covered
+
+    def _apply(self, added: list[_Segment], gone: list[_Segment], covered: set[bytes]) -> None:
+        # segments only use conversation numbers logged before they were written
+        self._sync_conversations()
+        segments = [s for s in self._segments if s not in gone] + added
+        replaced = {name for s in segments for name in s.replaces}
+        stale = [s for s in segments if s.prefix.name in replaced]
+        self._segments = sorted((s for s in segments if s not in stale), key=lambda s: s.prefix.name)
+        for segment in added:
+            if segment not in stale:
+                self._learn_dms(segment.dms)
+        for segment in gone:
+            segment.release()
+        for segment in stale:
+            # merged before the last writer got to delete them
+            if self.writer:
+                segment.delete()
+            else:
+                segment.release()
+        self._recent_ids = covered
+        if covered & self._live.id_set:
+            live, self._live = self._live, _Live()
+            for i, row in enumerate(live.rows):
+                if live.uids[i] not in covered:
+                    self._live.add(row, self._convs[row["conversation_id"]], live.uids[i])
+
+    async def _follow(self) -> None:
+        """Pick up what the writer flushed or merged since we last looked."""
+        self._apply(*await asyncio.to_thread(self._scan, self._live_since()))
+        if not self.ready and (self.root / READY_FILE).exists():
+            self.ready = True
+            logger.info("message search index ready (%d messages, reading)", self.doc_count)
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.open)
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_published, prefix=SEARCH_CHANNEL)
+        await pubsub.subscribe(SEARCH_CHANNEL)
+        self._started = True
+        self._task = asyncio.create_task(self._run())
+
+    async def _read(self) -> None:
+        """Follow the writer's segments until we get to be the writer."""
+        while True:
+            took_over = self._claim_writer()
+            try:
+                await self._follow()
+            except Exception:
+                logger.exception("message search index refresh failed")
+            if took_over:
+                logger.info("message search index: this worker is now the writer")
+                return
+            await asyncio.sleep(REFRESH_INTERVAL)
+
+    async def _run(self) -> None:
+        if not self.writer:
+            await self._read()
+        try:
+            await self._catch_up()
+            await self.flush()
+        except Exception:
+            logger.exception("message search index load failed; searching the database instead")
+        else:
+            (self.root / READY_FILE).touch()
+            self.ready = True
+            logger.info("message search index ready (%d messages)", self.doc_count)
+        finally:
+            self._catch_up_ids = None
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("message search flush failed")
+
+    async def _catch_up(self) -> None:
+        after = None
+        newest = max((s.max_time for s in self._segments), default=None)
+        if newest is not None:
+            since = _EPOCH + timedelta(microseconds=newest) - CATCH_UP_MARGIN
+            micros = (since - _EPOCH) // timedelta(microseconds=1)
+            self._catch_up_ids = set()
+            for segment in self._segments:
+                if segment.max_time >= micros:
+                    self._catch_up_ids |= await asyncio.to_thread(segment.uids_since, micros)
+            after = (since.isoformat(), "00000000-0000-0000-0000-000000000000")
+        repos = await get_repositories()
+        while True:
+            rows = await repos.messages.scan(after, self.load_batch)
+            for row in rows:
+                self.add(row)
+            if len(self._live) >= self.segment_docs:
+                await self.flush()
+            if len(rows) < self.load_batch:
+                return
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conv_fd is not None:
+            if self.writer:
+                try:
+                    await self.flush()  # so a restart doesn't have to re-read them
+                except Exception:
+                    logger.exception("message search flush on shutdown failed")
+                os.close(self._writer_fd)
+                self._writer_fd = None
+            os.close(self._conv_fd)
+            self._conv_fd = None
+            for segment in self._segments:
+                segment.release()
+
+    # --- writes
+
+    async def _on_published(self, channel: str, payload: bytes) -> None:
+        for row in orjson.loads(payload):
+            self.add(row)
+
+    async def record_many(self, messages: list[dict]) -> None:
+        """Index a batch of stored messages on every worker, in one publish."""
+        rows = [{k: m.get(k) for k in DOC_FIELDS} for m in messages if m.get("conversation_id")]
+        if not rows:
+            return
+        if self._started:
+            await get_pubsub().publish(SEARCH_CHANNEL, orjson.dumps(rows))
+        else:
+            for row in rows:
+                self.add(row)
+
+    def add(self, row: dict) -> None:
+        """Index a message row holding just DOC_FIELDS, as `record_many` and the loader build."""
+        uid = _id_bytes(row["id"])
+        if uid in self._live.id_set or any(uid in live.id_set for live in self._flushing):
+            return
+        if self._catch_up_ids is not None and uid in self._catch_up_ids:
+            return
+        if uid in self._recent_ids:
+            return
+        conv = self._conv_number(row["conversation_id"])
+        self._live.add(row, conv, uid)
+        if row.get("receiver_id") and conv not in self._dms.get(row["sender_id"], ()):
+            self._learn_dms([(conv, row["sender_id"], row["receiver_id"])])
+        if len(self._live) >= self.segment_docs:
+            self._full.set()
+
+    def _conv_number(self, conversation_id: str) -> int:
+        n = self._convs.get(conversation_id)
+        if n is not None or self._conv_fd is None:
+            return n if n is not None else self._learn_conv(conversation_id)
+        # every worker on the node numbers conversations the same way: by their line in the log
+        fd = self._conv_fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            self._sync_conversations()
+            n = self._convs.get(conversation_id)
+            if n is None:
+                os.ftruncate(fd, self._conv_log_pos)  # a line torn by a crash was never used
+                line = conversation_id.encode() + b"\n"
+                os.write(fd, line)
+                self._conv_log_pos += len(line)
+                n = self._learn_conv(conversation_id)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return n
+
+    def _learn_conv(self, conversation_id: str) -> int:
+        n = self._convs[conversation_id] = len(self._conv_ids)
+        self._conv_ids.append(conversation_id)
+        return n
+
+    def _sync_conversations(self) -> None:
+        """Number the conversations other workers logged since we last read the log."""
+        size = os.fstat(self._conv_fd).st_size
+        if size <= self._conv_log_pos:
+            return
+        data = os.pread(self._conv_fd, size - self._conv_log_pos, self._conv_log_pos)
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            self._learn_conv(line.decode())
+        self._conv_log_pos += complete
+
+    def _learn_dms(self, pairs) -> None:
+        for conv, a, b in pairs:
+            self._dms.setdefault(a, set()).add(conv)
+            self._dms.setdefault(b, set()).add(conv)
+
+    async def flush(self) -> None:
+        """Write the live segment out, then merge if a size tier is full."""
+        live = self._live
+        if not len(live) or not self.writer:
+            return
+        self._live = _Live()
+        self._flushing.append(live)
+        self._gen += 1
+        try:
+            segment = await asyncio.to_thread(_flush_live, self.root / f"seg-{self._gen:08d}", live)
+        except Exception:
+            # keep its messages searchable and retry them with the next flush
+            self._flushing.remove(live)
+            for i, row in enumerate(live.rows):
+                self._live.add(row, self._convs[row["conversation_id"]], live.uids[i])
+            raise
+        self._segments.append(segment)
+        self._flushing.remove(live)
+        if self._catch_up_ids is not None:
+            self._catch_up_ids |= live.id_set
+        await self._merge()
+
+    def _tier(self, segment: _Segment) -> int:
+        # 0 up to segment_docs, 1 up to merge_factor times that, and so on
+        tier, size = 0, self.segment_docs
+        while segment.docs > size:
+            tier, size = tier + 1, size * self.merge_factor
+        return tier
+
+    async def _merge(self) -> None:
+        while True:
+            tiers: dict[int, list[_Segment]] = {}
+            for segment in self._segments:
+                tiers.setdefault(self._tier(segment), []).append(segment)
+            group = next((g for g in tiers.values() if len(g) >= self.merge_factor), None)
+            if group is None:
+                return
+            group = group[:self.merge_factor]
+            self._gen += 1
+            merged = await asyncio.to_thread(_merge_segments, self.root / f"seg-{self._gen:08d}", group)
+            at = self._segments.index(group[0])
+            self._segments = [s for s in self._segments if s not in group]
+            self._segments.insert(at, merged)
+            for segment in group:
+                segment.delete()
+
+    # --- reads
+
+    @property
+    def doc_count(self) -> int:
+        return sum(len(s) for s in self._searchable())
+
+    def _searchable(self) -> list:
+        return [*self._segments, *self._flushing, self._live]
+
+    def dm_conversations(self, user_id: str) -> list[str]:
+        """The DM conversations `user_id` has messages in (sent or received)."""
+        return [self._conv_ids[n] for n in self._dms.get(user_id, ())]
+
+    def search(
+        self,
+        q: str,
+        conversation_ids: Iterable[str],
+        limit: int,
+        cursor: tuple | None = None,
+    ) -> tuple[list[dict], tuple | None]:
+        """Messages in `conversation_ids` containing every word of `q`, best
+        first, each with "snippet", "highlights" and "score", and the cursor for
+        the next page (None when there isn't one)."""
+        terms = list(dict.fromkeys(tokenize(q)))[:MAX_QUERY_TERMS]
+        convs = sorted({self._convs[c] for c in conversation_ids if c in self._convs})
+        if not terms or not convs:
+            return [], None
+        if cursor is not None:
+            after = (-float(cursor[0]), -int(cursor[1]), bytes.fromhex(cursor[2]))
+        conv_set = set(convs)
+        segments = self._searchable()
+        total = sum(len(s) for s in segments) or 1
+        avgdl = (sum(s.tokens for s in segments) / total) or 1.0
+        idf = {}
+        for term in terms:
+            df = sum(s.df(term) for s in segments)
+            idf[term] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+        found = []
+        for segment in segments:
+            per_term = []
+            # rarest first, so the intersection starts small
+            for term in sorted(terms, key=segment.df):
+                matches = segment.matches(term, convs, conv_set)
+                if not matches:
+                    per_term = None
+                    break
+                per_term.append((idf[term], matches))
+            if not per_term:
+                continue
+            for doc in per_term[0][1]:
+                score = 0.0
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.length(doc) / avgdl)
+                for weight, matches in per_term:
+                    tf = matches.get(doc)
+                    if tf is None:
+                        break
+                    score += weight * tf * (BM25_K1 + 1) / (tf + norm)
+                else:
+                    key = (-round(score, 6), -segment.time(doc), segment.uid(doc))
+                    if cursor is None or key > after:
+                        found.append((key, segment, doc))
+
+        best = heapq.nsmallest(limit + 1, found, key=lambda f: f[0])
+        has_more = len(best) > limit
+        best = best[:limit]
+        items = []
+        for (score, _, _), segment, doc in best:
+            row = dict(segment.row(doc))
+            row["snippet"], row["highlights"] = snippet(row.get("body") or "", terms)
+            row["score"] = -score
+            items.append(row)
+        if not has_more or not best:
+            return items, None
+        score, micros, uid = best[-1][0]
+        return items, (-score, -micros, uid.hex())
+
+
+_index: MessageSearchIndex | None = None
+
+
+def get_message_search() -> MessageSearchIndex | None:
+    """The shared index, or None when MESSAGE_SEARCH is off."""
+    global _index
+    if _index is None and get_settings().message_search:
+        _index = MessageSearchIndex()
+    return _index
+
+
+async def index_messages(messages: list[dict]) -> None:
+    index = get_message_search()
+    if index is not None:
+        await index.record_many(messages)
@@ -0,0 +1,263 @@
+import bisect
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from app.core.config import get_settings
+
+# seconds; covers a cache hit (sub-ms) up to a DB call near DB_TIMEOUT
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        REGISTRY.register(self)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> list[str]: ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labels, k)} {_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram. observe() is a dict lookup, a bisect and
+    three increments; buckets are only summed up at scrape time."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum, count]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self) -> list[str]:
+        lines = []
+        names = self.labels + ("le",)
+        for labels, (counts, total, count) in self._series.items():
+            running = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Callback(_Metric):
+    """Gauge or counter read at scrape time, so the hot path pays nothing.
+    `read` returns a number, or {label values tuple: number}."""
+
+    def __init__(self, name: str, help: str, read: Callable, labels: tuple[str, ...] = (), kind: str = "gauge"):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self.read = read
+
+    def _samples(self) -> list[str]:
+        value = self.read()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{_labels(self.labels, k)} {_value(v)}" for k, v in value.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        # re-registering a name (e.g. a module reloaded) replaces the old one
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                continue  # a broken callback shouldn't take the whole scrape down
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"),
+)
+DB_LATENCY = Histogram("db_call_duration_seconds", "Supabase call latency", ("table", "op"))
+DB_ERRORS = Counter("db_call_errors_total", "Supabase calls that raised", ("table", "op"))
+SPANS = Histogram("span_duration_seconds", "Hot-path span latency", ("name",))
+FANOUT_SIZE = Histogram("broadcast_recipients", "Recipients per broadcast", buckets=SIZE_BUCKETS)
+FRAMES_DROPPED = Counter("ws_frames_dropped_total", "Outbound frames dropped by the slow-consumer policy", ("policy",))
+
+
+class span:
+    """Times a block into span_duration_seconds{name}:
+
+        with span("send_message"):
+            ...
+
+    Two clock reads and one histogram observe; nothing when METRICS_ENABLED is off.
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if get_settings().metrics_enabled:
+            SPANS.observe(time.perf_counter() - self.start, self.name)
+
+
+class timed:
+    """Like span, into any histogram: `with timed(DB_LATENCY, "auth", "get_user"):`."""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, *labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "timed":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if get_settings().metrics_enabled:
+            self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class InstrumentedClient:
+    """Supabase client proxy that times every query's execute() into
+    db_call_duration_seconds{table, op}. Builders are wrapped as they are
+    chained, so repositories keep using the client exactly as before."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str) -> "_Query":
+        return _Query(self._client.table(name), name, "select")
+
+    def rpc(self, fn: str, *args, **kwargs) -> "_Query":
+        return _Query(self._client.rpc(fn, *args, **kwargs), f"rpc:{fn}", "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# builder methods that decide what kind of call this is
+_OPS = frozenset(("select", "insert", "upsert", "update", "delete"))
+
+
+class _Query:
+    __slots__ = ("_builder", "_table", "_op")
+
+    def __init__(self, builder, table: str, op: str):
+        self._builder = builder
+        self._table = table
+        self._op = op
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        op = name if name in _OPS else self._op
+        if not callable(attr):
+            return _Query(attr, self._table, op) if hasattr(attr, "execute") else attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _Query(result, self._table, op) if hasattr(result, "execute") else result
+
+        return chained
+
+    async def execute(self):
+        start = time.perf_counter()
+        try:
+            return await self._builder.execute()
+        except Exception:
+            DB_ERRORS.inc(self._table, self._op)
+            raise
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, self._table, self._op)
+
+
+def instrument(client):
+    """Wrap a Supabase client for DB metrics (a no-op when METRICS_ENABLED is off)."""
+    if not get_settings().metrics_enabled or client is None or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording http_request_duration_seconds, labelled by
+    the matched route's path template so ids don't explode the label set."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], path, status)
@@ -0,0 +1,56 @@
+import zlib
+from typing import AsyncIterable, AsyncIterator
+
+# wbits for zlib: 16 + window writes/reads gzip; 32 + window auto-detects gzip or zlib
+_GZIP = 16 + zlib.MAX_WBITS
+_AUTO = 32 + zlib.MAX_WBITS
+
+
+class LineTooLong(ValueError):
+    def __init__(self, line: int, limit: int):
+        super().__init__(f"line {line} is longer than {limit} bytes")
+        self.line = line
+
+
+async def gzip_chunks(chunks: AsyncIterable[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Gzip a byte stream chunk by chunk (one gzip member, never fully buffered)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP)
+    async for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line: int, compressed: bool = False) -> AsyncIterator[tuple[int, bytes]]:
+    """(line number, line) for each non-blank line of an NDJSON byte stream,
+    optionally gzip/zlib-compressed, holding at most one partial line plus
+    the chunk being split in memory. Raises LineTooLong past `max_line` bytes."""
+    number, tail = 0, b""
+    async for data in (_decompressed(chunks, max_line) if compressed else chunks):
+        lines = (tail + data).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            number += 1
+            if len(line) > max_line:
+                raise LineTooLong(number, max_line)
+            if line.strip():
+                yield number, line
+        if len(tail) > max_line:
+            raise LineTooLong(number + 1, max_line)
+    if tail.strip():
+        yield number + 1, tail
+
+
+async def _decompressed(chunks: AsyncIterable[bytes], max_chunk: int) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(_AUTO)
+    async for chunk in chunks:
+        # bounded output per step, so a small upload can't expand into gigabytes at once
+        while chunk:
+            out = decompressor.decompress(chunk, max_chunk)
+            if out:
+                yield out
+            chunk = decompressor.unconsumed_tail
+    out = decompressor.flush()
+    if out:
+        yield out
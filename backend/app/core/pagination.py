@@ -0,0 +1,56 @@
+import base64
+import binascii
+import re
+import uuid
+from datetime import datetime
+
+import orjson
+
+# Python 3.10's fromisoformat takes only 3 or 6 fraction digits and no "Z", but
+# Postgres trims trailing zeros (10:00:00.12+00:00)
+_FRACTION = re.compile(r"\.(\d{1,6})\d*")
+
+
+def parse_timestamp(value: str) -> datetime:
+    """datetime.fromisoformat that also reads Postgres and RFC 3339 timestamps
+    on Python 3.10; raises ValueError like it."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    normalized = _FRACTION.sub(lambda m: "." + m.group(1).ljust(6, "0"), value, count=1)
+    if normalized[-1:] in ("Z", "z"):
+        normalized = normalized[:-1] + "+00:00"
+    return datetime.fromisoformat(normalized)
+
+
+def encode_cursor(*parts) -> str:
+    """Opaque, url-safe cursor for a keyset position, e.g. (created_at, id)."""
+    return base64.urlsafe_b64encode(orjson.dumps(parts)).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = orjson.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, orjson.JSONDecodeError, UnicodeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(parts, list) or len(parts) != size:
+        raise ValueError("invalid cursor")
+    return tuple(parts)
+
+
+def decode_keyset_cursor(cursor: str) -> tuple[str, str]:
+    """decode_cursor for a (timestamp, uuid) position. Both parts end up in
+    PostgREST filter expressions, so anything that isn't an ISO timestamp and
+    a UUID raises ValueError."""
+    created_at, row_id = decode_cursor(cursor, 2)
+    if not isinstance(created_at, str) or not isinstance(row_id, str):
+        raise ValueError("invalid cursor")
+    try:
+        parse_timestamp(created_at)
+        row_id = str(uuid.UUID(row_id))
+    except ValueError as e:
+        raise ValueError("invalid cursor") from e
+    return created_at, row_id
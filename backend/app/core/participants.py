@@ -0,0 +1,96 @@
+import orjson
+from app.core.cache import CoalescingCache
+from app.core.config import get_settings
+from app.core.pubsub import get_pubsub
+from app.core.repositories import Repositories
+
+# membership changes on any worker drop the cached lists on every worker
+INVALIDATE_CHANNEL = "chat:participants"
+
+ADMIN, MEMBER = "admin", "member"
+# unknown conversation ids are remembered this long, so probing ids stays cheap
+MISS_TTL = 5.0
+
+
+class ParticipantCache:
+    """Group membership reads shared across requests.
+
+    conversation -> {user_id: role} backs fan-out and permission checks on
+    every group message; user -> group ids backs the inbox and delta sync;
+    conversation -> DM pair backs the permission checks on DM reads (a
+    DM's users never change). Concurrent misses share one query. Every membership write calls
+    `invalidate`, which reaches all workers.
+    """
+
+    def __init__(self, maxsize: int | None = None, ttl: float | None = None):
+        settings = get_settings()
+        maxsize = settings.participant_cache_size if maxsize is None else maxsize
+        ttl = settings.participant_cache_ttl if ttl is None else ttl
+        self._members = CoalescingCache(maxsize=maxsize, ttl=ttl)
+        self._groups = CoalescingCache(maxsize=maxsize, ttl=ttl)
+        self._dms = CoalescingCache(maxsize=maxsize, ttl=ttl)
+        self._started = False
+
+    def cache_counts(self) -> dict[str, tuple[int, int]]:
+        return {
+            "participants": (self._members.hits, self._members.misses),
+            "participant_groups": (self._groups.hits, self._groups.misses),
+            "participant_dms": (self._dms.hits, self._dms.misses),
+        }
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_invalidate, prefix=INVALIDATE_CHANNEL)
+        await pubsub.subscribe(INVALIDATE_CHANNEL)
+        self._started = True
+
+    async def _on_invalidate(self, channel: str, payload: bytes) -> None:
+        event = orjson.loads(payload)
+        self._forget(event["conversation_id"], event["user_ids"])
+
+    async def invalidate(self, conversation_id: str, user_ids) -> None:
+        """Call after `user_ids` joined or left `conversation_id`."""
+        user_ids = list(user_ids)
+        if self._started:
+            await get_pubsub().publish(INVALIDATE_CHANNEL, orjson.dumps({
+                "conversation_id": conversation_id,
+                "user_ids": user_ids,
+            }))
+        else:
+            self._forget(conversation_id, user_ids)
+
+    def _forget(self, conversation_id: str, user_ids: list[str]) -> None:
+        self._members.pop(conversation_id)
+        for user_id in user_ids:
+            self._groups.pop(user_id)
+
+    async def members(self, repos: Repositories, conversation_id: str) -> dict[str, str]:
+        """{user_id: role} of a conversation; shared, so don't modify it."""
+        async def load() -> dict[str, str]:
+            rows = await repos.conversations.participants(conversation_id)
+            return {r["user_id"]: r.get("role") or MEMBER for r in rows}
+
+        return await self._members.get(conversation_id, load)
+
+    async def groups_of(self, repos: Repositories, user_id: str) -> list[str]:
+        return await self._groups.get(user_id, lambda: repos.conversations.group_ids_for(user_id))
+
+    async def dm_pair(self, repos: Repositories, conversation_id: str) -> tuple[str, str] | None:
+        """The two users of a DM; None for a group or an unknown id."""
+        async def load() -> tuple[str, str] | None:
+            conversation = await repos.conversations.get(conversation_id)
+            if not conversation or conversation.get("type") == "group":
+                return None
+            return conversation.get("user1_id"), conversation.get("user2_id")
+
+        return await self._dms.get(conversation_id, load, ttl=lambda pair: None if pair else MISS_TTL)
+
+
+_participants: ParticipantCache | None = None
+
+
+def get_participants() -> ParticipantCache:
+    global _participants
+    if _participants is None:
+        _participants = ParticipantCache()
+    return _participants
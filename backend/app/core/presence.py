@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Iterable
+
+import orjson
+from app.core.cache import TTLCache, get_redis
+from app.core.config import get_settings
+from app.core.connection_graph import ACCEPTED, get_connection_graph
+from app.core.participants import get_participants
+from app.core.pubsub import get_pubsub
+from app.core.repositories import Repositories
+from app.core.sockets import SocketConnection
+from app.core.wire import Frame, encode_event
+
+logger = logging.getLogger(__name__)
+
+# batches of presence changes; every worker delivers them to its own watchers
+PRESENCE_CHANNEL = "chat:presence"
+
+ONLINE, AWAY, OFFLINE = "online", "away", "offline"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _merge(statuses: Iterable[str]) -> str:
+    statuses = set(statuses)
+    if ONLINE in statuses:
+        return ONLINE
+    return AWAY if AWAY in statuses else OFFLINE
+
+
+class PresenceStore(ABC):
+    """Each worker's status for the users whose sockets it holds, merged
+    across workers, plus when each user was last seen."""
+
+    @abstractmethod
+    async def report(self, statuses: dict[str, str | None]) -> None:
+        """Record this worker's status per user; None once it holds no socket for them."""
+
+    @abstractmethod
+    async def lookup(self, user_ids: list[str]) -> dict[str, dict]:
+        """{user_id: {"status": ..., "last_seen": ...}} for every id."""
+
+
+class InProcessPresenceStore(PresenceStore):
+    """Single-process store; last_seen is forgotten after PRESENCE_LAST_SEEN_TTL."""
+
+    def __init__(self, users: int | None = None, ttl: float | None = None):
+        settings = get_settings()
+        users = settings.presence_users if users is None else users
+        ttl = settings.presence_last_seen_ttl if ttl is None else ttl
+        self._status: dict[str, str] = {}
+        self._last_seen = TTLCache(maxsize=users, ttl=ttl)
+
+    async def report(self, statuses: dict[str, str | None]) -> None:
+        now = _now()
+        for user_id, status in statuses.items():
+            if status is None:
+                self._status.pop(user_id, None)
+            else:
+                self._status[user_id] = status
+            self._last_seen.set(user_id, now)
+
+    async def lookup(self, user_ids: list[str]) -> dict[str, dict]:
+        return {
+            user_id: {"status": self._status.get(user_id, OFFLINE), "last_seen": self._last_seen.get(user_id)}
+            for user_id in user_ids
+        }
+
+
+class RedisPresenceStore(PresenceStore):
+    """Store shared by all workers: a hash per user with one "status|reported_at"
+    field per worker. The heartbeat re-reports every local user, so the field
+    a crashed worker left behind goes stale and stops counting."""
+
+    def __init__(
+        self,
+        client=None,
+        worker_id: str | None = None,
+        stale_after: float | None = None,
+        ttl: float | None = None,
+    ):
+        settings = get_settings()
+        stale_after = 3 * settings.ws_ping_interval if stale_after is None else stale_after
+        ttl = settings.presence_last_seen_ttl if ttl is None else ttl
+        if client is None:
+            client = get_redis()
+        self.client = client
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.stale_after = stale_after
+        self.ttl = int(ttl)
+
+    @staticmethod
+    def _keys(user_id: str) -> tuple[str, str]:
+        return f"chat:presence:{user_id}", f"chat:seen:{user_id}"
+
+    async def report(self, statuses: dict[str, str | None]) -> None:
+        if not statuses:
+            return
+        now, seen = time.time(), _now()
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, status in statuses.items():
+            key, seen_key = self._keys(user_id)
+            if status is None:
+                pipe.hdel(key, self.worker_id)
+            else:
+                pipe.hset(key, self.worker_id, f"{status}|{now}")
+                pipe.expire(key, int(self.stale_after) + 1)
+            pipe.set(seen_key, seen, ex=self.ttl)
+        await pipe.execute()
+
+    async def lookup(self, user_ids: list[str]) -> dict[str, dict]:
+        if not user_ids:
+            return {}
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            key, seen_key = self._keys(user_id)
+            pipe.hgetall(key)
+            pipe.get(seen_key)
+        results = await pipe.execute()
+        cutoff = time.time() - self.stale_after
+        found = {}
+        for i, user_id in enumerate(user_ids):
+            fields, seen = results[2 * i], results[2 * i + 1]
+            statuses = []
+            for value in fields.values():
+                if isinstance(value, bytes):
+                    value = value.decode()
+                status, _, reported_at = value.partition("|")
+                if float(reported_at or 0) >= cutoff:
+                    statuses.append(status)
+            if isinstance(seen, bytes):
+                seen = seen.decode()
+            found[user_id] = {"status": _merge(statuses), "last_seen": seen}
+        return found
+
+
+async def visible_to(repos: Repositories, user_id: str, user_ids: Iterable[str]) -> set[str]:
+    """The users among `user_ids` that `user_id` may see the presence of (and
+    send typing indicators to): accepted connections, people sharing a group
+    and DM partners."""
+    remaining = set(user_ids) - {user_id}
+    visible = {user_id} & set(user_ids)
+    if not remaining:
+        return visible
+    graph = get_connection_graph()
+    if graph is not None and graph.ready:
+        connected = {u for u in remaining if graph.are_connected(user_id, u)}
+    else:
+        rows = await repos.connections.list_for_user(user_id, ACCEPTED)
+        connected = {r["addressee_id"] if r["requester_id"] == user_id else r["requester_id"] for r in rows}
+        connected &= remaining
+    visible |= connected
+    remaining -= connected
+    if remaining:
+        participants = get_participants()
+        groups = await participants.groups_of(repos, user_id)
+        for members in await asyncio.gather(*(participants.members(repos, g) for g in groups)):
+            visible |= remaining & members.keys()
+        remaining -= visible
+    if remaining:
+        visible |= await repos.conversations.dm_partners(user_id, remaining)
+    return visible
+
+
+class Presence:
+    """Online / away / offline per user, pushed to the sockets watching them.
+
+    ws.py reports a user's status on this worker whenever it may have changed
+    (connect, disconnect, a client status frame, the idle sweep). Reports are
+    written to the store every PRESENCE_FLUSH_INTERVAL, and a user's change is
+    published at most once per PRESENCE_MIN_INTERVAL - a flapping connection
+    costs one event, not one per flap. A flush publishes all its changes as
+    one message, which each worker hands only to its own sockets that asked
+    to watch those users, so a popular user's change costs a dictionary
+    lookup per worker rather than a publish per follower.
+    """
+
+    def __init__(
+        self,
+        store: PresenceStore | None = None,
+        flush_interval: float | None = None,
+        min_interval: float | None = None,
+        max_watch: int | None = None,
+    ):
+        settings = get_settings()
+        flush_interval = settings.presence_flush_interval if flush_interval is None else flush_interval
+        min_interval = settings.presence_min_interval if min_interval is None else min_interval
+        max_watch = settings.presence_max_watch if max_watch is None else max_watch
+        if store is None:
+            store = RedisPresenceStore() if settings.pubsub_backend == "redis" else InProcessPresenceStore()
+        self.store = store
+        self.flush_interval = flush_interval
+        self.min_interval = min_interval
+        self.max_watch = max_watch
+        self._local: dict[str, str] = {}
+        self._dirty: set[str] = set()
+        self._deferred: set[str] = set()
+        # user -> (when, status) of the last change this worker published
+        self._published = TTLCache(maxsize=settings.presence_users, ttl=max(60.0, min_interval))
+        self._watchers: dict[str, set[SocketConnection]] = {}
+        self._watching: dict[SocketConnection, list[str]] = {}
+        self._started = False
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_published, prefix=PRESENCE_CHANNEL)
+        await pubsub.subscribe(PRESENCE_CHANNEL)
+        self._started = True
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("presence flush failed")
+
+    # --- reports from this worker
+
+    async def update(self, user_id: str, status: str | None) -> None:
+        """This worker's status for `user_id`: ONLINE, AWAY, or None when it holds no socket for them."""
+        if self._local.get(user_id) == status:
+            return
+        if status is None:
+            self._local.pop(user_id, None)
+        else:
+            self._local[user_id] = status
+        if self._started:
+            self._dirty.add(user_id)
+        else:
+            await self.store.report({user_id: status})
+
+    async def refresh(self) -> None:
+        """Re-report every local user, keeping them fresh in a shared store."""
+        await self.store.report(dict(self._local))
+
+    async def flush(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        users = list(dirty | self._deferred)
+        if not users:
+            return
+        await self.store.report({user_id: self._local.get(user_id) for user_id in dirty})
+        current = await self.store.lookup(users)
+        now = time.monotonic()
+        changes = []
+        self._deferred = set()
+        for user_id in users:
+            entry = current[user_id]
+            last = self._published.get(user_id)
+            if last is not None and last[1] == entry["status"]:
+                continue
+            if last is not None and now - last[0] < self.min_interval:
+                self._deferred.add(user_id)  # published on a later flush, as whatever it is by then
+                continue
+            self._published.set(user_id, (now, entry["status"]))
+            changes.append({"user_id": user_id, **entry})
+        if changes:
+            await get_pubsub().publish(PRESENCE_CHANNEL, orjson.dumps(changes))
+
+    # --- delivery to watching sockets
+
+    async def _on_published(self, channel: str, payload: bytes) -> None:
+        batches: dict[SocketConnection, list[dict]] = {}
+        for change in orjson.loads(payload):
+            for conn in self._watchers.get(change["user_id"], ()):
+                batches.setdefault(conn, []).append(change)
+        for conn, users in batches.items():
+            conn.send(Frame(encode_event({"type": "presence", "users": users})))
+
+    async def watch(self, conn: SocketConnection, user_ids: list[str]) -> list[dict]:
+        """Replace the users `conn` watches (up to max_watch); returns their presence now."""
+        self.unwatch(conn)
+        user_ids = list(dict.fromkeys(user_ids))[:self.max_watch]
+        if not user_ids:
+            return []
+        self._watching[conn] = user_ids
+        for user_id in user_ids:
+            self._watchers.setdefault(user_id, set()).add(conn)
+        return await self.lookup(user_ids)
+
+    def unwatch(self, conn: SocketConnection) -> None:
+        for user_id in self._watching.pop(conn, ()):
+            watchers = self._watchers.get(user_id)
+            if watchers is not None:
+                watchers.discard(conn)
+                if not watchers:
+                    del self._watchers[user_id]
+
+    async def lookup(self, user_ids: list[str]) -> list[dict]:
+        current = await self.store.lookup(list(dict.fromkeys(user_ids)))
+        return [{"user_id": user_id, **current[user_id]} for user_id in current]
+
+
+_presence: Presence | None = None
+
+
+def get_presence() -> Presence:
+    global _presence
+    if _presence is None:
+        _presence = Presence()
+    return _presence
@@ -0,0 +1,203 @@
+import asyncio
+from typing import Iterable
+
+from fastapi import Depends
+from app.core.cache import CoalescingCache, TTLCache
+from app.core.config import get_settings
+from app.core.pubsub import get_pubsub
+from app.core.repositories import Repositories, get_repositories
+
+# profile changes on any worker drop the entry everywhere
+INVALIDATE_CHANNEL = "chat:profiles"
+
+_MISSING = object()
+
+
+class ProfileCache:
+    """Profile reads shared across requests.
+
+    Holds ProfileBrief rows (id, username, first/last name) for enrichment,
+    full rows for by-id lookups and short-lived username search results.
+    Ids without a profile are remembered for a short while too, so lists that
+    mention deleted or not-yet-created users don't re-query them every time.
+    """
+
+    def __init__(
+        self,
+        maxsize: int | None = None,
+        ttl: float | None = None,
+        miss_ttl: float | None = None,
+        search_size: int | None = None,
+        search_ttl: float | None = None,
+    ):
+        settings = get_settings()
+        maxsize = settings.profile_cache_size if maxsize is None else maxsize
+        ttl = settings.profile_cache_ttl if ttl is None else ttl
+        miss_ttl = settings.profile_cache_miss_ttl if miss_ttl is None else miss_ttl
+        search_size = settings.profile_search_cache_size if search_size is None else search_size
+        search_ttl = settings.profile_search_cache_ttl if search_ttl is None else search_ttl
+        self.miss_ttl = miss_ttl
+        self.hits = 0
+        self.misses = 0
+        self.derived = 0
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._rows = CoalescingCache(maxsize=maxsize, ttl=ttl)
+        self._searches = CoalescingCache(maxsize=search_size, ttl=search_ttl)
+        self._started = False
+
+    def cache_counts(self) -> dict[str, tuple[int, int]]:
+        """(hits, misses) per cache, for /metrics."""
+        return {
+            "profile_briefs": (self.hits, self.misses),
+            "profile_rows": (self._rows.hits, self._rows.misses),
+            "profile_search": (self._searches.hits + self.derived, self._searches.misses),
+        }
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_invalidate, prefix=INVALIDATE_CHANNEL)
+        await pubsub.subscribe(INVALIDATE_CHANNEL)
+        self._started = True
+
+    async def _on_invalidate(self, channel: str, payload: bytes) -> None:
+        self._forget(payload.decode())
+
+    async def invalidate(self, user_id: str) -> None:
+        if self._started:
+            await get_pubsub().publish(INVALIDATE_CHANNEL, user_id.encode())
+        else:
+            self._forget(user_id)
+
+    def _forget(self, user_id: str) -> None:
+        self._cache.pop(user_id)
+        self._rows.pop(user_id)
+        # any cached search may list (or now should list) this user
+        self._searches.clear()
+
+    async def get(self, repos: Repositories, user_id: str) -> dict | None:
+        """Full profile row, or None if there isn't one."""
+        return await self._rows.get(
+            user_id,
+            lambda: repos.profiles.get(user_id),
+            ttl=lambda row: None if row else self.miss_ttl,
+        )
+
+    async def get_rows(self, repos: Repositories, user_ids: list[str]) -> list[dict]:
+        """Full profile rows for `user_ids`, in that order; ids without a profile are left out."""
+        found: dict[str, dict | None] = {}
+        missing = []
+        for user_id in user_ids:
+            row = self._rows.peek(user_id, _MISSING)
+            if row is _MISSING:
+                missing.append(user_id)
+            else:
+                found[user_id] = row
+        self._rows.hits += len(found)
+        self._rows.misses += len(missing)
+        if missing:
+            rows = {p["id"]: p for p in await repos.profiles.get_many(missing)}
+            for user_id in missing:
+                row = rows.get(user_id)
+                self._rows.set(user_id, row, ttl=None if row else self.miss_ttl)
+                found[user_id] = row
+        return [found[user_id] for user_id in user_ids if found[user_id]]
+
+    async def search(self, repos: Repositories, q: str, limit: int) -> list[dict]:
+        """repos.profiles.search_username, coalesced and briefly cached.
+
+        A search whose result came back short of `limit` holds every match,
+        so a longer query starting with it (the next keystroke) is answered
+        by filtering that result instead of querying again.
+        """
+        term = q.lower()
+        key = (term, limit)
+        if self._searches.peek(key) is None and not ("%" in term or "_" in term):
+            for k in range(len(term) - 1, 0, -1):
+                shorter = self._searches.peek((term[:k], limit))
+                if shorter is not None and len(shorter) < limit:
+                    rows = [r for r in shorter if term in (r.get("username") or "").lower()]
+                    self._searches.set(key, rows)
+                    self.derived += 1
+                    return rows
+        return await self._searches.get(key, lambda: repos.profiles.search_username(q, limit))
+
+    async def get_many(self, repos: Repositories, user_ids: Iterable[str]) -> dict[str, dict | None]:
+        found: dict[str, dict | None] = {}
+        missing = []
+        for user_id in user_ids:
+            brief = self._cache.get(user_id, _MISSING)
+            if brief is _MISSING:
+                missing.append(user_id)
+            else:
+                found[user_id] = brief
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            rows = {p["id"]: p for p in await repos.profiles.briefs(missing)}
+            for user_id in missing:
+                brief = rows.get(user_id)
+                self._cache.set(user_id, brief, ttl=None if brief else self.miss_ttl)
+                found[user_id] = brief
+        return found
+
+
+class ProfileLoader:
+    """Per-request batcher in front of ProfileCache.
+
+    Loads requested in the same event-loop tick (e.g. from asyncio.gather)
+    are answered by a single cache lookup / profiles query.
+    """
+
+    def __init__(self, repos: Repositories, cache: ProfileCache):
+        self.repos = repos
+        self.cache = cache
+        self._loaded: dict[str, dict | None] = {}
+        self._pending: dict[str, asyncio.Future] = {}
+
+    async def load(self, user_id: str) -> dict | None:
+        return (await self.load_many([user_id]))[user_id]
+
+    async def load_many(self, user_ids: Iterable[str]) -> dict[str, dict | None]:
+        loop = asyncio.get_running_loop()
+        result, waiting = {}, {}
+        for user_id in user_ids:
+            if user_id in self._loaded:
+                result[user_id] = self._loaded[user_id]
+                continue
+            fut = self._pending.get(user_id)
+            if fut is None:
+                if not self._pending:
+                    loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+                fut = self._pending[user_id] = loop.create_future()
+            waiting[user_id] = fut
+        for user_id, fut in waiting.items():
+            result[user_id] = await fut
+        return result
+
+    async def _dispatch(self) -> None:
+        batch, self._pending = self._pending, {}
+        try:
+            briefs = await self.cache.get_many(self.repos, batch)
+        except Exception as e:
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self._loaded.update(briefs)
+        for user_id, fut in batch.items():
+            if not fut.done():
+                fut.set_result(briefs.get(user_id))
+
+
+_cache: ProfileCache | None = None
+
+
+def get_profile_cache() -> ProfileCache:
+    global _cache
+    if _cache is None:
+        _cache = ProfileCache()
+    return _cache
+
+
+async def get_profile_loader(repos: Repositories = Depends(get_repositories)) -> ProfileLoader:
+    return ProfileLoader(repos, get_profile_cache())
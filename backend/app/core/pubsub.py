@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, bytes], Awaitable[None]]
+
+
+def user_channel(user_id: str) -> str:
+    return f"chat:user:{user_id}"
+
+
+def channel_user(channel: str) -> str:
+    return channel.rsplit(":", 1)[-1]
+
+
+class PubSub(ABC):
+    """Fan-out backbone between workers.
+
+    A worker subscribes to a user's channel while it holds at least one socket
+    for that user; publishers never need to know which worker that is.
+    """
+
+    def __init__(self):
+        self.handlers: dict[str, Handler] = {}
+        self.channels: set[str] = set()
+
+    def set_handler(self, handler: Handler, prefix: str = "chat:user:") -> None:
+        # one handler per channel family, e.g. per-user delivery vs cache sync
+        self.handlers[prefix] = handler
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: bytes) -> None: ...
+
+    async def subscribe(self, channel: str) -> None:
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str) -> None:
+        self.channels.discard(channel)
+
+    async def close(self) -> None:
+        self.channels.clear()
+
+    async def _dispatch(self, channel: str, payload: bytes) -> None:
+        handler = next((h for prefix, h in self.handlers.items() if channel.startswith(prefix)), None)
+        if handler is None:
+            return
+        try:
+            await handler(channel, payload)
+        except Exception:
+            logger.exception("pubsub handler failed for %s", channel)
+
+
+class InProcessPubSub(PubSub):
+    """Single-process backbone: publish delivers straight to local subscribers."""
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        if channel in self.channels:
+            await self._dispatch(channel, payload)
+
+
+class RedisPubSub(PubSub):
+    """Backbone over the Redis PUBLISH/SUBSCRIBE protocol.
+
+    `client` is any redis.asyncio-compatible client, so tests can pass a
+    local fake such as fakeredis.aioredis.FakeRedis().
+    """
+
+    def __init__(self, client=None, url: str | None = None):
+        settings = get_settings()
+        url = settings.redis_url if url is None else url
+        super().__init__()
+        if client is None:
+            import redis.asyncio as redis  # optional dependency
+            client = redis.from_url(url)
+        self.client = client
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._listener: asyncio.Task | None = None
+
+    async def publish(self, channel: str, payload: bytes) -> None:
+        await self.client.publish(channel, payload)
+
+    async def subscribe(self, channel: str) -> None:
+        if channel in self.channels:
+            return
+        await super().subscribe(channel)
+        await self._pubsub.subscribe(channel)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def unsubscribe(self, channel: str) -> None:
+        if channel not in self.channels:
+            return
+        await super().unsubscribe(channel)
+        await self._pubsub.unsubscribe(channel)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("redis pubsub read failed, retrying")
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            channel, data = message["channel"], message["data"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            if isinstance(data, str):
+                data = data.encode()
+            await self._dispatch(channel, data)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self._pubsub.aclose()
+        await self.client.aclose()
+        await super().close()
+
+
+_pubsub: PubSub | None = None
+
+
+def get_pubsub() -> PubSub:
+    global _pubsub
+    if _pubsub is None:
+        _pubsub = RedisPubSub() if get_settings().pubsub_backend == "redis" else InProcessPubSub()
+    return _pubsub
+
+
+def set_pubsub(pubsub: PubSub | None) -> None:
+    global _pubsub
+    _pubsub = pubsub
+
+
+async def close_pubsub() -> None:
+    global _pubsub
+    if _pubsub is not None:
+        await _pubsub.close()
+        _pubsub = None
@@ -0,0 +1,26 @@
+import time
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, bursts of up to `burst`.
+
+    Refilled lazily on each check, so it costs a clock read and a few float
+    operations - cheap enough for every inbound frame.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def allow(self, cost: float = 1.0) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
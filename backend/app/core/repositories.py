@@ -0,0 +1,450 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from app.core.metrics import DB_LATENCY, instrument, timed
+from app.core.supabase_client import get_async_supabase, get_async_auth_client
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+PROFILE_BRIEF_COLUMNS = "id, username, first_name, last_name"
+INBOX_COLUMNS = ("id, type, title, is_request, user1_id, user2_id, "
+                 "last_message_id, last_message_at, last_message_preview, last_sender_id")
+# ids per in.() filter; each one is ~40 bytes of request URL
+IN_FILTER_IDS = 100
+
+
+def _first(res):
+    return res.data[0] if res and res.data else None
+
+
+def _keyset(cursor: tuple[str, str], newer: bool, column: str = "created_at") -> str:
+    # (column, id) > / < cursor, as the body of a PostgREST or() filter
+    value, row_id = cursor
+    op = "gt" if newer else "lt"
+    return f'{column}.{op}."{value}",and({column}.eq."{value}",id.{op}.{row_id})'
+
+
+class _Repository:
+    table: str = ""
+
+    def __init__(self, client: "AsyncClient"):
+        self.client = client
+
+    def _q(self):
+        return self.client.table(self.table)
+
+
+class AuthRepository:
+    def __init__(self, client: "AsyncClient", auth_client: "AsyncClient"):
+        self.client = client
+        self.auth_client = auth_client
+
+    async def sign_up(self, email: str, password: str):
+        with timed(DB_LATENCY, "auth", "sign_up"):
+            return await self.auth_client.auth.sign_up({"email": email, "password": password})
+
+    async def sign_in(self, email: str, password: str):
+        with timed(DB_LATENCY, "auth", "sign_in"):
+            return await self.auth_client.auth.sign_in_with_password({"email": email, "password": password})
+
+    async def get_user(self, token: str):
+        with timed(DB_LATENCY, "auth", "get_user"):
+            return (await self.client.auth.get_user(token)).user
+
+
+class ProfileRepository(_Repository):
+    table = "profiles"
+
+    async def get(self, user_id: str) -> dict | None:
+        return _first(await self._q().select("*").eq("id", user_id).limit(1).execute())
+
+    async def exists(self, user_id: str) -> bool:
+        res = await self._q().select("id").eq("id", user_id).limit(1).execute()
+        return bool(res.data)
+
+    async def insert(self, data: dict) -> dict | None:
+        return _first(await self._q().insert(data).execute())
+
+    async def upsert(self, data: dict) -> dict | None:
+        return _first(await self._q().upsert(data, on_conflict="id").execute())
+
+    async def update(self, user_id: str, updates: dict) -> dict | None:
+        return _first(await self._q().update(updates).eq("id", user_id).execute())
+
+    async def search_username(self, q: str, limit: int) -> list[dict]:
+        res = await self._q().select("*").ilike("username", f"%{q}%").limit(limit).execute()
+        return res.data or []
+
+    async def get_many(self, user_ids) -> list[dict]:
+        res = await self._q().select("*").in_("id", list(user_ids)).execute()
+        return res.data or []
+
+    async def scan(self, after: str | None, limit: int) -> list[dict]:
+        # every profile in id order, a page at a time (search index load)
+        q = self._q().select(PROFILE_BRIEF_COLUMNS).order("id").limit(limit)
+        if after:
+            q = q.gt("id", after)
+        return (await q.execute()).data or []
+
+    async def briefs(self, user_ids) -> list[dict]:
+        res = await self._q().select(PROFILE_BRIEF_COLUMNS).in_("id", list(user_ids)).execute()
+        return res.data or []
+
+
+class ConnectionRepository(_Repository):
+    table = "connections"
+
+    async def insert(self, requester_id: str, addressee_id: str) -> dict | None:
+        res = await self._q().insert({
+            "requester_id": requester_id,
+            "addressee_id": addressee_id,
+        }).execute()
+        return _first(res)
+
+    async def get(self, connection_id: str) -> dict | None:
+        return _first(await self._q().select("*").eq("id", connection_id).limit(1).execute())
+
+    async def get_between(self, a: str, b: str) -> dict | None:
+        res = await (
+            self._q()
+            .select("*")
+            .or_(f"and(requester_id.eq.{a},addressee_id.eq.{b}),and(requester_id.eq.{b},addressee_id.eq.{a})")
+            .limit(1)
+            .execute()
+        )
+        return _first(res)
+
+    async def list_for_user(self, user_id: str, status: str | None = None) -> list[dict]:
+        q = self._q().select("*").or_(f"requester_id.eq.{user_id},addressee_id.eq.{user_id}")
+        if status:
+            q = q.eq("status", status)
+        return (await q.execute()).data or []
+
+    async def set_status(self, connection_id: str, status: str) -> dict | None:
+        return _first(await self._q().update({"status": status}).eq("id", connection_id).execute())
+
+    async def page_for_user(self, user_id: str, status: str | None, limit: int, after: str | None) -> list[dict]:
+        # id order, like the connection graph, so cursors work against either
+        q = self._q().select("*").or_(f"requester_id.eq.{user_id},addressee_id.eq.{user_id}")
+        if status:
+            q = q.eq("status", status)
+        if after:
+            q = q.gt("id", after)
+        return (await q.order("id").limit(limit).execute()).data or []
+
+    async def list_for_users(self, user_ids, status: str | None = None) -> list[dict]:
+        user_ids = list(user_ids)
+        chunks = await asyncio.gather(*(
+            self._list_for_users(user_ids[i:i + IN_FILTER_IDS], status)
+            for i in range(0, len(user_ids), IN_FILTER_IDS)
+        ))
+        if len(chunks) == 1:
+            return chunks[0]
+        # a connection between users in two chunks comes back from both
+        return list({row["id"]: row for rows in chunks for row in rows}.values())
+
+    async def _list_for_users(self, user_ids: list[str], status: str | None) -> list[dict]:
+        ids = ",".join(user_ids)
+        q = self._q().select("*").or_(f"requester_id.in.({ids}),addressee_id.in.({ids})")
+        if status:
+            q = q.eq("status", status)
+        return (await q.execute()).data or []
+
+    async def scan(self, after: str | None, limit: int) -> list[dict]:
+        # every connection in id order, a page at a time (connection graph load)
+        q = self._q().select("id,requester_id,addressee_id,status").order("id").limit(limit)
+        if after:
+            q = q.gt("id", after)
+        return (await q.execute()).data or []
+
+
+class ConversationRepository(_Repository):
+    table = "conversations"
+
+    async def get_by_dm_pair(self, pair: str) -> dict | None:
+        return _first(await self._q().select("*").eq("dm_pair", pair).limit(1).execute())
+
+    async def insert(self, data: dict) -> dict | None:
+        return _first(await self._q().insert(data).execute())
+
+    async def get(self, conversation_id: str) -> dict | None:
+        return _first(await self._q().select("*").eq("id", conversation_id).limit(1).execute())
+
+    async def find_between(self, a: str, b: str) -> dict | None:
+        res = await (
+            self._q()
+            .select("id")
+            .or_(f"and(user1_id.eq.{a},user2_id.eq.{b}),and(user1_id.eq.{b},user2_id.eq.{a})")
+            .limit(1)
+            .execute()
+        )
+        return _first(res)
+
+    async def add_participants(self, conversation_id: str, user_ids, role: str | None = None) -> list[dict]:
+        rows = [{"conversation_id": conversation_id, "user_id": uid} for uid in user_ids]
+        if role is not None:
+            for row in rows:
+                row["role"] = role
+        return (await self.client.table("conversation_participants").insert(rows).execute()).data or []
+
+    async def participants(self, conversation_id: str) -> list[dict]:
+        res = await (
+            self.client.table("conversation_participants")
+            .select("user_id, role")
+            .eq("conversation_id", conversation_id)
+            .execute()
+        )
+        return res.data or []
+
+    async def remove_participant(self, conversation_id: str, user_id: str) -> dict | None:
+        res = await (
+            self.client.table("conversation_participants")
+            .delete()
+            .eq("conversation_id", conversation_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+        return _first(res)
+
+    async def group_ids_for(self, user_id: str) -> list[str]:
+        """Ids of the group conversations the user belongs to."""
+        res = await (
+            self.client.table("conversation_participants")
+            .select("conversation_id")
+            .eq("user_id", user_id)
+            .execute()
+        )
+        ids = [r["conversation_id"] for r in res.data or []]
+        if not ids:
+            return []
+        res = await self._q().select("id").in_("id", ids).eq("type", "group").execute()
+        return [r["id"] for r in res.data or []]
+
+    async def dm_ids_for(self, user_id: str) -> list[str]:
+        """Ids of the direct conversations the user is one side of."""
+        res = await (
+            self._q()
+            .select("id")
+            .or_(f"user1_id.eq.{user_id},user2_id.eq.{user_id}")
+            .execute()
+        )
+        return [r["id"] for r in res.data or []]
+
+    async def dm_partners(self, user_id: str, other_ids) -> set[str]:
+        """The users among `other_ids` that have a direct conversation with `user_id`."""
+        other_ids = list(other_ids)
+        chunks = await asyncio.gather(*(
+            self._dm_partners(user_id, other_ids[i:i + IN_FILTER_IDS])
+            for i in range(0, len(other_ids), IN_FILTER_IDS)
+        ))
+        return set().union(*chunks)
+
+    async def _dm_partners(self, user_id: str, other_ids: list[str]) -> set[str]:
+        ids = ",".join(other_ids)
+        res = await (
+            self._q()
+            .select("user1_id,user2_id")
+            .or_(f"and(user1_id.eq.{user_id},user2_id.in.({ids})),and(user2_id.eq.{user_id},user1_id.in.({ids}))")
+            .execute()
+        )
+        return {r["user2_id"] if r["user1_id"] == user_id else r["user1_id"] for r in res.data or []}
+
+    async def inbox_page(self, user_id: str, limit: int, cursor: tuple[str, str] | None = None,
+                         group_ids=()) -> list[dict]:
+        """Conversations with messages, latest activity first; limit + 1 rows.
+        DMs are found by user1_id / user2_id, groups are passed in."""
+        sides = [f"user1_id.eq.{user_id}", f"user2_id.eq.{user_id}"]
+        if group_ids:
+            sides.append(f"id.in.({','.join(group_ids)})")
+        q = (self._q()
+            .select(INBOX_COLUMNS)
+            .or_(",".join(sides))
+            .not_.is_("last_message_at", "null"))
+        if cursor:
+            q = q.or_(_keyset(cursor, newer=False, column="last_message_at"))
+        q = q.order("last_message_at", desc=True).order("id", desc=True).limit(limit + 1)
+        return (await q.execute()).data or []
+
+    async def recently_active(self, limit: int) -> list[dict]:
+        """The conversations with the latest messages, across all users."""
+        res = await (
+            self._q()
+            .select(INBOX_COLUMNS)
+            .not_.is_("last_message_at", "null")
+            .order("last_message_at", desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return res.data or []
+
+    async def read_pointers(self, user_id: str, conversation_ids) -> list[dict]:
+        res = await (
+            self.client.table("conversation_participants")
+            .select("conversation_id, last_read_message_id, last_read_at")
+            .eq("user_id", user_id)
+            .in_("conversation_id", list(conversation_ids))
+            .execute()
+        )
+        return res.data or []
+
+    async def get_read_pointer(self, conversation_id: str, user_id: str) -> dict | None:
+        res = await (
+            self.client.table("conversation_participants")
+            .select("conversation_id, user_id, last_read_message_id, last_read_at")
+            .eq("conversation_id", conversation_id)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+        return _first(res)
+
+    async def set_read_pointer(self, pointer: dict) -> dict | None:
+        # one row per (conversation, user); created on first read if missing
+        res = await (
+            self.client.table("conversation_participants")
+            .upsert(pointer, on_conflict="conversation_id,user_id")
+            .execute()
+        )
+        return _first(res)
+
+
+class MessageRepository(_Repository):
+    table = "messages"
+
+    async def insert(self, row: dict) -> dict | None:
+        return _first(await self._q().insert(row).execute())
+
+    async def get(self, message_id: str) -> dict | None:
+        return _first(await self._q().select("*").eq("id", message_id).limit(1).execute())
+
+    async def insert_many(self, rows: list[dict]) -> list[dict]:
+        # rows carry their own ids; ignoring duplicates makes replays idempotent
+        res = await self._q().upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+        return res.data or []
+
+    async def history_between(self, a: str, b: str, limit: int, before: str | None = None) -> list[dict]:
+        filter_pair = f"and(sender_id.eq.{a},receiver_id.eq.{b})"
+        filter_pair_rev = f"and(sender_id.eq.{b},receiver_id.eq.{a})"
+        q = self._q().select("*").or_(f"{filter_pair},{filter_pair_rev}").order("created_at", desc=True).limit(limit)
+        if before:
+            q = q.lt("created_at", before)
+        return (await q.execute()).data or []
+
+    async def history(self, conversation_id: str, limit: int, before: str | None = None) -> list[dict]:
+        q = (self._q()
+            .select("*")
+            .eq("conversation_id", conversation_id)
+            .order("created_at", desc=True)
+            .limit(limit))
+        if before:
+            q = q.lt("created_at", before)
+        return (await q.execute()).data or []
+
+    async def page(self, conversation_id: str, limit: int, cursor: tuple[str, str] | None = None, newer: bool = False) -> list[dict]:
+        """Keyset page ordered by (created_at, id); fetches limit + 1 rows so callers can tell if there's more."""
+        q = self._q().select("*").eq("conversation_id", conversation_id)
+        if cursor:
+            q = q.or_(_keyset(cursor, newer))
+        return await self._ordered(q, limit, newer)
+
+    async def page_between(self, a: str, b: str, limit: int, cursor: tuple[str, str] | None = None, newer: bool = False) -> list[dict]:
+        pairs = [f"and(sender_id.eq.{a},receiver_id.eq.{b})", f"and(sender_id.eq.{b},receiver_id.eq.{a})"]
+        q = self._q().select("*").or_(",".join(pairs))
+        if cursor:
+            # a second or= parameter, ANDed with the pair filter by PostgREST
+            q = q.or_(_keyset(cursor, newer))
+        return await self._ordered(q, limit, newer)
+
+    async def since_for_user(self, user_id: str, limit: int, cursor: tuple[str, str] | None = None,
+                             group_ids=()) -> list[dict]:
+        """Everything the user sent or received after the cursor, oldest first (delta sync)."""
+        sides = [f"sender_id.eq.{user_id}", f"receiver_id.eq.{user_id}"]
+        if group_ids:
+            sides.append(f"conversation_id.in.({','.join(group_ids)})")
+        q = self._q().select("*").or_(",".join(sides))
+        if cursor:
+            # a second or= parameter, ANDed with the first by PostgREST
+            q = q.or_(_keyset(cursor, newer=True))
+        return await self._ordered(q, limit, newer=True)
+
+    async def scan(self, after: tuple[str, str] | None, limit: int) -> list[dict]:
+        # every message in (created_at, id) order, a page at a time (search index load)
+        q = self._q().select("id,conversation_id,sender_id,receiver_id,created_at,body")
+        if after:
+            q = q.or_(_keyset(after, newer=True))
+        q = q.order("created_at").order("id").limit(limit)
+        return (await q.execute()).data or []
+
+    async def search_body(self, conversation_ids, q: str, limit: int) -> list[dict]:
+        """Newest messages in the conversations whose body contains `q` (search fallback)."""
+        res = await (
+            self._q()
+            .select("*")
+            .in_("conversation_id", list(conversation_ids))
+            .ilike("body", f"%{q}%")
+            .order("created_at", desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return res.data or []
+
+    async def _ordered(self, q, limit: int, newer: bool) -> list[dict]:
+        q = q.order("created_at", desc=not newer).order("id", desc=not newer).limit(limit + 1)
+        return (await q.execute()).data or []
+
+    async def count_unread(self, conversation_id: str, user_id: str, cursor: tuple[str, str] | None = None) -> int:
+        """Messages from others after the read pointer (cursor = (created_at, id))."""
+        q = (self._q()
+            .select("id", count="exact", head=True)
+            .eq("conversation_id", conversation_id)
+            .neq("sender_id", user_id))
+        if cursor:
+            q = q.or_(_keyset(cursor, newer=True))
+        return (await q.execute()).count or 0
+
+    async def mark_read(self, message_id: str, receiver_id: str) -> dict | None:
+        res = await (
+            self._q()
+            .update({"read": True})
+            .eq("id", message_id)
+            .eq("receiver_id", receiver_id)  # only receiver can mark as read
+            .execute()
+        )
+        return _first(res)
+
+
+class Repositories:
+    def __init__(self, client: "AsyncClient", auth_client: "AsyncClient | None" = None):
+        # every table call is timed per table / operation (app/core/metrics.py)
+        client = instrument(client)
+        self.client = client
+        self.auth = AuthRepository(client, auth_client or client)
+        self.profiles = ProfileRepository(client)
+        self.connections = ConnectionRepository(client)
+        self.conversations = ConversationRepository(client)
+        self.messages = MessageRepository(client)
+
+    async def open_connections(self, count: int) -> None:
+        """Run `count` trivial queries at once so the pool holds that many
+        open keep-alive connections."""
+        await asyncio.gather(*(
+            self.client.table("profiles").select("id").limit(1).execute() for _ in range(count)
+        ))
+
+
+_repositories: Repositories | None = None
+
+
+async def get_repositories() -> Repositories:
+    global _repositories
+    if _repositories is None:
+        client, auth_client = await asyncio.gather(get_async_supabase(), get_async_auth_client())
+        _repositories = Repositories(client, auth_client)
+    return _repositories
+
+
+def set_repositories(repos: Repositories | None) -> None:
+    # lets benchmarks and local tooling swap in a different client
+    global _repositories
+    _repositories = repos
@@ -1,19 +1,143 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
+import httpx
+import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import Client
-from app.core.supabase_client import get_supabase
+from app.core.cache import TTLCache
+from app.core.config import get_settings
+from app.core.metrics import span
+from app.core.repositories import Repositories, get_repositories
 
 bearer = HTTPBearer(auto_error=True)
 
+ALLOWED_ALGORITHMS = ("HS256", "RS256", "ES256")
+# don't refetch JWKS more often than this when tokens carry an unknown kid
+JWKS_MIN_REFRESH = 30.0
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    id: str
+    email: str | None = None
+    role: str | None = None
+
+
+@lru_cache(maxsize=1)
+def _user_cache() -> TTLCache:
+    # token -> AuthUser, bounded and never outliving the token's own exp
+    settings = get_settings()
+    return TTLCache(maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl)
+
+_jwks: dict[str, jwt.PyJWK] = {}
+_jwks_fetched_at = 0.0
+_jwks_lock = asyncio.Lock()
+
+
+async def _refresh_jwks(force: bool = False):
+    global _jwks_fetched_at
+    async with _jwks_lock:
+        # another request may have refreshed while we waited for the lock
+        if not force and time.monotonic() - _jwks_fetched_at < JWKS_MIN_REFRESH:
+            return
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                resp = await client.get(f"{get_settings().supabase_url}/auth/v1/.well-known/jwks.json")
+                resp.raise_for_status()
+            keys = jwt.PyJWKSet.from_dict(resp.json()).keys
+        except (httpx.HTTPError, ValueError, jwt.PyJWKSetError):
+            keys = None  # keep serving the keys we already have
+        if keys is not None:
+            _jwks.clear()
+            _jwks.update({k.key_id: k for k in keys if k.key_id})
+        _jwks_fetched_at = time.monotonic()
+
+
+async def warm_jwks() -> None:
+    """Fetch the signing keys ahead of the first asymmetric token (startup warmup)."""
+    settings = get_settings()
+    if settings.auth_local_verify and not settings.supabase_jwt_secret:
+        await _refresh_jwks(force=True)
+
+
+async def _signing_key(header: dict):
+    alg = header.get("alg")
+    if alg == "HS256":
+        return get_settings().supabase_jwt_secret
+    kid = header.get("kid")
+    if alg not in ALLOWED_ALGORITHMS or not kid:
+        return None
+    stale = time.monotonic() - _jwks_fetched_at > get_settings().jwks_cache_ttl
+    if stale or kid not in _jwks:
+        await _refresh_jwks(force=stale)
+    key = _jwks.get(kid)
+    return key.key if key else None
+
+
+async def _verify_locally(token: str) -> dict | None:
+    """Return verified claims, or None when the token can't be checked in-process.
+
+    Raises jwt.InvalidTokenError for tokens that are checkable but bad.
+    """
+    settings = get_settings()
+    if not settings.auth_local_verify:
+        return None
+    header = jwt.get_unverified_header(token)
+    key = await _signing_key(header)
+    if key is None:
+        return None
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[header["alg"]],
+        audience=settings.supabase_jwt_audience,
+        options={"require": ["exp", "sub"]},
+    )
+
+
+def _unverified_exp(token: str) -> float:
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+        return float(claims.get("exp", 0))
+    except (jwt.InvalidTokenError, TypeError, ValueError):
+        return 0.0
+
+
 async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(bearer),
-    supabase: Client = Depends(get_supabase),
+    repos: Repositories = Depends(get_repositories),
 ):
-    token = creds.credentials
+    with span("get_current_user"):
+        return await authenticate(creds.credentials, repos)
+
+
+async def authenticate(token: str, repos: Repositories) -> AuthUser:
+    """The user a bearer token belongs to; raises HTTPException(401) if none."""
+    user = _user_cache().get(token)
+    if user is not None:
+        return user
+
     try:
-        user = supabase.auth.get_user(token).user
-    except Exception:
+        claims = await _verify_locally(token)
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    if not user:
-        raise HTTPException(status_code=401, detail="Unauthenticated")
+
+    if claims is not None:
+        user = AuthUser(id=claims["sub"], email=claims.get("email"), role=claims.get("role"))
+        expires_at = float(claims["exp"])
+    else:
+        # fall back to asking Supabase Auth
+        try:
+            remote = await repos.auth.get_user(token)
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        if not remote:
+            raise HTTPException(status_code=401, detail="Unauthenticated")
+        user = AuthUser(id=remote.id, email=remote.email, role=remote.role)
+        expires_at = _unverified_exp(token)
+
+    _user_cache().set(token, user, ttl=min(get_settings().auth_cache_ttl, expires_at - time.time()))
     return user  # has .id, .email, etc.
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+from fastapi import WebSocket
+from app.core.config import get_settings
+from app.core.metrics import FRAMES_DROPPED
+from app.core.wire import Frame
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_POLICIES = ("drop", "coalesce", "disconnect")
+# 1013 "try again later": the client fell too far behind
+CLOSE_SLOW_CONSUMER = 1013
+
+
+class SocketConnection:
+    """A WebSocket with its own bounded outbound queue and writer task.
+
+    `send` never awaits the network, so one slow client can't hold up
+    delivery to anyone else. When the queue is full the slow-consumer policy
+    decides what happens:
+
+    - drop: discard the new frame
+    - coalesce: replace a queued frame with the same key, else discard the oldest
+    - disconnect: close the socket so the client reconnects and resyncs
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        websocket: WebSocket,
+        on_dead: Callable[["SocketConnection"], Awaitable[None]] | None = None,
+        maxsize: int | None = None,
+        policy: str | None = None,
+        send_timeout: float | None = None,
+        wire_format: str = "json",
+    ):
+        settings = get_settings()
+        maxsize = settings.ws_send_queue_size if maxsize is None else maxsize
+        policy = settings.ws_slow_consumer_policy if policy is None else policy
+        send_timeout = settings.ws_send_timeout if send_timeout is None else send_timeout
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"unknown slow consumer policy {policy!r}")
+        self.user_id = user_id
+        self.websocket = websocket
+        self.on_dead = on_dead
+        self.maxsize = maxsize
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.wire_format = wire_format
+        self.dropped = 0
+        self.closed = False
+        self._queue: deque[tuple[Hashable | None, Frame]] = deque()
+        self._ready = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._watchdog: asyncio.TimerHandle | None = None
+        self._busy = False
+        self._stalled = False
+        self._progress = 0.0
+        self._held: list[tuple[Hashable | None, Frame]] | None = None
+        # inbound side, for the heartbeat sweep and presence
+        self.last_recv = self.last_active = time.monotonic()
+        self.away = False
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._writer = self._loop.create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def touch(self, active: bool = True) -> None:
+        """Note an inbound frame; `active` unless it was only a heartbeat."""
+        self.last_recv = time.monotonic()
+        if active:
+            self.last_active = self.last_recv
+
+    def evict(self, code: int) -> None:
+        """Close the socket from outside its handler, e.g. when it has gone quiet."""
+        if not self.closed:
+            asyncio.create_task(self._die(code))
+
+    def hold(self) -> None:
+        """Park live frames (e.g. while missed events are replayed) until release()."""
+        self._held = []
+
+    def release(self, replayed: list[Frame] = (), after_seq: int = 0) -> None:
+        """Queue `replayed`, then the parked frames not already covered by it
+        (sequenced ones at or below after_seq)."""
+        held, self._held = self._held or [], None
+        for frame in replayed:
+            self.send(frame)
+        for key, frame in held:
+            if frame.seq is None or frame.seq > after_seq:
+                self.send(frame, key)
+
+    def send(self, frame: Frame, key: Hashable | None = None) -> bool:
+        """Queue a frame for this socket; returns False if it was not queued."""
+        if self.closed:
+            return False
+        if self._held is not None:
+            self._held.append((key, frame))
+            return True
+        if self.policy == "coalesce" and key is not None:
+            for i, (queued_key, _) in enumerate(self._queue):
+                if queued_key == key:
+                    self._queue[i] = (key, frame)
+                    return True
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            FRAMES_DROPPED.inc(self.policy)
+            if self.policy == "drop":
+                return False
+            if self.policy == "disconnect":
+                asyncio.create_task(self._die(CLOSE_SLOW_CONSUMER))
+                return False
+            self._queue.popleft()
+        self._queue.append((key, frame))
+        self._ready.set()
+        return True
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                while not self._queue:
+                    self._busy = False
+                    self._ready.clear()
+                    await self._ready.wait()
+                self._arm_watchdog()
+                while self._queue:
+                    _, frame = self._queue.popleft()
+                    data = frame.encoded(self.wire_format)
+                    if isinstance(data, str):
+                        await self.websocket.send_text(data)
+                    else:
+                        await self.websocket.send_bytes(data)
+                    self._progress = self._loop.time()
+        except asyncio.CancelledError:
+            if not self._stalled:
+                raise
+            logger.info("dropping stalled socket for %s", self.user_id)
+            await self._die()
+        except Exception as e:
+            logger.info("dropping dead socket for %s: %r", self.user_id, e)
+            await self._die()
+
+    # One timer per busy period rather than wait_for() per frame, which costs
+    # a task per send: the watchdog only cancels the writer when a send has
+    # made no progress for send_timeout seconds.
+    def _arm_watchdog(self) -> None:
+        self._busy = True
+        self._progress = self._loop.time()
+        if self._watchdog is None:
+            self._watchdog = self._loop.call_later(self.send_timeout, self._check_stalled)
+
+    def _check_stalled(self) -> None:
+        self._watchdog = None
+        if not self._busy or self.closed:
+            return
+        idle = self._loop.time() - self._progress
+        if idle >= self.send_timeout:
+            self._stalled = True
+            self._writer.cancel()
+        else:
+            self._watchdog = self._loop.call_later(self.send_timeout - idle, self._check_stalled)
+
+    async def _die(self, code: int = 1011) -> None:
+        if self.closed:
+            return
+        self.close()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+        if self.on_dead is not None:
+            await self.on_dead(self)
+
+    def close(self) -> None:
+        self.closed = True
+        self._queue.clear()
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
@@ -1,9 +1,56 @@
-from functools import lru_cache
-from supabase import create_client, Client
-from app.core.config import SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_ROLE_KEY
+import asyncio
+from typing import TYPE_CHECKING
 
-@lru_cache(maxsize=1)
-def get_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+import httpx
+from app.core.config import get_settings
 
-print("Supabase client initialized with key prefix:", SUPABASE_SERVICE_ROLE_KEY[:12])
+# supabase-py pulls in its auth, storage, realtime and functions clients, a
+# large part of the app's import time; it's imported when a client is first
+# built (the lifespan warmup, app/core/warmup.py) instead
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+
+_async_clients: dict[str, "AsyncClient"] = {}
+_async_lock = asyncio.Lock()
+
+
+def _pooled_http_client() -> httpx.AsyncClient:
+    settings = get_settings()
+    return httpx.AsyncClient(
+        timeout=settings.db_timeout,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=settings.db_pool_size,
+            max_keepalive_connections=settings.db_pool_size,
+            keepalive_expiry=settings.db_keepalive_expiry,
+        ),
+    )
+
+
+async def _get_async_client(name: str, key: str) -> "AsyncClient":
+    client = _async_clients.get(name)
+    if client is None:
+        async with _async_lock:
+            client = _async_clients.get(name)
+            if client is None:
+                from supabase import AsyncClientOptions, acreate_client
+                options = AsyncClientOptions(
+                    httpx_client=_pooled_http_client(),
+                    auto_refresh_token=False,
+                    persist_session=False,
+                )
+                client = await acreate_client(get_settings().supabase_url, key, options=options)
+                _async_clients[name] = client
+    return client
+
+
+async def get_async_supabase() -> "AsyncClient":
+    # service-role client used for all table / rpc access
+    return await _get_async_client("service", get_settings().supabase_service_role_key)
+
+
+async def get_async_auth_client() -> "AsyncClient":
+    # separate client for sign-up / sign-in: a SIGNED_IN event rewrites the
+    # client's Authorization header, which must never leak into table access
+    return await _get_async_client("auth", get_settings().supabase_anon_key)
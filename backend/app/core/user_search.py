@@ -0,0 +1,298 @@
+import asyncio
+import bisect
+import gc
+import heapq
+import logging
+import math
+from collections import Counter
+
+import orjson
+from app.core.config import get_settings
+from app.core.pubsub import get_pubsub
+from app.core.repositories import get_repositories
+
+logger = logging.getLogger(__name__)
+
+# profile writes on any worker are applied to every worker's index
+INDEX_CHANNEL = "chat:usersearch"
+
+# results are ordered by (phase, rank, text, id); cursors are that tuple
+PREFIX, FUZZY = 0, 1
+
+MAX_FUZZY_CANDIDATES = 500
+
+# all the index keeps per user; result pages are read back as full rows
+FIELDS = ("username", "first_name", "last_name")
+
+
+def _norm(text: str | None) -> str:
+    return (text or "").strip().lower().replace("\x00", "")
+
+
+def _fields(row: dict) -> tuple:
+    return tuple(row.get(field) for field in FIELDS)
+
+
+def _terms(doc: tuple) -> set[str]:
+    terms = set()
+    for text in doc:
+        terms.update(_norm(text).split())
+    return terms
+
+
+def _grams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class UserSearchIndex:
+    """In-memory username / name index behind /profiles/search.
+
+    Prefix matches come from one sorted list of "term\\0user_id" entries
+    (username, first and last name), so the exact match sorts first and the
+    rest follow alphabetically; a user matching on several terms is listed at
+    the smallest one. Once prefixes run out, usernames are matched fuzzily by
+    trigram similarity, or for queries under three characters, by containing
+    the query. Only the searched fields are held, and searches return user
+    ids. The index is loaded in the background at startup and kept current by
+    `record` on every profile write; until it is ready the endpoint keeps
+    using the database.
+    """
+
+    def __init__(
+        self,
+        fuzzy_threshold: float | None = None,
+        max_scan: int | None = None,
+        load_batch: int | None = None,
+    ):
+        settings = get_settings()
+        fuzzy_threshold = settings.user_search_fuzzy_threshold if fuzzy_threshold is None else fuzzy_threshold
+        max_scan = settings.user_search_max_scan if max_scan is None else max_scan
+        load_batch = settings.user_search_load_batch if load_batch is None else load_batch
+        self.fuzzy_threshold = fuzzy_threshold
+        self.max_scan = max_scan
+        self.load_batch = load_batch
+        self.ready = False
+        self._docs: dict[str, tuple] = {}
+        self._entries: list[str] = []
+        self._grams: dict[str, list[str]] = {}
+        self._started = False
+        self._task: asyncio.Task | None = None
+
+    # --- lifecycle
+
+    async def start(self) -> None:
+        pubsub = get_pubsub()
+        pubsub.set_handler(self._on_published, prefix=INDEX_CHANNEL)
+        await pubsub.subscribe(INDEX_CHANNEL)
+        self._started = True
+        self._task = asyncio.create_task(self._load_all())
+
+    async def _load_all(self) -> None:
+        try:
+            repos = await get_repositories()
+            loaded, after = [], None
+            while True:
+                rows = await repos.profiles.scan(after, self.load_batch)
+                loaded.extend(rows)
+                if len(rows) < self.load_batch:
+                    break
+                after = rows[-1]["id"]
+            # one sort for the whole table rather than one per page
+            self.load(loaded)
+        except Exception:
+            logger.exception("user search index load failed; searching the database instead")
+            return
+        self.ready = True
+        logger.info("user search index ready (%d profiles)", len(self._docs))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # --- writes
+
+    async def _on_published(self, channel: str, payload: bytes) -> None:
+        self.apply(orjson.loads(payload))
+
+    async def record(self, profile: dict) -> None:
+        """Call after a profile row is created or changed."""
+        if self._started:
+            await get_pubsub().publish(INDEX_CHANNEL, orjson.dumps({"id": profile["id"], **{f: profile.get(f) for f in FIELDS}}))
+        else:
+            self.apply(profile)
+
+    def load(self, rows: list[dict]) -> None:
+        """Bulk add; rows already indexed (by a live write) are newer and kept."""
+        added = False
+        # millions of small containers: keep the cyclic GC from rescanning them mid-load
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            added = self._load(rows)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if added:
+            self._entries.sort()
+
+    def _load(self, rows: list[dict]) -> bool:
+        added = False
+        for row in rows:
+            user_id = row["id"]
+            if user_id in self._docs:
+                continue
+            doc = self._docs[user_id] = _fields(row)
+            self._entries.extend(f"{t}\x00{user_id}" for t in _terms(doc))
+            for gram in _grams(_norm(doc[0])):
+                self._grams.setdefault(gram, []).append(user_id)
+            added = True
+        return added
+
+    def apply(self, row: dict) -> None:
+        user_id, doc = row["id"], _fields(row)
+        old = self._docs.get(user_id)
+        old_terms = _terms(old) if old else set()
+        old_grams = _grams(_norm(old[0])) if old else set()
+        new_terms = _terms(doc)
+        for term in old_terms - new_terms:
+            self._remove_entry(f"{term}\x00{user_id}")
+        for term in new_terms - old_terms:
+            bisect.insort(self._entries, f"{term}\x00{user_id}")
+        # stale postings are harmless: candidates are re-scored against _docs
+        for gram in _grams(_norm(doc[0])) - old_grams:
+            self._grams.setdefault(gram, []).append(user_id)
+        self._docs[user_id] = doc
+
+    def remove(self, user_id: str) -> None:
+        old = self._docs.pop(user_id, None)
+        if old is not None:
+            for term in _terms(old):
+                self._remove_entry(f"{term}\x00{user_id}")
+
+    def _remove_entry(self, entry: str) -> None:
+        i = bisect.bisect_left(self._entries, entry)
+        if i < len(self._entries) and self._entries[i] == entry:
+            del self._entries[i]
+
+    # --- reads
+
+    def search(self, q: str, limit: int, cursor: tuple | None = None) -> tuple[list[str], tuple | None]:
+        """Up to `limit` user ids ranked exact -> prefix -> fuzzy, and the cursor
+        for the next page (None when there isn't one). Raises ValueError for a
+        cursor this index didn't hand out."""
+        q = _norm(q)
+        if cursor is not None:
+            cursor = tuple(cursor)
+            if (len(cursor) != 4 or cursor[0] not in (PREFIX, FUZZY) or type(cursor[1]) is not int
+                    or not all(isinstance(p, str) for p in cursor[2:])):
+                raise ValueError("invalid cursor")
+        if not q:
+            return [], None
+
+        found: list[tuple[tuple, str]] = []
+        if cursor is None or cursor[0] == PREFIX:
+            found = self._prefix(q, limit + 1, cursor)
+        if len(found) <= limit:
+            after = cursor if cursor is not None and cursor[0] == FUZZY else None
+            more = self._fuzzy if len(q) >= 3 else self._contains
+            found.extend(more(q, limit + 1 - len(found), after))
+
+        has_more = len(found) > limit
+        found = found[:limit]
+        return [user_id for _, user_id in found], (found[-1][0] if has_more and found else None)
+
+    def _prefix(self, q: str, want: int, cursor: tuple | None) -> list[tuple[tuple, str]]:
+        entries = self._entries
+        if cursor is None:
+            i = bisect.bisect_left(entries, q)
+        else:
+            i = bisect.bisect_right(entries, f"{cursor[2]}\x00{cursor[3]}")
+        found = []
+        while i < len(entries) and len(found) < want:
+            entry = entries[i]
+            i += 1
+            if not entry.startswith(q):
+                break
+            term, user_id = entry.split("\x00", 1)
+            doc = self._docs.get(user_id)
+            # listed once, at its smallest matching term
+            if doc is None or min(t for t in _terms(doc) if t.startswith(q)) != term:
+                continue
+            found.append(((PREFIX, 0, term, user_id), user_id))
+        return found
+
+    def _fuzzy(self, q: str, want: int, after: tuple | None) -> list[tuple[tuple, str]]:
+        q_grams = _grams(q)
+        postings = sorted((self._grams.get(g, []) for g in q_grams), key=len)
+        counts: Counter = Counter()
+        scanned = used = 0
+        # rarest trigrams first; very common ones are skipped once we have some candidates
+        for posting in postings:
+            if scanned and scanned + len(posting) > self.max_scan:
+                break
+            counts.update(posting)
+            scanned += len(posting)
+            used += 1
+        # similarity >= threshold needs that many shared trigrams, less the ones we skipped
+        need = max(1, math.ceil(self.fuzzy_threshold * len(q_grams)) - (len(q_grams) - used))
+
+        found = []
+        # only the closest candidates by shared-trigram count are scored exactly,
+        # so fuzzy paging runs dry after roughly MAX_FUZZY_CANDIDATES results
+        for user_id, count in counts.most_common(MAX_FUZZY_CANDIDATES):
+            if count < need:
+                break
+            doc = self._docs.get(user_id)
+            if doc is None:
+                continue
+            username = _norm(doc[0])
+            grams = _grams(username)
+            similarity = len(q_grams & grams) / len(q_grams | grams)
+            if similarity < self.fuzzy_threshold and q not in username:
+                continue
+            key = (FUZZY, -int(similarity * 1000), username, user_id)
+            if after is not None and key <= after:
+                continue
+            if any(t.startswith(q) for t in _terms(doc)):
+                continue  # already listed among the prefix matches
+            found.append((key, user_id))
+        return heapq.nsmallest(want, found)
+
+    def _contains(self, q: str, want: int, after: tuple | None) -> list[tuple[tuple, str]]:
+        # too short for trigram similarity: usernames containing q, in username
+        # order. Candidates come from the postings of trigrams that contain q,
+        # up to max_scan of them, so like fuzzy matches these run dry eventually.
+        candidates: set[str] = set()
+        for gram, posting in self._grams.items():
+            if q in gram:
+                candidates.update(posting)
+                if len(candidates) >= self.max_scan:
+                    break
+        found = []
+        for user_id in candidates:
+            doc = self._docs.get(user_id)
+            if doc is None:
+                continue
+            username = _norm(doc[0])
+            key = (FUZZY, 0, username, user_id)
+            if q not in username or (after is not None and key <= after):
+                continue
+            if any(t.startswith(q) for t in _terms(doc)):
+                continue  # already listed among the prefix matches
+            found.append((key, user_id))
+        return heapq.nsmallest(want, found)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+_index: UserSearchIndex | None = None
+
+
+def get_user_search() -> UserSearchIndex | None:
+    """The shared index, or None when USER_SEARCH_INDEX is off."""
+    global _index
+    if _index is None and get_settings().user_search_index:
+        _index = UserSearchIndex()
+    return _index
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+
+from app.core.config import get_settings
+from app.core.message_cache import get_message_cache
+from app.core.profile_loader import get_profile_cache
+from app.core.repositories import get_repositories
+from app.core.security import warm_jwks
+
+logger = logging.getLogger(__name__)
+
+
+async def _clients() -> None:
+    # both Supabase clients, and the supabase-py import behind them
+    await get_repositories()
+
+
+async def _connections() -> None:
+    repos = await get_repositories()
+    settings = get_settings()
+    await repos.open_connections(min(settings.warmup_connections, settings.db_pool_size))
+
+
+async def _caches() -> None:
+    # whoever reconnects first is most likely in a conversation that was just active
+    repos = await get_repositories()
+    conversations = await repos.conversations.recently_active(get_settings().warmup_conversations)
+    user_ids = {c.get(k) for c in conversations for k in ("user1_id", "user2_id", "last_sender_id")}
+    user_ids.discard(None)
+    messages = get_message_cache()
+    await asyncio.gather(
+        *(messages.history(repos, c["id"], 1) for c in conversations),
+        get_profile_cache().get_many(repos, user_ids),
+    )
+
+
+# stages run in order, the hooks within a stage concurrently
+HOOKS = (
+    {"clients": _clients},
+    {"connections": _connections, "jwks": warm_jwks, "caches": _caches},
+)
+
+
+async def _run(name: str, hook, timings: dict[str, float]) -> None:
+    started = time.perf_counter()
+    try:
+        await hook()
+    except Exception as e:
+        # a cold cache is only slower; the worker still starts
+        logger.warning("warmup %s failed: %s", name, e)
+    timings[name] = time.perf_counter() - started
+
+
+async def warm_up(timeout: float | None = None) -> dict[str, float]:
+    """Run the warmup hooks, giving up after `timeout`; seconds per hook that finished."""
+    settings = get_settings()
+    timeout = settings.warmup_timeout if timeout is None else timeout
+    timings: dict[str, float] = {}
+
+    async def stages():
+        for stage in HOOKS:
+            await asyncio.gather(*(_run(name, hook, timings) for name, hook in stage.items()))
+
+    try:
+        await asyncio.wait_for(stages(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("warmup stopped after %.1fs; done: %s", timeout, ", ".join(timings) or "nothing")
+    return timings
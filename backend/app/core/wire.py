@@ -0,0 +1,83 @@
+import orjson
+from fastapi import WebSocket
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for the msgpack wire format
+    msgpack = None
+
+# wire formats a /ws/chat client can negotiate, by subprotocol or ?format=
+#   json        - JSON in text frames (default, what browsers expect)
+#   json-binary - the same JSON bytes in binary frames, no utf-8 round trip
+#   msgpack     - MessagePack in binary frames, smallest on the wire
+SUBPROTOCOLS = {
+    "chat.json": "json",
+    "chat.json-binary": "json-binary",
+    "chat.msgpack": "msgpack",
+}
+FORMATS = set(SUBPROTOCOLS.values())
+
+
+def available_formats() -> set[str]:
+    return FORMATS if msgpack is not None else FORMATS - {"msgpack"}
+
+
+def negotiate(websocket: WebSocket) -> tuple[str, str | None]:
+    """Pick the wire format for a socket; returns (format, subprotocol to accept)."""
+    formats = available_formats()
+    for proto in websocket.scope.get("subprotocols") or []:
+        fmt = SUBPROTOCOLS.get(proto)
+        if fmt in formats:
+            return fmt, proto
+    fmt = websocket.query_params.get("format")
+    if fmt in formats:
+        return fmt, None
+    return "json", None
+
+
+def encode_event(message: dict) -> bytes:
+    return orjson.dumps(message)
+
+
+def decode_frame(frame: dict, wire_format: str = "json") -> dict:
+    """Decode an ASGI websocket.receive message in the socket's format."""
+    if frame.get("text") is not None:
+        return orjson.loads(frame["text"])
+    data = frame.get("bytes") or b""
+    if wire_format == "msgpack":
+        return msgpack.unpackb(data)
+    return orjson.loads(data)
+
+
+class Frame:
+    """One event, encoded once and shared by every socket it goes to.
+
+    The JSON bytes are produced by the publisher; the other representations
+    are derived on first use and cached, so each is built at most once per
+    worker no matter how many sockets receive the event.
+    """
+
+    __slots__ = ("json", "_text", "_msgpack")
+
+    def __init__(self, payload: bytes):
+        self.json = payload
+        self._text = None
+        self._msgpack = None
+
+    @property
+    def seq(self) -> int | None:
+        # sequenced events start with {"seq":N (see app.core.events.with_seq)
+        if not self.json.startswith(b'{"seq":'):
+            return None
+        return orjson.loads(self.json).get("seq")
+
+    def encoded(self, wire_format: str) -> str | bytes:
+        if wire_format == "json":
+            if self._text is None:
+                self._text = self.json.decode()
+            return self._text
+        if wire_format == "msgpack":
+            if self._msgpack is None:
+                self._msgpack = msgpack.packb(orjson.loads(self.json))
+            return self._msgpack
+        return self.json
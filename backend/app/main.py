@@ -1,8 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1 import auth, profiles, connections, messages, ws
+from app.api.v1 import auth, profiles, connections, conversations, messages, metrics, presence, ws
+from app.core.config import get_settings
+from app.core.connection_graph import get_connection_graph
+from app.core.inbox import get_inbox
+from app.core.ingest import get_ingest, close_ingest
+from app.core.message_cache import get_message_cache
+from app.core.message_events import get_message_events
+from app.core.message_search import get_message_search
+from app.core.metrics import MetricsMiddleware
+from app.core.participants import get_participants
+from app.core.presence import get_presence
+from app.core.profile_loader import get_profile_cache
+from app.core.pubsub import close_pubsub
+from app.core.user_search import get_user_search
+from app.core.warmup import warm_up
 
-app = FastAPI(title="Chat API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # replays any messages journaled but not stored before the last shutdown
+    await get_ingest().start()
+    await get_message_cache().start()
+    await get_profile_cache().start()
+    await get_inbox().start()
+    await get_participants().start()
+    await get_presence().start()
+    heartbeat = asyncio.create_task(ws.heartbeat())
+    index = get_user_search()
+    if index is not None:
+        await index.start()  # loads in the background
+    graph = get_connection_graph()
+    if graph is not None:
+        await graph.start()  # loads in the background
+    search = get_message_search()
+    if search is not None:
+        await search.start()  # catches up in the background
+    # after the models it feeds, so none sees a message before it's set up
+    await get_message_events().start()
+    if get_settings().warmup:
+        # clients, pooled connections and hot caches before the first request
+        await warm_up()
+    yield
+    heartbeat.cancel()
+    await get_presence().close()
+    if index is not None:
+        await index.close()
+    if graph is not None:
+        await graph.close()
+    if search is not None:
+        await search.close()
+    await close_ingest()
+    await close_pubsub()
+
+app = FastAPI(title="Chat API", lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -16,9 +68,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# added last so it's outermost and times everything, CORS preflights included
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router)
 app.include_router(profiles.router)
 app.include_router(connections.router)
+app.include_router(conversations.router)
 app.include_router(messages.router)
+app.include_router(presence.router)
 app.include_router(ws.router)
+app.include_router(metrics.router)
@@ -20,3 +20,15 @@ class ConnectionOut(BaseModel):
 class ConnectionRespond(BaseModel):
     connection_id: str
     action: Literal["accept","block"]
+
+class ConnectionPage(BaseModel):
+    items: list[ConnectionOut]
+    next_cursor: Optional[str] = None
+
+class MutualOut(BaseModel):
+    user_id: str
+    mutual_count: int
+
+class SuggestionOut(BaseModel):
+    user: ProfileBrief
+    mutual_count: int
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
+from app.schemas.connections import ProfileBrief
 
 class ConversationOut(BaseModel):
     id: str
@@ -9,6 +10,22 @@ class ConversationOut(BaseModel):
 class CreateDMOut(ConversationOut):
     pass
 
+class CreateGroupIn(BaseModel):
+    title: str = Field(min_length=1, max_length=100)
+    member_ids: list[str] = Field(min_length=1)
+
+class GroupOut(BaseModel):
+    id: str
+    type: str
+    title: str | None = None
+
+class ParticipantOut(BaseModel):
+    user_id: str
+    role: str
+
+class AddParticipantsIn(BaseModel):
+    user_ids: list[str] = Field(min_length=1)
+
 class SendMessageIn(BaseModel):
     content: str
 
@@ -21,3 +38,35 @@ class MessageOut(BaseModel):
 
 class ReadPointerIn(BaseModel):
     last_read_message_id: str
+
+class ReadPointerOut(BaseModel):
+    conversation_id: str
+    user_id: str
+    last_read_message_id: str | None = None
+    last_read_at: str | None = None
+
+class UnreadOut(BaseModel):
+    conversation_id: str
+    unread: int
+    last_read_message_id: str | None = None
+
+class LastMessage(BaseModel):
+    id: str
+    sender_id: str
+    preview: str
+    created_at: str
+
+class InboxEntry(BaseModel):
+    conversation_id: str
+    type: str | None = None
+    title: str | None = None  # groups
+    is_request: bool | None = None
+    other: ProfileBrief | None = None  # DMs
+    last_message: LastMessage | None = None
+    unread: int = 0
+    last_read_message_id: str | None = None
+
+class InboxPage(BaseModel):
+    items: list[InboxEntry]
+    next_cursor: str | None = None
+    has_more: bool = False
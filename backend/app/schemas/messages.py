@@ -5,12 +5,46 @@ class MessageCreate(BaseModel):
     receiver_id: str
     body: str
 
+class ConversationMessageIn(BaseModel):
+    body: str
+
 class MessageOut(BaseModel):
     id: str
     sender_id: str
-    receiver_id: str
+    receiver_id: str | None = None  # None in groups
     body: str
     created_at: datetime
     read_at: datetime | None = None
     read: bool | None = False
     conversation_id: str | None = None
+
+class SyncPage(BaseModel):
+    seq: int  # resume the socket from here once caught up
+    items: list[MessageOut]
+    next_cursor: str | None = None
+    has_more: bool = False
+
+class MessagePage(BaseModel):
+    items: list[MessageOut]
+    next_cursor: str | None = None  # continue in the same direction
+    prev_cursor: str | None = None  # page the other way from the first item
+    has_more: bool = False
+
+class MessageSearchHit(MessageOut):
+    snippet: str  # the body around the first match
+    highlights: list[tuple[int, int]] = []  # [start, end) of each matched word in snippet
+    score: float | None = None  # None when served by the database fallback
+
+class MessageSearchPage(BaseModel):
+    items: list[MessageSearchHit]
+    next_cursor: str | None = None
+
+class ImportLineError(BaseModel):
+    line: int
+    detail: str
+
+class ImportResult(BaseModel):
+    imported: int  # new rows stored
+    duplicates: int = 0  # rows whose id was already stored (re-imports)
+    skipped: int = 0  # invalid lines; the first few are in errors
+    errors: list[ImportLineError] = []
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+from typing import Literal
+
+class PresenceOut(BaseModel):
+    user_id: str
+    status: Literal["online", "away", "offline"]
+    last_seen: str | None = None
@@ -23,3 +23,7 @@ class ProfileUpdate(BaseModel):
 
 class ProfileOut(ProfileBase):
     id: str
+
+class ProfileSearchPage(BaseModel):
+    items: list[ProfileOut]
+    next_cursor: str | None = None
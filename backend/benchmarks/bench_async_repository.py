@@ -0,0 +1,89 @@
+"""Concurrent send throughput: sync client inside async handlers vs the async repositories.
+
+Each simulated send does the conversation lookup plus the message insert that
+POST /messages performs. While the sends run, a probe task measures how late
+the event loop wakes it up - the delay every WebSocket broadcast in the same
+worker would see.
+
+    python -m benchmarks.bench_async_repository --sends 500 --latency 0.005
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+
+from app.core.repositories import Repositories  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+
+async def _loop_lag_probe(samples: list[float], stop: asyncio.Event, interval: float = 0.001):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def _send_sync_path(supabase, sender: str, receiver: str):
+    # what send_message did before: blocking calls straight from the coroutine
+    supabase.table("conversations").select("id").or_(
+        f"and(user1_id.eq.{sender},user2_id.eq.{receiver}),and(user1_id.eq.{receiver},user2_id.eq.{sender})"
+    ).limit(1).execute()
+    supabase.table("messages").insert({"sender_id": sender, "receiver_id": receiver, "body": "hi"}).execute()
+
+
+async def _send_async_path(repos: Repositories, sender: str, receiver: str):
+    await repos.conversations.find_between(sender, receiver)
+    await repos.messages.insert({"sender_id": sender, "receiver_id": receiver, "body": "hi"})
+
+
+async def _run(name: str, make_send, sends: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    lag: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_loop_lag_probe(lag, stop))
+
+    async def one(i: int):
+        async with sem:
+            await make_send(f"user-{i % 50}", f"user-{(i + 1) % 50}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sends)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    lag.sort()
+    return {
+        "scenario": name,
+        "sends": sends,
+        "seconds": round(elapsed, 4),
+        "sends_per_sec": round(sends / elapsed, 1),
+        "loop_lag_p50_ms": round(statistics.median(lag) * 1000, 3) if lag else None,
+        "loop_lag_p99_ms": round(lag[int(len(lag) * 0.99) - 1] * 1000, 3) if lag else None,
+        "loop_lag_max_ms": round(lag[-1] * 1000, 3) if lag else None,
+    }
+
+
+async def main(sends: int, concurrency: int, latency: float):
+    sync_client = FakeSupabase(latency=latency, asynchronous=False)
+    repos = Repositories(FakeSupabase(latency=latency, asynchronous=True))
+    results = [
+        await _run("sync_client", lambda a, b: _send_sync_path(sync_client, a, b), sends, concurrency),
+        await _run("async_repositories", lambda a, b: _send_async_path(repos, a, b), sends, concurrency),
+    ]
+    for r in results:
+        print(json.dumps(r))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sends", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated DB round trip (s)")
+    args = parser.parse_args()
+    asyncio.run(main(args.sends, args.concurrency, args.latency))
@@ -0,0 +1,146 @@
+"""Connection graph: load cost, memory and query latency on a synthetic graph.
+
+Users get a skewed number of connections (a few hubs, a long tail), mostly
+accepted with some pending and rejected. Reports the load time and resident
+memory of ConnectionGraph, then latency of status checks, mutual counts,
+suggestions and a first page of connections, and the same status check and
+listing through the database path (the fake client with --latency per call).
+
+    python -m benchmarks.bench_connection_graph --users 200000 --edges 2000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+
+from app.core.connection_graph import ConnectionGraph  # noqa: E402
+from app.core.repositories import Repositories  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+
+def _uid(i: int) -> str:
+    return f"00000000-0000-0000-0000-{i:012d}"
+
+
+def _edges(users: int, edges: int, rng: random.Random) -> list[dict]:
+    # skewed endpoints: low ids are hubs (the top 0.1% of users take ~6% of edge ends)
+    def pick() -> int:
+        return int(users * rng.random() ** 2.5)
+
+    seen, rows = set(), []
+    while len(rows) < edges:
+        a, b = pick(), rng.randrange(users)
+        if a == b or (a, b) in seen or (b, a) in seen:
+            continue
+        seen.add((a, b))
+        roll = rng.random()
+        status = "accepted" if roll < 0.85 else "pending" if roll < 0.97 else "rejected"
+        rows.append({
+            "id": f"{rng.getrandbits(128):032x}",
+            "requester_id": _uid(a),
+            "addressee_id": _uid(b),
+            "status": status,
+        })
+    return rows
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _summary(name: str, samples: list[float], **extra) -> dict:
+    samples = sorted(samples)
+    return {
+        "scenario": name,
+        "queries": len(samples),
+        "p50_us": round(statistics.median(samples) * 1e6, 2),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6, 2),
+        "max_us": round(samples[-1] * 1e6, 2),
+        **extra,
+    }
+
+
+def _time(fn, args_list) -> list[float]:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _time_async(fn, args_list) -> list[float]:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        await fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def main(users: int, edges: int, queries: int, db_queries: int, latency: float, seed: int):
+    rng = random.Random(seed)
+    rows = _edges(users, edges, rng)
+    ids = [_uid(i) for i in range(users)]
+    # queries come from active users, i.e. skewed like the edges
+    sample = [ids[int(users * rng.random() ** 2.5)] for _ in range(queries)]
+    pairs = [(a, rng.choice(ids)) for a in sample]
+
+    rss_before = _rss_mb()
+    graph = ConnectionGraph()
+    start = time.perf_counter()
+    graph.load(rows)
+    load_seconds = time.perf_counter() - start
+    degrees = sorted((len(graph.page(u)[0]) for u in sample[:1000]), reverse=True)
+    print(json.dumps({
+        "scenario": "load",
+        "users": users,
+        "edges": len(graph),
+        "seconds": round(load_seconds, 3),
+        "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+        "queried_max_degree": degrees[0],
+        "queried_median_degree": statistics.median(degrees),
+    }))
+
+    print(json.dumps(_summary("graph_between", _time(graph.between, pairs))))
+    print(json.dumps(_summary("graph_mutual_count", _time(graph.mutual_count, pairs))))
+    print(json.dumps(_summary("graph_suggestions", _time(graph.suggestions, [(u, 20) for u in sample]))))
+    print(json.dumps(_summary("graph_page", _time(lambda u: graph.page(u, "accepted", 50), [(u,) for u in sample]))))
+
+    fake = FakeSupabase(latency=latency)
+    table = fake.store.table("connections")
+    for row in rows:
+        table.add(dict(row))
+    repos = Repositories(fake)
+    db_pairs = pairs[:db_queries]
+    # the fake builds its column indexes on first use; keep that out of the numbers
+    await repos.connections.get_between(*pairs[-1])
+    await repos.connections.list_for_user(pairs[-1][0])
+    print(json.dumps(_summary(
+        "db_between", await _time_async(repos.connections.get_between, db_pairs), latency_ms=latency * 1000,
+    )))
+    print(json.dumps(_summary(
+        "db_list_for_user", await _time_async(repos.connections.list_for_user, [(a,) for a, _ in db_pairs]),
+        latency_ms=latency * 1000,
+    )))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--edges", type=int, default=2_000_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--db-queries", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds added to every database call")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.edges, args.queries, args.db_queries, args.latency, args.seed))
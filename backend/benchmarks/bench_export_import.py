@@ -0,0 +1,207 @@
+"""Conversation export / import: streamed NDJSON against paging the history API.
+
+Seeds one conversation with --messages rows in the Supabase fake (every call
+delayed by --latency), then through the ASGI app:
+
+  * history_pages: the old way, GET /messages/{id}/history/page 50 at a time
+  * export / export_gzip: GET /messages/{id}/export, read as a stream
+  * import / import_gzip: POST the export back into a fresh group as its
+    admin (migrate=true, since half the rows are the other member's),
+    streamed in 64 KiB chunks
+
+Each prints rows/s and CPU seconds; a second pass under tracemalloc reports
+the transient peak of Python allocations (peak less what stays allocated,
+i.e. rows the fake stored), at --messages and at a tenth of it, which should
+stay flat for the streaming endpoints. The fake scans and sorts a
+conversation's rows on every keyset page, so some of the growth with
+--messages, and most of the time at large values, is the fake's.
+
+    python -m benchmarks.bench_export_import --messages 20000 --latency 0.002
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+SECRET = "bench-export-jwt-secret-0123456789abcdef"
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+os.environ["SUPABASE_JWT_SECRET"] = SECRET
+os.environ.setdefault("INGEST_JOURNAL_DIR", tempfile.mkdtemp(prefix="bench-ingest-"))
+os.environ.setdefault("MESSAGE_SEARCH_DIR", tempfile.mkdtemp(prefix="bench-search-"))
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+import orjson  # noqa: E402
+
+from app.core.participants import ADMIN, MEMBER, get_participants  # noqa: E402
+from app.core.repositories import Repositories, set_repositories  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+A, B = "00000000-0000-0000-0000-00000000000a", "00000000-0000-0000-0000-00000000000b"
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do"]
+
+
+def _headers(user_id: str) -> dict:
+    claims = {"sub": user_id, "aud": "authenticated", "exp": int(time.time()) + 3600}
+    return {"Authorization": "Bearer " + jwt.encode(claims, SECRET, algorithm="HS256")}
+
+
+def _seed(fake: FakeSupabase, messages: int, rng: random.Random) -> str:
+    conversation_id = str(uuid.uuid4())
+    fake.store.table("conversations").add({"id": conversation_id, "type": "dm", "user1_id": A, "user2_id": B})
+    table = fake.store.table("messages")
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(messages):
+        sender = rng.choice((A, B))
+        table.add({
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "sender_id": sender,
+            "receiver_id": B if sender == A else A,
+            "body": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))),
+            "created_at": (start + timedelta(seconds=i)).isoformat(),
+            "read": False,
+            "read_at": None,
+        })
+    return conversation_id
+
+
+async def _history_pages(client: httpx.AsyncClient, conversation_id: str) -> int:
+    rows, cursor = 0, None
+    while True:
+        params = {"direction": "newer", "limit": 50, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get(f"/messages/{conversation_id}/history/page", params=params, headers=_headers(A))).json()
+        rows += len(page["items"])
+        if not page["has_more"]:
+            return rows
+        cursor = page["next_cursor"]
+
+
+async def _export(conversation_id: str, compression: str = "none", keep: bool = False):
+    """Rows exported (and the body, when `keep`), counted as the chunks are sent.
+
+    Calls the ASGI app directly: httpx's ASGITransport collects the whole
+    response before returning it, which would hide the streaming."""
+    rows, parts = 0, []
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compression == "gzip" else None
+    path = f"/messages/{conversation_id}/export"
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": f"compression={compression}".encode(),
+        "headers": [(b"host", b"test")] + [(k.lower().encode(), v.encode()) for k, v in _headers(A).items()],
+        "client": ("127.0.0.1", 0), "server": ("test", 80),
+    }
+    requested, done = False, asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()  # the client never disconnects early
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal rows
+        if message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if keep:
+                parts.append(chunk)
+            rows += (decompressor.decompress(chunk) if decompressor else chunk).count(b"\n")
+
+    await app(scope, receive, send)
+    done.set()
+    return rows, b"".join(parts)
+
+
+def _without_ids(body: bytes) -> bytes:
+    # a migration into another database: ids are new there
+    return b"".join(orjson.dumps({k: v for k, v in orjson.loads(line).items() if k != "id"}) + b"\n"
+                    for line in body.splitlines())
+
+
+async def _import(client: httpx.AsyncClient, fake: FakeSupabase, body: bytes, compressed: bool) -> int:
+    target = str(uuid.uuid4())
+    fake.store.table("conversations").add({"id": target, "type": "group", "title": "import"})
+    participants = fake.store.table("conversation_participants")
+    for user_id, role in ((A, ADMIN), (B, MEMBER)):
+        participants.add({"id": str(uuid.uuid4()), "conversation_id": target, "user_id": user_id, "role": role})
+    await get_participants().invalidate(target, [A, B])
+
+    async def chunks():
+        for i in range(0, len(body), 65536):
+            yield body[i:i + 65536]
+
+    headers = {**_headers(A), "Content-Type": "application/x-ndjson"}
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+    result = (await client.post(f"/messages/{target}/import", params={"migrate": "true"},
+                                content=chunks(), headers=headers)).json()
+    if result["skipped"]:
+        raise SystemExit(f"import skipped rows: {result['errors'][:3]}")
+    return result["imported"] + result["duplicates"] + result["skipped"]
+
+
+async def _measure(name: str, run, traced: bool) -> dict:
+    if traced:
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    rows = await run()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    result = {"scenario": name, "rows": rows}
+    if traced:
+        # what the request needed while it ran, less what it left behind (rows stored in the fake)
+        current, peak = tracemalloc.get_traced_memory()
+        result["transient_peak_mb"] = round((peak - current) / 2**20, 2)
+        tracemalloc.stop()
+    else:
+        result.update(seconds=round(wall, 3), rows_per_second=round(rows / wall), cpu_seconds=round(cpu, 3))
+    return result
+
+
+async def main(messages: int, latency: float, seed: int):
+    rng = random.Random(seed)
+    fake = FakeSupabase(latency=latency)
+    set_repositories(Repositories(fake))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        for size, traced in ((messages, False), (messages, True), (max(1, messages // 10), True)):
+            conversation_id = _seed(fake, size, rng)
+            _, body = await _export(conversation_id, keep=True)
+            body = _without_ids(body)
+            gz = gzip.compress(body)
+            runs = {
+                "history_pages": lambda: _history_pages(client, conversation_id),
+                "export": lambda: _export(conversation_id),
+                "export_gzip": lambda: _export(conversation_id, "gzip"),
+                "import": lambda: _import(client, fake, body, False),
+                "import_gzip": lambda: _import(client, fake, gz, True),
+            }
+            for name, run in runs.items():
+                async def rows(run=run):
+                    out = await run()
+                    return out[0] if isinstance(out, tuple) else out
+                result = await _measure(name, rows, traced)
+                result.update(messages=size, latency_ms=latency * 1000)
+                print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds added to every database call")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.latency, args.seed))
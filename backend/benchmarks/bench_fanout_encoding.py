@@ -0,0 +1,127 @@
+"""Fan-out encoding cost for users with many devices.
+
+Compares the old path (json.dumps per socket, once per broadcast_to_user
+call, two calls per message) with broadcast_to_users, which encodes each
+event once and shares the bytes between every socket and recipient.
+
+    python -m benchmarks.bench_fanout_encoding --devices 20 --events 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+
+from app.api.v1 import ws  # noqa: E402
+from app.core.pubsub import InProcessPubSub, set_pubsub, user_channel  # noqa: E402
+from app.core.sockets import SocketConnection  # noqa: E402
+
+
+class NullWebSocket:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, data: str):
+        self.frames += 1
+        self.bytes += len(data.encode())
+
+    async def send_bytes(self, data: bytes):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def _message(i: int) -> dict:
+    return {
+        "id": f"00000000-0000-0000-0000-{i:012d}",
+        "conversation_id": "11111111-1111-1111-1111-111111111111",
+        "sender_id": "sender",
+        "receiver_id": "receiver",
+        "body": "hey, are we still on for tonight? " * 3,
+        "created_at": "2025-01-01T12:00:00.000000+00:00",
+        "read": False,
+        "read_at": None,
+    }
+
+
+async def bench_old(devices: int, events: int) -> dict:
+    sockets = {u: [NullWebSocket() for _ in range(devices)] for u in ("sender", "receiver")}
+
+    async def broadcast_to_user(user_id, message):
+        for s in sockets.get(user_id, []):
+            await s.send_text(json.dumps(message))
+
+    start = time.process_time()
+    for i in range(events):
+        msg = _message(i)
+        await broadcast_to_user(msg["receiver_id"], msg)
+        await broadcast_to_user(msg["sender_id"], msg)
+    cpu = time.process_time() - start
+    all_sockets = [s for group in sockets.values() for s in group]
+    return _result("old_per_socket_json", "json", cpu, events, all_sockets)
+
+
+async def bench_new(devices: int, events: int, wire_format: str) -> dict:
+    pubsub = InProcessPubSub()
+    pubsub.set_handler(ws._on_published)
+    set_pubsub(pubsub)
+    ws.active_connections.clear()
+    all_sockets = []
+    for user in ("sender", "receiver"):
+        await pubsub.subscribe(user_channel(user))
+        for _ in range(devices):
+            sock = NullWebSocket()
+            conn = SocketConnection(user, sock, maxsize=events + 1, wire_format=wire_format)
+            conn.start()
+            ws.active_connections.setdefault(user, []).append(conn)
+            all_sockets.append(sock)
+
+    start = time.process_time()
+    for i in range(events):
+        msg = _message(i)
+        await ws.broadcast_to_users([msg["receiver_id"], msg["sender_id"]], msg)
+    while any(c.depth for conns in ws.active_connections.values() for c in conns):
+        await asyncio.sleep(0)
+    cpu = time.process_time() - start
+
+    for conns in ws.active_connections.values():
+        for c in conns:
+            c.close()
+    ws.active_connections.clear()
+    set_pubsub(None)
+    return _result("encode_once", wire_format, cpu, events, all_sockets)
+
+
+def _result(name, wire_format, cpu, events, sockets) -> dict:
+    return {
+        "scenario": name,
+        "format": wire_format,
+        "events": events,
+        "sockets": len(sockets),
+        "cpu_seconds": round(cpu, 4),
+        "cpu_us_per_event": round(cpu / events * 1e6, 2),
+        "bytes_per_frame": round(sum(s.bytes for s in sockets) / max(1, sum(s.frames for s in sockets)), 1),
+    }
+
+
+async def main(devices: int, events: int):
+    results = [await bench_old(devices, events)]
+    for wire_format in ("json", "json-binary", "msgpack"):
+        results.append(await bench_new(devices, events, wire_format))
+    for r in results:
+        print(json.dumps(r))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=20, help="sockets per user")
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.devices, args.events))
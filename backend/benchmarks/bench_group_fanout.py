@@ -0,0 +1,164 @@
+"""Large-group fan-out latency: one publish per member vs one per broadcast.
+
+Registers sockets for the online share of a group's members on this worker,
+then times broadcast_to_users from the call until the last online socket has
+written the frame. `per_user` forces the old path (an event-log append and a
+publish on each member's channel); `fanout` is the batched path (event-log
+appends pipelined, one message on the fan-out channel that each worker
+filters against the sockets it holds).
+
+--backend redis runs both the pub/sub and the event log against fakeredis,
+which has no network round trip, so it understates the per-user path's cost
+against a real server.
+
+    python -m benchmarks.bench_group_fanout --sizes 100 1000 5000 --messages 50
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+
+from app.api.v1 import ws  # noqa: E402
+from app.core.config import get_settings, set_settings  # noqa: E402
+from app.core.events import InProcessEventLog, RedisEventLog, set_event_log  # noqa: E402
+from app.core.pubsub import InProcessPubSub, RedisPubSub, set_pubsub, user_channel  # noqa: E402
+from app.core.sockets import SocketConnection  # noqa: E402
+
+
+class CountingWebSocket:
+    """Counts frames across all sockets and wakes the bench when the last one is written."""
+
+    written = 0
+    expected = 0
+    done: asyncio.Event | None = None
+
+    async def send_text(self, data: str):
+        self._count()
+
+    async def send_bytes(self, data: bytes):
+        self._count()
+
+    def _count(self):
+        cls = CountingWebSocket
+        cls.written += 1
+        if cls.written >= cls.expected:
+            cls.done.set()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def _message(i: int, sender: str) -> dict:
+    return {
+        "id": f"00000000-0000-0000-0000-{i:012d}",
+        "conversation_id": "11111111-1111-1111-1111-111111111111",
+        "sender_id": sender,
+        "receiver_id": None,
+        "body": "standup moved to 10:30, same room",
+        "created_at": "2025-01-01T12:00:00.000000+00:00",
+    }
+
+
+def _summary(name: str, samples: list[float], **extra) -> dict:
+    samples = sorted(samples)
+    return {
+        "scenario": name,
+        "broadcasts": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        **extra,
+    }
+
+
+async def _setup(backend: str):
+    if backend == "redis":
+        import fakeredis.aioredis  # optional dependency
+
+        client = fakeredis.aioredis.FakeRedis()
+        pubsub, log = RedisPubSub(client=client), RedisEventLog(client=client)
+    else:
+        pubsub, log = InProcessPubSub(), InProcessEventLog()
+    set_pubsub(pubsub)
+    set_event_log(log)
+    pubsub.set_handler(ws._on_published)
+    pubsub.set_handler(ws._on_fanout, prefix=ws.FANOUT_CHANNEL)
+    await pubsub.subscribe(ws.FANOUT_CHANNEL)
+    return pubsub
+
+
+async def bench(backend: str, strategy: str, size: int, messages: int, online: float, rng: random.Random) -> dict:
+    pubsub = await _setup(backend)
+    members = [f"user-{i:06d}" for i in range(size)]
+    connected = rng.sample(members, max(1, int(size * online)))
+    ws.active_connections.clear()
+    for user_id in connected:
+        conn = SocketConnection(user_id, CountingWebSocket(), maxsize=messages + 1)
+        conn.start()
+        ws.active_connections[user_id] = [conn]
+        await pubsub.subscribe(user_channel(user_id))
+
+    saved = get_settings()
+    if strategy == "per_user":
+        set_settings(dataclasses.replace(saved, fanout_min_users=10 ** 9))
+    published = 0
+    publish = pubsub.publish
+
+    async def counting_publish(channel, payload):
+        nonlocal published
+        published += 1
+        await publish(channel, payload)
+
+    pubsub.publish = counting_publish
+    samples = []
+    try:
+        for i in range(messages):
+            CountingWebSocket.written = 0
+            CountingWebSocket.expected = len(connected)
+            CountingWebSocket.done = asyncio.Event()
+            start = time.perf_counter()
+            await ws.broadcast_to_users(members, _message(i, members[0]))
+            await asyncio.wait_for(CountingWebSocket.done.wait(), timeout=60)
+            samples.append(time.perf_counter() - start)
+    finally:
+        set_settings(saved)
+        for conns in ws.active_connections.values():
+            for conn in conns:
+                conn.close()
+        ws.active_connections.clear()
+        await pubsub.close()
+        set_pubsub(None)
+        set_event_log(None)
+    return _summary(
+        f"{strategy}_{backend}", samples,
+        members=size,
+        online=len(connected),
+        publishes_per_broadcast=round(published / messages, 1),
+    )
+
+
+async def main(sizes: list[int], messages: int, online: float, backends: list[str], seed: int):
+    rng = random.Random(seed)
+    for backend in backends:
+        for size in sizes:
+            for strategy in ("per_user", "fanout"):
+                print(json.dumps(await bench(backend, strategy, size, messages, online, rng)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--messages", type=int, default=50, help="broadcasts per scenario")
+    parser.add_argument("--online", type=float, default=0.5, help="share of members with a socket here")
+    parser.add_argument("--backend", nargs="+", default=["memory", "redis"], choices=["memory", "redis"])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.messages, args.online, args.backend, args.seed))
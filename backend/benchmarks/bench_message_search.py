@@ -0,0 +1,180 @@
+"""Message search index: indexing throughput, disk/memory cost and query latency.
+
+Builds the index straight from synthetic messages (no database): bodies draw
+words from a Zipf-distributed vocabulary, conversations are skewed (a few very
+busy ones, a long tail) and each user belongs to --user-convs of them.
+Reports docs/s including segment flushes and merges, bytes on disk, resident
+memory, then query latency for one word in one conversation, one word across
+all of a user's conversations, and a three-word query, plus a page-2 fetch.
+The defaults are the size the index is meant for and take a while; pass
+smaller --messages for a quick run.
+
+    python -m benchmarks.bench_message_search --messages 20000000
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+
+from app.core.message_search import MessageSearchIndex  # noqa: E402
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _disk_bytes(root: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+
+def _summary(name: str, samples: list[float], **extra) -> dict:
+    samples = sorted(samples)
+    return {
+        "scenario": name,
+        "queries": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1e3, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e3, 3),
+        "max_ms": round(samples[-1] * 1e3, 3),
+        **extra,
+    }
+
+
+def _zipf(n: int, s: float = 1.1) -> list[float]:
+    # cumulative weights for rng-driven bisect sampling
+    return list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+async def main(messages: int, vocab: int, conversations: int, users: int, user_convs: int,
+               queries: int, segment_docs: int, seed: int, keep: bool):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocab)]
+    word_cdf = _zipf(vocab)
+    conv_cdf = _zipf(conversations, 0.8)
+    conv_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(conversations)]
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(users)]
+
+    def pick(cdf: list[float], count: int) -> list[int]:
+        top = cdf[-1]
+        return [bisect.bisect_left(cdf, rng.random() * top) for _ in range(count)]
+
+    root = tempfile.mkdtemp(prefix="bench-search-")
+    index = MessageSearchIndex(root=root, segment_docs=segment_docs, flush_interval=3600)
+    index.open()
+    start_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rss_before = _rss_mb()
+    flush_seconds = 0.0
+    started = time.perf_counter()
+    batch = 10_000
+    for offset in range(0, messages, batch):
+        n = min(batch, messages - offset)
+        convs = pick(conv_cdf, n)
+        lengths = [rng.randint(3, 20) for _ in range(n)]
+        drawn = iter(pick(word_cdf, sum(lengths)))
+        for i in range(n):
+            conv = convs[i]
+            index.add({
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "conversation_id": conv_ids[conv],
+                # every conversation is a DM between two users, so dm_conversations works too
+                "sender_id": user_ids[conv % users],
+                "receiver_id": user_ids[(conv * 7 + 1) % users],
+                "created_at": (start_time + timedelta(seconds=offset + i)).isoformat(),
+                "body": " ".join(words[next(drawn)] for _ in range(lengths[i])),
+            })
+            if len(index._live) >= segment_docs:
+                t = time.perf_counter()
+                await index.flush()
+                flush_seconds += time.perf_counter() - t
+    t = time.perf_counter()
+    await index.flush()
+    flush_seconds += time.perf_counter() - t
+    seconds = time.perf_counter() - started
+    print(json.dumps({
+        "scenario": "index",
+        "messages": messages,
+        "seconds": round(seconds, 2),
+        "docs_per_second": round(messages / seconds),
+        "flush_merge_seconds": round(flush_seconds, 2),
+        "segments": len(index._segments),
+        "disk_mb": round(_disk_bytes(root) / 2**20, 1),
+        "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+    }))
+
+    # searches come from busy conversations and mid-frequency words, as real ones do
+    sample_convs = [conv_ids[c] for c in pick(conv_cdf, queries)]
+    mid = [words[rng.randrange(vocab // 100, vocab // 10)] for _ in range(queries)]
+    cross = [rng.sample(conv_ids, user_convs) for _ in range(min(queries, 200))]
+
+    def run(cases):
+        samples = []
+        for q, convs in cases:
+            t = time.perf_counter()
+            index.search(q, convs, 20)
+            samples.append(time.perf_counter() - t)
+        return samples
+
+    print(json.dumps(_summary("one_conversation", run(zip(mid, ([c] for c in sample_convs))))))
+    print(json.dumps(_summary(
+        "user_conversations", run(zip(mid, itertools.cycle(cross))), conversations=user_convs,
+    )))
+    common = [words[rng.randrange(0, 20)] for _ in range(queries)]
+    print(json.dumps(_summary(
+        "user_conversations_common_word", run(zip(common, itertools.cycle(cross))), conversations=user_convs,
+    )))
+    multi = [" ".join(words[rng.randrange(0, vocab // 20)] for _ in range(3)) for _ in range(queries)]
+    print(json.dumps(_summary("three_words", run(zip(multi, itertools.cycle(cross))), conversations=user_convs)))
+
+    samples = []
+    for q, convs in zip(common[:200], itertools.cycle(cross)):
+        _, cursor = index.search(q, convs, 20)
+        if cursor is None:
+            continue
+        t = time.perf_counter()
+        index.search(q, convs, 20, cursor)
+        samples.append(time.perf_counter() - t)
+    if samples:
+        print(json.dumps(_summary("second_page", samples, conversations=user_convs)))
+
+    t = time.perf_counter()
+    await index.close()
+    reopened = MessageSearchIndex(root=root, segment_docs=segment_docs)
+    reopened.open()
+    print(json.dumps({
+        "scenario": "reopen",
+        "seconds": round(time.perf_counter() - t, 3),
+        "messages": reopened.doc_count,
+    }))
+    await reopened.close()
+    if not keep:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20_000_000)
+    parser.add_argument("--vocab", type=int, default=200_000)
+    parser.add_argument("--conversations", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--user-convs", type=int, default=100, help="conversations searched per cross-conversation query")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--segment-docs", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep", action="store_true", help="leave the index files in place")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.vocab, args.conversations, args.users, args.user_convs,
+                     args.queries, args.segment_docs, args.seed, args.keep))
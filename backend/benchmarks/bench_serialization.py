@@ -0,0 +1,167 @@
+"""Response serialization: response_model validation against FAST_RESPONSES.
+
+For the three list endpoints that can skip response_model validation
+(conversation history, GET /connections, GET /profiles/search), at a few
+page sizes:
+
+  * encode: the serialization step alone on the same rows - FastAPI's
+    serialize_response plus JSONResponse rendering, against RowType.dumps
+  * request: a whole request through the ASGI app with the flag off and on
+
+Both report CPU milliseconds per call. Every scenario first checks the two
+paths produce byte-identical bodies. The Supabase fake answers with no
+delay, so the request numbers are all CPU: routing, auth, the (cached) data
+lookups and the response.
+
+    python -m benchmarks.bench_serialization --requests 500
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+SECRET = "bench-serialize-jwt-secret-0123456789abcdef"
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+os.environ["SUPABASE_JWT_SECRET"] = SECRET
+os.environ.setdefault("INGEST_JOURNAL_DIR", tempfile.mkdtemp(prefix="bench-ingest-"))
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import APIRoute, serialize_response  # noqa: E402
+
+from app.api.v1 import connections as connections_api  # noqa: E402
+from app.api.v1 import messages as messages_api  # noqa: E402
+from app.api.v1 import profiles as profiles_api  # noqa: E402
+from app.core.config import get_settings, set_settings  # noqa: E402
+from app.core.repositories import Repositories, set_repositories  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+A = "00000000-0000-0000-0000-00000000000a"
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do"]
+
+
+def _headers(user_id: str) -> dict:
+    claims = {"sub": user_id, "aud": "authenticated", "exp": int(time.time()) + 3600}
+    return {"Authorization": "Bearer " + jwt.encode(claims, SECRET, algorithm="HS256")}
+
+
+def _seed(fake: FakeSupabase, messages: int, connections: int, rng: random.Random) -> str:
+    profiles = fake.store.table("profiles")
+    others = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(connections)]
+    for i, user_id in enumerate([A] + others):
+        profiles.add({
+            "id": user_id, "username": f"user{i:05d}", "first_name": rng.choice(WORDS).title(),
+            "last_name": rng.choice(WORDS).title() if i % 3 else None, "phone": None,
+            "avatar_url": f"https://cdn.example.com/a/{user_id}.png" if i % 2 else None,
+        })
+    table = fake.store.table("connections")
+    for i, other in enumerate(others):
+        outgoing = i % 2 == 0
+        table.add({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "requester_id": A if outgoing else other, "addressee_id": other if outgoing else A,
+            "status": "accepted" if i % 5 else "pending",
+        })
+    conversation_id = str(uuid.uuid4())
+    fake.store.table("conversations").add({"id": conversation_id, "type": "dm", "user1_id": A, "user2_id": others[0]})
+    rows = fake.store.table("messages")
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(messages):
+        sender, receiver = (A, others[0]) if i % 2 else (others[0], A)
+        read = i < messages - 10
+        rows.add({
+            "id": str(uuid.uuid4()), "conversation_id": conversation_id,
+            "sender_id": sender, "receiver_id": receiver,
+            "body": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))),
+            "created_at": (start + timedelta(seconds=i, microseconds=rng.randrange(10**6))).isoformat(),
+            "read": read, "read_at": (start + timedelta(seconds=i + 5)).isoformat() if read else None,
+        })
+    return conversation_id
+
+
+def _route(path: str) -> APIRoute:
+    return next(r for r in app.routes if isinstance(r, APIRoute) and r.path == path and "GET" in r.methods)
+
+
+def _set_fast(fast: bool) -> None:
+    set_settings(dataclasses.replace(get_settings(), fast_responses=fast))
+
+
+async def _cpu_per_call(run, calls: int) -> float:
+    cpu = time.process_time()
+    for _ in range(calls):
+        await run()
+    return (time.process_time() - cpu) / calls * 1e3
+
+
+async def main(requests: int, messages: int, connections: int, seed: int):
+    rng = random.Random(seed)
+    fake = FakeSupabase()
+    set_repositories(Repositories(fake))
+    conversation_id = _seed(fake, messages, connections, rng)
+    headers = _headers(A)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        scenarios = []
+        for limit in (50, 200):
+            scenarios.append(("history", limit, "/messages/{conversation_id}/history",
+                              f"/messages/{conversation_id}/history", {"limit": limit}))
+        scenarios.append(("list_connections", connections, "/connections", "/connections", {}))
+        for limit in (20, 100):
+            scenarios.append(("search_users", limit, "/profiles/search", "/profiles/search",
+                              {"q": "user", "limit": limit}))
+
+        for name, rows, path, url, params in scenarios:
+            async def get():
+                response = await client.get(url, params=params, headers=headers)
+                response.raise_for_status()
+                return response.content
+
+            _set_fast(False)
+            slow_body = await get()  # also warms the caches behind the endpoint
+            _set_fast(True)
+            fast_body = await get()
+            if fast_body != slow_body:
+                raise SystemExit(f"{name}: fast path body differs:\n{slow_body[:400]}\n{fast_body[:400]}")
+
+            field = _route(path).response_field
+            row_type = {"history": messages_api.MESSAGE_ROWS, "list_connections": connections_api.CONNECTION_ROWS,
+                        "search_users": profiles_api.PROFILE_ROWS}[name]
+            data = json.loads(slow_body)
+
+            async def encode_pydantic():
+                JSONResponse(await serialize_response(field=field, response_content=data, is_coroutine=True))
+
+            async def encode_fast():
+                row_type.dumps(data)
+
+            result = {"scenario": name, "rows": len(data), "bytes": len(slow_body)}
+            result["encode_pydantic_ms"] = round(await _cpu_per_call(encode_pydantic, requests), 3)
+            result["encode_fast_ms"] = round(await _cpu_per_call(encode_fast, requests), 3)
+            _set_fast(False)
+            result["request_pydantic_ms"] = round(await _cpu_per_call(get, requests), 3)
+            _set_fast(True)
+            result["request_fast_ms"] = round(await _cpu_per_call(get, requests), 3)
+            result["encode_speedup"] = round(result["encode_pydantic_ms"] / result["encode_fast_ms"], 1)
+            result["request_speedup"] = round(result["request_pydantic_ms"] / result["request_fast_ms"], 2)
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500, help="calls timed per path and scenario")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.messages, args.connections, args.seed))
@@ -0,0 +1,164 @@
+"""Worker cold start: import time, client construction, time to ready, first request.
+
+Every measurement runs in a fresh interpreter (this script re-runs itself
+with --child), since a warm process hides exactly the costs that matter
+when a new worker boots:
+
+  * import: `import app.main`, and whether supabase-py / SQLAlchemy were
+    loaded by it (both are deferred now)
+  * clients: building the two Supabase async clients, including the
+    supabase-py import (no network: the URL is never contacted)
+  * ready / first_request, with WARMUP off and on: the lifespan startup
+    against the Supabase fake, every call delayed by --latency, with
+    --conversations recently active ones seeded, then the first history
+    and conversation-list requests of a user in the hottest conversation
+
+The fake has no sockets, so pre-opened pool connections don't show here;
+against a real project each saves a TCP + TLS handshake on first use.
+
+    python -m benchmarks.bench_startup --runs 5 --latency 0.005
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SECRET = "bench-startup-jwt-secret-0123456789abcdef"
+ENV = {
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_ANON_KEY": "bench",
+    "SUPABASE_SERVICE_ROLE_KEY": "bench-service-role",
+    "SUPABASE_JWT_SECRET": SECRET,
+}
+
+
+def _child_import() -> dict:
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+    return {
+        "seconds": time.perf_counter() - started,
+        "supabase_loaded": "supabase" in sys.modules,
+        "sqlalchemy_loaded": "sqlalchemy" in sys.modules,
+    }
+
+
+def _child_clients() -> dict:
+    import asyncio
+    import app.main  # noqa: F401
+    from app.core.supabase_client import get_async_auth_client, get_async_supabase
+
+    async def build():
+        started = time.perf_counter()
+        await asyncio.gather(get_async_supabase(), get_async_auth_client())
+        return time.perf_counter() - started
+
+    return {"seconds": asyncio.run(build())}
+
+
+def _child_ready(latency: float, conversations: int) -> dict:
+    import asyncio
+    import uuid
+    from datetime import datetime, timedelta, timezone
+    import httpx
+    import jwt
+    from app.core.repositories import Repositories, set_repositories
+    from app.main import app
+    from benchmarks.fake_supabase import FakeSupabase
+
+    fake = FakeSupabase(latency=latency)
+    set_repositories(Repositories(fake))
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    users = [str(uuid.UUID(int=i + 1)) for i in range(conversations + 1)]
+    for i, user_id in enumerate(users):
+        fake.store.table("profiles").add({"id": user_id, "username": f"user{i}"})
+    hottest = None
+    for i in range(conversations):
+        conversation_id = str(uuid.uuid4())
+        for j in range(20):
+            last = {
+                "id": str(uuid.uuid4()), "conversation_id": conversation_id,
+                "sender_id": users[i + 1], "receiver_id": users[0], "body": f"message {j}",
+                "created_at": (start + timedelta(minutes=i, seconds=j)).isoformat(),
+            }
+            fake.store.table("messages").add(last)
+        fake.store.table("conversations").add({
+            "id": conversation_id, "type": "dm", "user1_id": users[0], "user2_id": users[i + 1],
+            "last_message_id": last["id"], "last_message_at": last["created_at"],
+            "last_sender_id": last["sender_id"], "last_message_preview": last["body"],
+        })
+        hottest = conversation_id
+    claims = {"sub": users[-1], "aud": "authenticated", "exp": int(time.time()) + 3600}
+    headers = {"Authorization": "Bearer " + jwt.encode(claims, SECRET, algorithm="HS256")}
+
+    async def run():
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            ready = time.perf_counter() - started
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                t = time.perf_counter()
+                (await client.get(f"/messages/{hottest}/history", headers=headers)).raise_for_status()
+                history = time.perf_counter() - t
+                t = time.perf_counter()
+                (await client.get("/conversations", headers=headers)).raise_for_status()
+                inbox = time.perf_counter() - t
+        return {"seconds": ready, "first_history_seconds": history, "first_inbox_seconds": inbox}
+
+    return asyncio.run(run())
+
+
+def _spawn(args: list[str], env: dict) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", *args],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _median(runs: list[dict]) -> dict:
+    return {
+        k: round(statistics.median(r[k] for r in runs) * 1e3, 1) if isinstance(runs[0][k], float) else runs[0][k]
+        for k in runs[0]
+    }
+
+
+def main(runs: int, latency: float, conversations: int):
+    base = {**os.environ, **ENV}
+    cases = [
+        ("import", ["--child", "import"], {}),
+        ("clients", ["--child", "clients"], {}),
+    ]
+    for warmup in ("0", "1"):
+        cases.append((f"ready_warmup_{warmup}", ["--child", "ready", "--latency", str(latency),
+                                                 "--conversations", str(conversations)], {"WARMUP": warmup}))
+    for name, args, extra in cases:
+        results = []
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory(prefix="bench-startup-") as tmp:
+                env = {**base, **extra, "INGEST_JOURNAL_DIR": os.path.join(tmp, "ingest"),
+                       "MESSAGE_SEARCH_DIR": os.path.join(tmp, "search")}
+                results.append(_spawn(args, env))
+        summary = {k.replace("seconds", "ms"): v for k, v in _median(results).items()}
+        print(json.dumps({"scenario": name, "runs": runs, **summary,
+                          **({"latency_ms": latency * 1000} if name.startswith("ready") else {})}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per scenario")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every database call")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--child", choices=("import", "clients", "ready"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child == "import":
+        print(json.dumps(_child_import()))
+    elif args.child == "clients":
+        print(json.dumps(_child_clients()))
+    elif args.child == "ready":
+        print(json.dumps(_child_ready(args.latency, args.conversations)))
+    else:
+        main(args.runs, args.latency, args.conversations)
@@ -0,0 +1,137 @@
+"""User search latency: in-memory index vs the ilike('%q%') database path.
+
+Fills an in-memory profiles table, builds UserSearchIndex from it, then
+replays search-box traffic - growing prefixes of real usernames plus a few
+misspellings - against both paths.
+The ilike path runs through the fake client, i.e. a full scan per query,
+which is what a leading-wildcard ilike costs Postgres without a trigram index.
+
+    python -m benchmarks.bench_user_search --profiles 1000000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+
+from app.core.repositories import Repositories  # noqa: E402
+from app.core.user_search import UserSearchIndex  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "zu", "bel", "dor", "an", "vi", "sha", "qu", "ny", "ex", "jo", "pe"]
+FIRST = ["alice", "bob", "carol", "dmitri", "eve", "farah", "gus", "hana", "ivan", "jun", "kofi", "lena"]
+LAST = ["smith", "garcia", "okafor", "tanaka", "novak", "silva", "kim", "haddad", "berg", "rossi"]
+
+
+def _profiles(n: int, rng: random.Random) -> list[dict]:
+    rows = []
+    for i in range(n):
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        rows.append({
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "username": f"{name}{rng.randint(0, 9999)}",
+            "first_name": rng.choice(FIRST),
+            "last_name": rng.choice(LAST),
+            "phone": None,
+            "avatar_url": None,
+        })
+    return rows
+
+
+def _queries(rows: list[dict], count: int, rng: random.Random) -> list[str]:
+    queries = []
+    while len(queries) < count:
+        username = rng.choice(rows)["username"]
+        # a user typing: every prefix from 2 chars up
+        queries.extend(username[:k] for k in range(2, len(username) + 1))
+        # and a typo (swapped neighbours)
+        if len(username) > 4:
+            i = rng.randrange(1, len(username) - 2)
+            queries.append(username[:i] + username[i + 1] + username[i] + username[i + 2:])
+    return queries[:count]
+
+
+def _summary(name: str, samples: list[float], **extra) -> dict:
+    samples = sorted(samples)
+    return {
+        "scenario": name,
+        "queries": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        **extra,
+    }
+
+
+async def main(profiles: int, queries: int, ilike_queries: int, limit: int, seed: int):
+    rng = random.Random(seed)
+    rows = _profiles(profiles, rng)
+    fake = FakeSupabase()
+    fake.store.table("profiles").rows = {r["id"]: r for r in rows}
+    repos = Repositories(fake)
+    workload = _queries(rows, queries, rng)
+
+    index = UserSearchIndex()
+    start = time.perf_counter()
+    index.load(rows)
+    build = time.perf_counter() - start
+
+    # what a worker keeps: build again from fresh rows that are dropped after the load
+    tracemalloc.start()
+    measured = UserSearchIndex()
+    measured.load(_profiles(profiles, random.Random(seed)))
+    gc.collect()
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+
+    samples, hits = [], 0
+    for q in workload:
+        start = time.perf_counter()
+        items, _ = index.search(q, limit)
+        samples.append(time.perf_counter() - start)
+        hits += bool(items)
+    results = [_summary(
+        "index", samples,
+        profiles=profiles,
+        build_seconds=round(build, 2),
+        index_mb=round(index_bytes / 2**20, 1),
+        queries_with_results=hits,
+    )]
+
+    samples = []
+    for q in workload[:ilike_queries]:
+        start = time.perf_counter()
+        await repos.profiles.search_username(q, limit)
+        samples.append(time.perf_counter() - start)
+    results.append(_summary("ilike_scan", samples, profiles=profiles))
+
+    # incremental upkeep: a profile rename while the index is live
+    samples = []
+    for row in rng.sample(rows, min(1000, len(rows))):
+        start = time.perf_counter()
+        index.apply({**row, "username": row["username"][::-1]})
+        samples.append(time.perf_counter() - start)
+    results.append(_summary("index_update", samples, profiles=profiles))
+
+    for r in results:
+        print(json.dumps(r))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--ilike-queries", type=int, default=20, help="full scans are slow; sample fewer")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.profiles, args.queries, args.ilike_queries, args.limit, args.seed))
@@ -0,0 +1,548 @@
+"""In-memory stand-in for the slice of the Supabase client the app uses.
+
+Supports the PostgREST query-builder calls made by app.core.repositories,
+`auth` (sign-up / password sign-in / get_user, issuing HS256 JWTs the app can
+verify locally) and `rpc` against registered Python functions, in both a
+blocking flavour (mirrors supabase.Client) and an awaitable one (mirrors
+supabase.AsyncClient).
+
+Every call can be delayed to model the network: `latency` seconds, plus up to
+`jitter` more, with per-target overrides in `latencies` keyed by table name,
+"auth" or "rpc:<name>".
+"""
+import asyncio
+import copy
+import itertools
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import jwt
+from postgrest.exceptions import APIError
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _split_top_level(expr: str) -> list[str]:
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(expr):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(expr[start:i])
+            start = i + 1
+    parts.append(expr[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _compare(op: str, left, right) -> bool:
+    if op == "eq":
+        return left == right
+    if op == "neq":
+        return left != right
+    if op == "is":
+        return left is None if right in (None, "null") else left == right
+    if left is None:
+        return False
+    if op == "lt":
+        return left < right
+    if op == "lte":
+        return left <= right
+    if op == "gt":
+        return left > right
+    if op == "gte":
+        return left >= right
+    if op == "in":
+        return left in right
+    if op in ("ilike", "like"):
+        pattern = right.replace("%", "")
+        hay = str(left)
+        if op == "ilike":
+            pattern, hay = pattern.lower(), hay.lower()
+        if right.startswith("%") and right.endswith("%"):
+            return pattern in hay
+        if right.endswith("%"):
+            return hay.startswith(pattern)
+        if right.startswith("%"):
+            return hay.endswith(pattern)
+        return hay == pattern
+    raise ValueError(f"unsupported operator {op}")
+
+
+def _parse_logic(expr: str):
+    """Parse a PostgREST or()/and() filter string into a predicate."""
+    if expr.startswith("and(") or expr.startswith("or("):
+        kind, inner = expr.split("(", 1)
+        preds = [_parse_logic(p) for p in _split_top_level(inner[:-1])]
+        if kind == "and":
+            return lambda row: all(p(row) for p in preds)
+        return lambda row: any(p(row) for p in preds)
+    column, op, value = expr.split(".", 2)
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    if op == "in":
+        value = [v.strip().strip('"') for v in value.strip("()").split(",")]
+    return lambda row: _compare(op, _coerce(row.get(column)), value)
+
+
+def _eq_term(expr: str) -> tuple[str, str] | None:
+    """A column.eq.value that a row matching `expr` must satisfy, if one is obvious."""
+    if expr.startswith("or("):
+        return None
+    if expr.startswith("and("):
+        terms = (_eq_term(p) for p in _split_top_level(expr[4:-1]))
+        return next((t for t in terms if t is not None), None)
+    column, op, value = expr.split(".", 2)
+    if op != "eq":
+        return None
+    return column, value[1:-1] if value.startswith('"') and value.endswith('"') else value
+
+
+def _coerce(value):
+    # filters arrive as strings over the wire; compare like with like
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+# column defaults and unique constraints of the real schema
+DEFAULTS = {
+    "connections": {"status": "pending"},
+    "conversations": {"type": "dm", "is_request": False},
+    "messages": {"read": False, "read_at": None},
+}
+UNIQUE = {
+    "connections": [("requester_id", "addressee_id")],
+    "conversations": [("dm_pair",)],
+}
+
+
+def _touch_conversations(store: "FakeStore", rows: list[dict]) -> None:
+    # migrations/0004_touch_conversation.sql
+    latest: dict[str, dict] = {}
+    for row in rows:
+        conversation_id, current = row.get("conversation_id"), latest.get(row.get("conversation_id"))
+        if conversation_id and (current is None or (row["created_at"], row["id"]) > (current["created_at"], current["id"])):
+            latest[conversation_id] = row
+    conversations = store.table("conversations")
+    for conversation_id, row in latest.items():
+        for convo in conversations.lookup("id", conversation_id):
+            if convo.get("last_message_at") is None or convo["last_message_at"] < row["created_at"]:
+                conversations.change(convo, {
+                    "last_message_id": row["id"],
+                    "last_message_at": row["created_at"],
+                    "last_message_preview": (row.get("body") or "")[:140],
+                    "last_sender_id": row["sender_id"],
+                    "updated_at": row["created_at"],
+                })
+
+
+# statement-level AFTER INSERT triggers: fn(store, inserted rows)
+TRIGGERS = {
+    "messages": _touch_conversations,
+}
+
+
+class FakeTable:
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: dict[str, dict] = {}
+        self.defaults: dict = dict(DEFAULTS.get(name, {}))
+        self.unique: list[tuple[str, ...]] = list(UNIQUE.get(name, []))
+        # column -> value -> ids, built on the first lookup of a column so large tables
+        # don't make the harness itself the bottleneck
+        self._indexes: dict[str, dict] = {}
+        self._indexed_rows = self.rows
+
+    def lookup(self, column: str, value) -> list[dict]:
+        if column == "id":
+            row = self.rows.get(value)
+            return [row] if row is not None else []
+        index = self._index(column)
+        return [self.rows[i] for i in index.get(_coerce(value), ())]
+
+    def _index(self, column: str) -> dict:
+        if self._indexed_rows is not self.rows:  # rows were replaced wholesale
+            self._indexes, self._indexed_rows = {}, self.rows
+        index = self._indexes.get(column)
+        if index is None:
+            index = self._indexes[column] = {}
+            for row in self.rows.values():
+                index.setdefault(_coerce(row.get(column)), set()).add(row["id"])
+        return index
+
+    def add(self, row: dict) -> None:
+        self.rows[row["id"]] = row
+        self._reindex(row, add=True)
+
+    def remove(self, row: dict) -> None:
+        self._reindex(row, add=False)
+        del self.rows[row["id"]]
+
+    def change(self, row: dict, values: dict) -> None:
+        self._reindex(row, add=False)
+        row.update(values)
+        self._reindex(row, add=True)
+
+    def _reindex(self, row: dict, add: bool) -> None:
+        if self._indexed_rows is not self.rows:
+            self._indexes, self._indexed_rows = {}, self.rows
+        for column, index in self._indexes.items():
+            key = _coerce(row.get(column))
+            if add:
+                index.setdefault(key, set()).add(row["id"])
+            else:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(row["id"])
+
+    def check_unique(self, row: dict, ignore_id: str | None = None):
+        for cols in self.unique:
+            key = tuple(row.get(c) for c in cols)
+            if None in key:
+                continue
+            for other in self.rows.values():
+                if other["id"] != ignore_id and tuple(other.get(c) for c in cols) == key:
+                    raise APIError({
+                        "message": f"duplicate key value violates unique constraint \"{self.name}_{'_'.join(cols)}_key\"",
+                        "code": "23505", "details": None, "hint": None,
+                    })
+
+
+class FakeStore:
+    def __init__(self):
+        self.tables: dict[str, FakeTable] = {}
+        self._clock = itertools.count()
+        self._epoch = datetime.now(timezone.utc)
+
+    def table(self, name: str) -> FakeTable:
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return self.tables[name]
+
+    def now(self) -> str:
+        # strictly increasing timestamps keep ordering deterministic
+        return (self._epoch + timedelta(microseconds=next(self._clock))).isoformat()
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeSupabase", table: str):
+        self.client = client
+        self.table_name = table
+        self.op = "select"
+        self.columns = ("*",)
+        self.payload = None
+        self.on_conflict = "id"
+        self.filters = []
+        self.ordering: list[tuple[str, bool]] = []
+        self._limit = None
+        self._offset = 0
+        self._single = False
+        self._maybe_single = False
+        self._count = None
+        # index probes: each entry lists (column, value) pairs at least one of
+        # which every matching row has, so candidates are the union of their rows
+        self._keys: list[list[tuple[str, object]]] = []
+
+    # --- verbs
+    def select(self, *columns, count=None, **_):
+        if self.op == "select":
+            self.columns = columns
+        self._count = count
+        return self
+
+    def insert(self, data, **_):
+        self.op, self.payload = "insert", data
+        return self
+
+    def upsert(self, data, on_conflict="id", ignore_duplicates=False, **_):
+        self.op, self.payload, self.on_conflict = "upsert", data, on_conflict
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, data, **_):
+        self.op, self.payload = "update", data
+        return self
+
+    def delete(self, **_):
+        self.op = "delete"
+        return self
+
+    # --- filters
+    @property
+    def not_(self):
+        self._negate_next = True
+        return self
+
+    def _add(self, pred):
+        if getattr(self, "_negate_next", False):
+            self._negate_next = False
+            self.filters.append(lambda row: not pred(row))
+        else:
+            self.filters.append(pred)
+        return self
+
+    def _filter(self, column, op, value):
+        return self._add(lambda row: _compare(op, _coerce(row.get(column)), _coerce(value)))
+
+    def eq(self, column, value):
+        if not getattr(self, "_negate_next", False):
+            self._keys.append([(column, value)])
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def ilike(self, column, pattern):
+        return self._filter(column, "ilike", pattern)
+
+    def like(self, column, pattern):
+        return self._filter(column, "like", pattern)
+
+    def is_(self, column, value):
+        return self._filter(column, "is", value)
+
+    def in_(self, column, values):
+        values = [_coerce(v) for v in values]
+        if not getattr(self, "_negate_next", False):
+            self._keys.append([(column, v) for v in values])
+        return self._add(lambda row: _coerce(row.get(column)) in values)
+
+    def or_(self, expr):
+        terms = _split_top_level(expr)
+        keys = [_eq_term(t) for t in terms]
+        if all(keys) and not getattr(self, "_negate_next", False):
+            self._keys.append(keys)
+        preds = [_parse_logic(p) for p in terms]
+        return self._add(lambda row: any(p(row) for p in preds))
+
+    # --- modifiers
+    def order(self, column, desc=False, **_):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def maybe_single(self):
+        self._maybe_single = True
+        return self
+
+    # --- execution
+    def _matching(self, table: FakeTable) -> list[dict]:
+        if self._keys:
+            keys = min(self._keys, key=lambda k: (k[0][0] != "id", len(k)))
+            candidates = {}
+            for column, value in keys:
+                for row in table.lookup(column, value):
+                    candidates[row["id"]] = row
+            candidates = candidates.values()
+        else:
+            candidates = table.rows.values()
+        return [r for r in candidates if all(f(r) for f in self.filters)]
+
+    def _run(self) -> FakeResponse:
+        store = self.client.store
+        table = store.table(self.table_name)
+        if self.op in ("insert", "upsert"):
+            rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            out, inserted = [], []
+            for row in rows:
+                row = dict(row)
+                existing = None
+                if self.op == "upsert":
+                    keys = self.on_conflict.split(",")
+                    candidates = table.lookup(keys[0], row.get(keys[0]))
+                    existing = next((r for r in candidates if all(r.get(k) == row.get(k) for k in keys)), None)
+                if existing is not None:
+                    if self.ignore_duplicates:
+                        continue
+                    table.change(existing, row)
+                    out.append(copy.copy(existing))
+                    continue
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", store.now())
+                for column, value in table.defaults.items():
+                    row.setdefault(column, value)
+                table.check_unique(row)
+                table.add(row)
+                inserted.append(row)
+                out.append(copy.copy(row))
+            if inserted and self.table_name in TRIGGERS:
+                TRIGGERS[self.table_name](store, inserted)
+            return FakeResponse(out)
+        matched = self._matching(table)
+        if self.op == "update":
+            for r in matched:
+                table.change(r, self.payload)
+            return FakeResponse([copy.copy(r) for r in matched])
+        if self.op == "delete":
+            for r in matched:
+                table.remove(r)
+            return FakeResponse([copy.copy(r) for r in matched])
+        for column, desc in reversed(self.ordering):
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column) or ""), reverse=desc)
+        count = len(matched) if self._count else None
+        end = None if self._limit is None else self._offset + self._limit
+        data = [copy.copy(r) for r in matched[self._offset:end]]
+        if self._single:
+            if len(data) != 1:
+                raise Exception("JSON object requested, multiple (or no) rows returned")
+            return FakeResponse(data[0], count)
+        if self._maybe_single:
+            return FakeResponse(data[0], count) if data else None
+        return FakeResponse(data, count)
+
+    def execute(self):
+        return self.client._call(self.table_name, self._run)
+
+
+class FakeRpc:
+    def __init__(self, client: "FakeSupabase", name: str, params: dict | None):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        fn = self.client.rpcs.get(self.name)
+        if fn is None:
+            raise Exception(f"Could not find the function public.{self.name}")
+        return self.client._call(f"rpc:{self.name}", lambda: FakeResponse(fn(self.client.store, **self.params)))
+
+
+class FakeAuth:
+    """GoTrue stand-in: users live in the store's "auth.users" table and
+    sessions are HS256 JWTs signed with `jwt_secret` (set SUPABASE_JWT_SECRET
+    to the same value and the app verifies them without calling back here)."""
+
+    def __init__(self, client: "FakeSupabase"):
+        self.client = client
+
+    def _users(self) -> FakeTable:
+        return self.client.store.table("auth.users")
+
+    def _token(self, user: SimpleNamespace) -> str:
+        now = int(time.time())
+        claims = {"sub": user.id, "email": user.email, "role": user.role,
+                  "aud": "authenticated", "iat": now, "exp": now + 3600}
+        return jwt.encode(claims, self.client.jwt_secret, algorithm="HS256")
+
+    @staticmethod
+    def _user(row: dict) -> SimpleNamespace:
+        return SimpleNamespace(id=row["id"], email=row["email"], role="authenticated")
+
+    def sign_up(self, credentials: dict):
+        def run():
+            users = self._users()
+            if users.lookup("email", credentials["email"]):
+                raise Exception("User already registered")
+            row = {"id": str(uuid.uuid4()), "email": credentials["email"], "password": credentials["password"]}
+            users.add(row)
+            return SimpleNamespace(user=self._user(row), session=None)
+        return self.client._call("auth", run)
+
+    def sign_in_with_password(self, credentials: dict):
+        def run():
+            rows = self._users().lookup("email", credentials["email"])
+            if not rows or rows[0]["password"] != credentials["password"]:
+                raise Exception("Invalid login credentials")
+            user = self._user(rows[0])
+            return SimpleNamespace(user=user, session=SimpleNamespace(access_token=self._token(user)))
+        return self.client._call("auth", run)
+
+    def get_user(self, token: str):
+        def run():
+            try:
+                claims = jwt.decode(token, self.client.jwt_secret, algorithms=["HS256"], audience="authenticated")
+            except jwt.InvalidTokenError:
+                raise Exception("invalid JWT")
+            rows = self._users().lookup("id", claims["sub"])
+            return SimpleNamespace(user=self._user(rows[0]) if rows else None)
+        return self.client._call("auth", run)
+
+
+class FakeSupabase:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        asynchronous: bool = True,
+        store: FakeStore | None = None,
+        jitter: float = 0.0,
+        latencies: dict[str, float] | None = None,
+        jwt_secret: str = "fake-supabase-jwt-secret-at-least-32-bytes",
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.latencies = dict(latencies or {})
+        self.asynchronous = asynchronous
+        self.store = store or FakeStore()
+        self.jwt_secret = jwt_secret
+        self.rpcs: dict = {}
+        self.calls = 0
+        self.calls_by_target: dict[str, int] = {}
+        self.auth = FakeAuth(self)
+        self._rng = random.Random(seed)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict | None = None) -> FakeRpc:
+        return FakeRpc(self, name, params)
+
+    def register_rpc(self, name: str, fn) -> None:
+        """fn(store, **params) -> response data"""
+        self.rpcs[name] = fn
+
+    def _delay(self, target: str) -> float:
+        delay = self.latencies.get(target, self.latency)
+        if self.jitter:
+            delay += self._rng.uniform(0, self.jitter)
+        return delay
+
+    def _call(self, target: str, run):
+        self.calls += 1
+        self.calls_by_target[target] = self.calls_by_target.get(target, 0) + 1
+        if self.asynchronous:
+            return self._call_async(target, run)
+        delay = self._delay(target)
+        if delay:
+            time.sleep(delay)
+        return run()
+
+    async def _call_async(self, target: str, run):
+        delay = self._delay(target)
+        if delay:
+            await asyncio.sleep(delay)
+        return run()
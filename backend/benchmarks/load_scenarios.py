@@ -0,0 +1,356 @@
+"""Load scenarios against the whole app, in-process, over the Supabase fake.
+
+Requests go through the real ASGI stack (middleware, auth, routers, caches,
+the lifespan's background tasks) via httpx.ASGITransport; sockets use a
+minimal ASGI WebSocket client, so thousands of them cost no real network.
+Every Supabase call is delayed by --latency (+ up to --jitter) seconds to
+model the round trip that dominates in production. The fake evaluates
+queries in this process: equality / in / or-of-equality filters hit an index,
+but keyset and range filters still scan their candidates, so very large
+--history values measure the fake as much as the app.
+
+Each scenario prints one JSON line:
+    {"scenario", "requests", "errors", "seconds", "rps", "p50_ms", "p99_ms", "max_ms", ...}
+
+    python -m benchmarks.load_scenarios --users 2000 --latency 0.002 --jitter 0.003
+    python -m benchmarks.load_scenarios --scenarios ws_fanout --sockets 5000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+SECRET = "load-scenarios-jwt-secret-0123456789abcdef"
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench-service-role")
+os.environ["SUPABASE_JWT_SECRET"] = SECRET
+os.environ.setdefault("INGEST_JOURNAL_DIR", tempfile.mkdtemp(prefix="load-ingest-"))
+# one client opens thousands of sockets; don't let the per-user limits skew it
+os.environ.setdefault("WS_CONNECT_BURST", "1000000")
+os.environ.setdefault("WS_FRAME_BURST", "1000000")
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+
+from app.core.repositories import Repositories, set_repositories  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+SCENARIOS = ("signup_login", "send_message", "ws_fanout", "history_paging", "search", "list_connections")
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "zu", "bel", "dor", "an", "vi", "sha", "qu"]
+
+
+def _uid(i: int) -> str:
+    return f"00000000-0000-0000-0000-{i:012d}"
+
+
+def _headers(user_id: str) -> dict:
+    claims = {"sub": user_id, "aud": "authenticated", "exp": int(time.time()) + 3600}
+    return {"Authorization": "Bearer " + jwt.encode(claims, SECRET, algorithm="HS256")}
+
+
+def _summary(name: str, samples: list[float], errors: int, seconds: float, **extra) -> dict:
+    samples = sorted(samples) or [0.0]
+    return {
+        "scenario": name,
+        "requests": len(samples) + errors,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rps": round((len(samples) + errors) / seconds, 1) if seconds else None,
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        **extra,
+    }
+
+
+async def _drive(name: str, calls, concurrency: int, **extra) -> dict:
+    """Run `calls` (an iterable of zero-arg coroutine factories returning an
+    httpx.Response) on `concurrency` workers; a 4xx/5xx or an exception is an error."""
+    calls = iter(calls)
+    samples: list[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for call in calls:
+            start = time.perf_counter()
+            try:
+                response = await call()
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                samples.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summary(name, samples, errors, time.perf_counter() - start, concurrency=concurrency, **extra)
+
+
+class SocketClient:
+    """Just enough of an ASGI WebSocket client to hold a connection open and
+    count what the server sends."""
+
+    def __init__(self, path: str, query: str = ""):
+        self.scope = {
+            "type": "websocket", "path": path, "raw_path": path.encode(), "root_path": "",
+            "scheme": "ws", "query_string": query.encode(), "headers": [(b"host", b"test")],
+            "client": ("127.0.0.1", 0), "server": ("test", 80), "subprotocols": [],
+            "asgi": {"version": "3.0"},
+        }
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.closed = False
+        self.frames = 0
+        self.on_frame = None
+        self._task: asyncio.Task | None = None
+
+    async def connect(self) -> bool:
+        self._inbox.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.create_task(app(self.scope, self._inbox.get, self._send))
+        waiter = asyncio.create_task(self.accepted.wait())
+        await asyncio.wait({waiter, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        return self.accepted.is_set() and not self.closed
+
+    async def _send(self, message: dict) -> None:
+        kind = message["type"]
+        if kind == "websocket.accept":
+            self.accepted.set()
+        elif kind == "websocket.send":
+            text = message.get("text")
+            if text is not None and '"ping"' in text[:32]:
+                self._inbox.put_nowait({"type": "websocket.receive", "text": '{"type":"pong"}'})
+                return
+            self.frames += 1
+            if self.on_frame is not None:
+                self.on_frame()
+        elif kind == "websocket.close":
+            self.closed = True
+
+    async def close(self) -> None:
+        self._inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+
+
+def _seed(fake: FakeSupabase, users: int, rng: random.Random) -> list[str]:
+    """Profiles for `users` ids, with usernames worth searching for."""
+    profiles = fake.store.table("profiles")
+    ids = []
+    for i in range(users):
+        user_id = _uid(i)
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        profiles.add({
+            "id": user_id, "username": f"{name}{i}", "first_name": None, "last_name": None,
+            "phone": None, "avatar_url": None,
+        })
+        ids.append(user_id)
+    return ids
+
+
+async def signup_login(client: httpx.AsyncClient, fake: FakeSupabase, args, rng, ids) -> dict:
+    n = args.requests
+
+    def calls():
+        for i in range(n):
+            body = {"email": f"load{i}@example.com", "password": "correct horse", "username": f"load{i}"}
+            yield lambda body=body: client.post("/auth/signup", json=body)
+        for i in range(n):
+            body = {"email": f"load{i}@example.com", "password": "correct horse"}
+            yield lambda body=body: client.post("/auth/login", json=body)
+
+    return await _drive("signup_login", calls(), args.concurrency)
+
+
+async def send_message(client: httpx.AsyncClient, fake: FakeSupabase, args, rng, ids) -> dict:
+    # a handful of talkers each messaging a handful of peers, so the
+    # conversation resolver sees both misses and hits
+    talkers = ids[:min(len(ids), 50)]
+    pairs = [(a, b) for a in talkers for b in rng.sample(ids, min(5, len(ids))) if a != b]
+    headers = {a: _headers(a) for a in talkers}
+
+    def calls():
+        for i in range(args.requests):
+            a, b = pairs[i % len(pairs)]
+            body = {"receiver_id": b, "body": f"message {i} from {a[-4:]}"}
+            yield lambda a=a, body=body: client.post("/messages", json=body, headers=headers[a])
+
+    return await _drive("send_message", calls(), args.concurrency, pairs=len(pairs))
+
+
+async def ws_fanout(client: httpx.AsyncClient, fake: FakeSupabase, args, rng, ids) -> dict:
+    """One group of --sockets members, each with a socket open; time a group
+    send from the POST until the last member's socket has the frame."""
+    members = ids[:min(len(ids), args.sockets)]
+    owner = members[0]
+    group = (await client.post(
+        "/conversations/group",
+        json={"title": "load", "member_ids": members[1:]},
+        headers=_headers(owner),
+    )).json()
+
+    connect_start = time.perf_counter()
+    sockets = []
+    for user_id in members:
+        token = _headers(user_id)["Authorization"].split()[1]
+        sockets.append(SocketClient(f"/ws/chat/{user_id}", f"token={token}"))
+    connected = await asyncio.gather(*(s.connect() for s in sockets))
+    connect_seconds = time.perf_counter() - connect_start
+    sockets = [s for s, ok in zip(sockets, connected) if ok]
+
+    pending = 0
+    done = asyncio.Event()
+
+    def on_frame():
+        nonlocal pending
+        pending -= 1
+        if pending == 0:
+            done.set()
+
+    for s in sockets:
+        s.on_frame = on_frame
+
+    samples, errors = [], 0
+    headers = _headers(owner)
+    start = time.perf_counter()
+    try:
+        for i in range(args.broadcasts):
+            pending, done = len(sockets), asyncio.Event()
+            sent = time.perf_counter()
+            response = await client.post(f"/messages/{group['id']}", json={"body": f"broadcast {i}"}, headers=headers)
+            if response.status_code >= 400:
+                errors += 1
+                continue
+            try:
+                await asyncio.wait_for(done.wait(), timeout=30)
+                samples.append(time.perf_counter() - sent)
+            except asyncio.TimeoutError:
+                errors += 1
+        seconds = time.perf_counter() - start
+    finally:
+        await asyncio.gather(*(s.close() for s in sockets))
+    return _summary(
+        "ws_fanout", samples, errors, seconds,
+        sockets=len(sockets),
+        connect_seconds=round(connect_seconds, 3),
+        frames_per_second=round(len(samples) * len(sockets) / seconds, 1) if seconds else None,
+    )
+
+
+async def history_paging(client: httpx.AsyncClient, fake: FakeSupabase, args, rng, ids) -> dict:
+    """Walk one long conversation back page by page, repeatedly."""
+    a, b = ids[0], ids[1]
+    messages = fake.store.table("messages")
+    conversation = (await client.post(f"/conversations/dm/{b}", headers=_headers(a))).json()
+    base = time.time() - args.history
+    for i in range(args.history):
+        sender, receiver = (a, b) if i % 2 else (b, a)
+        messages.add({
+            "id": f"10000000-0000-0000-0000-{i:012d}", "conversation_id": conversation["id"],
+            "sender_id": sender, "receiver_id": receiver, "body": f"history {i}",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(base + i)) + f".{i % 1000000:06d}+00:00",
+            "read": True, "read_at": None,
+        })
+    headers = _headers(a)
+    url = f"/messages/{conversation['id']}/history/page"
+    cursor_lock = asyncio.Lock()
+    cursors: dict[int, str | None] = {}
+    counter = itertools.count()
+
+    async def next_page():
+        # each worker walks its own chain of cursors, restarting at the top
+        worker = next(counter) % args.concurrency
+        async with cursor_lock:
+            cursor = cursors.get(worker)
+        params = {"limit": 50, **({"cursor": cursor} if cursor else {})}
+        response = await client.get(url, params=params, headers=headers)
+        if response.status_code < 400:
+            page = response.json()
+            cursors[worker] = page["next_cursor"] if page["has_more"] else None
+        return response
+
+    return await _drive(
+        "history_paging", (next_page for _ in range(args.requests)), args.concurrency,
+        messages=args.history,
+    )
+
+
+async def search(client: httpx.AsyncClient, fake: FakeSupabase, args, rng, ids) -> dict:
+    usernames = [row["username"] for row in itertools.islice(fake.store.table("profiles").rows.values(), 5000)]
+    queries = []
+    while len(queries) < args.requests:
+        username = rng.choice(usernames)
+        queries.extend(username[:k] for k in range(2, len(username) + 1))
+    queries = queries[:args.requests]
+
+    def calls():
+        for q in queries:
+            yield lambda q=q: client.get("/profiles/search", params={"q": q, "limit": 10})
+
+    return await _drive("search", calls(), args.concurrency, profiles=len(ids))
+
+
+async def list_connections(client: httpx.AsyncClient, fake: FakeSupabase, args, rng, ids) -> dict:
+    """Users with --connections accepted connections each, listing them."""
+    table = fake.store.table("connections")
+    listers = ids[:min(len(ids), 20)]
+    for n, user_id in enumerate(listers):
+        for k, other in enumerate(rng.sample(ids, min(args.connections, len(ids)))):
+            if other != user_id:
+                table.add({
+                    "id": f"20000000-0000-0000-{n:04d}-{k:012d}", "requester_id": user_id,
+                    "addressee_id": other, "status": "accepted", "created_at": "2025-01-01T00:00:00+00:00",
+                })
+    headers = {u: _headers(u) for u in listers}
+
+    def calls():
+        for i in range(args.requests):
+            user_id = listers[i % len(listers)]
+            yield lambda user_id=user_id: client.get("/connections", headers=headers[user_id])
+
+    return await _drive("list_connections", calls(), args.concurrency, connections_each=args.connections)
+
+
+async def main(args) -> None:
+    rng = random.Random(args.seed)
+    fake = FakeSupabase(latency=args.latency, jitter=args.jitter, jwt_secret=SECRET, seed=args.seed)
+    set_repositories(Repositories(fake))
+    ids = _seed(fake, args.users, rng)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for name in args.scenarios:
+                calls_before = fake.calls
+                result = await globals()[name](client, fake, args, rng, ids)
+                result["db_calls"] = fake.calls - calls_before
+                print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--users", type=int, default=5000, help="seeded profiles")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sockets", type=int, default=2000, help="group members with a socket open")
+    parser.add_argument("--broadcasts", type=int, default=20)
+    parser.add_argument("--history", type=int, default=5000, help="messages in the paged conversation")
+    parser.add_argument("--connections", type=int, default=200, help="accepted connections per lister")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds added to every Supabase call")
+    parser.add_argument("--jitter", type=float, default=0.002, help="up to this much more, uniformly")
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,14 @@
+-- Read-up-to pointers: POST /messages/{conversation_id}/read and the unread counts.
+-- One row per (conversation, user); the API upserts on that pair. No foreign key
+-- to messages: a pointer may name a WebSocket message the write-behind ingest
+-- hasn't stored yet.
+alter table public.conversation_participants
+    add column if not exists last_read_message_id uuid,
+    add column if not exists last_read_at timestamptz;
+
+create unique index if not exists conversation_participants_conversation_user_key
+    on public.conversation_participants (conversation_id, user_id);
+
+-- unread counts and history pages walk a conversation in (created_at, id) order
+create index if not exists messages_conversation_created_idx
+    on public.messages (conversation_id, created_at, id);
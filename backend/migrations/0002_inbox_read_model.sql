@@ -0,0 +1,34 @@
+-- Inbox read model: GET /conversations reads the latest message of each
+-- conversation from these columns instead of scanning messages.
+alter table public.conversations
+    add column if not exists last_message_id uuid,
+    add column if not exists last_message_at timestamptz,
+    add column if not exists last_message_preview text,
+    add column if not exists last_sender_id uuid;
+
+-- backfill conversations that already have messages
+update public.conversations c
+set last_message_id = m.id,
+    last_message_at = m.created_at,
+    last_message_preview = left(m.body, 140),
+    last_sender_id = m.sender_id,
+    updated_at = m.created_at
+from (
+    select distinct on (conversation_id) conversation_id, id, created_at, body, sender_id
+    from public.messages
+    where conversation_id is not null
+    order by conversation_id, created_at desc, id desc
+) m
+where m.conversation_id = c.id
+  and c.last_message_at is null;
+
+-- inbox pages: a user's conversations, latest activity first
+create index if not exists conversations_user1_last_message_idx
+    on public.conversations (user1_id, last_message_at desc, id desc)
+    where last_message_at is not null;
+create index if not exists conversations_user2_last_message_idx
+    on public.conversations (user2_id, last_message_at desc, id desc)
+    where last_message_at is not null;
+create index if not exists conversations_last_message_idx
+    on public.conversations (last_message_at desc, id desc)
+    where last_message_at is not null;
@@ -0,0 +1,21 @@
+-- Group conversations: a title on the conversation, a role per member, and
+-- group messages stored without a receiver.
+alter table public.conversations
+    add column if not exists title text;
+
+alter table public.conversation_participants
+    add column if not exists role text not null default 'member';
+
+do $$
+begin
+    alter table public.conversation_participants
+        add constraint conversation_participants_role_check check (role in ('admin', 'member'));
+exception when duplicate_object then null;
+end $$;
+
+alter table public.messages
+    alter column receiver_id drop not null;
+
+-- the groups a user belongs to
+create index if not exists conversation_participants_user_idx
+    on public.conversation_participants (user_id);
@@ -0,0 +1,34 @@
+-- Keep the inbox columns (0002) current from the messages table itself, so no
+-- write path needs a second round trip to update its conversation. Statement
+-- level: a batched insert updates each of its conversations once, for its
+-- newest row. Rows skipped by ON CONFLICT DO NOTHING aren't in new_messages.
+create or replace function public.touch_conversations() returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    update conversations c
+    set last_message_id = m.id,
+        last_message_at = m.created_at,
+        last_message_preview = left(m.body, 140),
+        last_sender_id = m.sender_id,
+        updated_at = m.created_at
+    from (
+        select distinct on (conversation_id) conversation_id, id, created_at, body, sender_id
+        from new_messages
+        where conversation_id is not null
+        order by conversation_id, created_at desc, id desc
+    ) m
+    where c.id = m.conversation_id
+      -- an older message arriving late (ingest replay, import) never replaces a newer one
+      and (c.last_message_at is null or c.last_message_at < m.created_at);
+    return null;
+end
+$$;
+
+drop trigger if exists messages_touch_conversations on public.messages;
+create trigger messages_touch_conversations
+    after insert on public.messages
+    referencing new table as new_messages
+    for each statement execute function public.touch_conversations();
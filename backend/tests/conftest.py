@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# settings are validated on first use; the tests never reach a real project
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test-anon-key")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-role-key")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
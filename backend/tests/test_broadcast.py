@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.api.v1 import ws
+from app.core.events import InProcessEventLog, set_event_log
+from app.core.pubsub import InProcessPubSub, set_pubsub, user_channel
+from app.core.wire import Frame
+
+USERS = ["u1", "u2", "u3"]
+
+
+class _Socket:
+    def __init__(self):
+        self.frames: list[Frame] = []
+
+    def send(self, frame: Frame, key=None) -> None:
+        self.frames.append(frame)
+
+
+@pytest.fixture
+def sockets():
+    async def setup():
+        pubsub = InProcessPubSub()
+        set_pubsub(pubsub)
+        set_event_log(InProcessEventLog())
+        pubsub.set_handler(ws._on_published)
+        pubsub.set_handler(ws._on_fanout, prefix=ws.FANOUT_CHANNEL)
+        await pubsub.subscribe(ws.FANOUT_CHANNEL)
+        for user_id in USERS:
+            await pubsub.subscribe(user_channel(user_id))
+
+    asyncio.run(setup())
+    held = {user_id: [_Socket(), _Socket()] for user_id in USERS}
+    ws.active_connections.update(held)
+    yield held
+    ws.active_connections.clear()
+    set_pubsub(None)
+    set_event_log(None)
+
+
+def _frames(held) -> list[Frame]:
+    return [frame for conns in held.values() for conn in conns for frame in conn.frames]
+
+
+def test_ephemeral_broadcast_shares_one_frame(sockets):
+    asyncio.run(ws.broadcast_to_users(USERS, {"type": "typing"}, durable=False))
+    frames = _frames(sockets)
+    assert len(frames) == 6 and len({id(f) for f in frames}) == 1
+    assert frames[0].json == b'{"type":"typing"}'
+
+
+def test_durable_broadcast_sequences_each_user(sockets):
+    asyncio.run(ws.broadcast_to_users(USERS, {"type": "message"}))
+    for conns in sockets.values():
+        a, b = (conn.frames for conn in conns)
+        assert len(a) == 1 and a[0] is b[0]  # one frame per user, shared by their sockets
+        assert a[0].seq == 1
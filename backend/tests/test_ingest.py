@@ -0,0 +1,194 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from postgrest.exceptions import APIError
+
+from app.core import ingest as ingest_module
+from app.core.ingest import DEAD_LETTER_FILE, MessageIngest
+from app.core.repositories import set_repositories
+
+REJECTED = "reject me"
+
+
+def _error(code: str) -> APIError:
+    return APIError({"message": f"error {code}", "code": code, "details": None, "hint": None})
+
+
+class _Messages:
+    """messages.insert_many that stores rows by id, failing the next `outages`
+    calls with a connection error and rejecting any batch holding a REJECTED body."""
+
+    def __init__(self, outages: int = 0):
+        self.rows: dict[str, dict] = {}
+        self.outages = outages
+        self.calls = 0
+
+    async def insert_many(self, rows: list[dict]) -> None:
+        self.calls += 1
+        if self.outages:
+            self.outages -= 1
+            raise _error("08006")
+        if any(row["body"] == REJECTED for row in rows):
+            raise _error("23503")
+        self.rows.update((row["id"], row) for row in rows)
+
+
+@pytest.fixture
+def messages():
+    messages = _Messages()
+    set_repositories(SimpleNamespace(messages=messages))
+    yield messages
+    set_repositories(None)
+
+
+def _ingest(root, **kwargs) -> MessageIngest:
+    kwargs.setdefault("batch_size", 100)
+    kwargs.setdefault("flush_interval", 0.01)
+    return MessageIngest(journal_dir=str(root), **kwargs)
+
+
+def _row(body: str) -> dict:
+    return {"conversation_id": "c1", "sender_id": "a", "receiver_id": "b", "body": body}
+
+
+async def _flushed(ingest: MessageIngest, n: int) -> None:
+    for _ in range(500):
+        if ingest.flushed + ingest.dead_lettered >= n:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{ingest.flushed} of {n} rows flushed")
+
+
+def _journaled(root) -> list[dict]:
+    return [orjson.loads(line) for path in root.glob("worker-*/*.jsonl") for line in path.read_bytes().splitlines()]
+
+
+def test_rows_are_stored_and_the_journal_removed(tmp_path, messages):
+    async def run():
+        ingest = _ingest(tmp_path)
+        rows = [await ingest.submit(_row(f"hello {n}")) for n in range(5)]
+        assert [r["id"] for r in ingest.pending("c1")] == [r["id"] for r in rows]
+        await _flushed(ingest, 5)
+        assert ingest.pending("c1") == []
+        await ingest.close()
+        return rows
+
+    rows = asyncio.run(run())
+    assert set(messages.rows) == {row["id"] for row in rows}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_orphaned_journal_is_replayed_by_the_next_worker(tmp_path, messages):
+    orphan = tmp_path / "worker-1-deadbeef"
+    orphan.mkdir(parents=True)
+    (orphan / "lock").touch()
+    stored = [{**_row(f"before the crash {n}"), "id": f"id-{n}"} for n in range(3)]
+    (orphan / "000000000001.jsonl").write_bytes(
+        b"".join(orjson.dumps(row) + b"\n" for row in stored[:2]) + orjson.dumps(stored[2])[:-5]  # torn write
+    )
+    (orphan / "000000000002.jsonl").write_bytes(orjson.dumps(stored[2]) + b"\n")
+
+    async def run():
+        ingest = _ingest(tmp_path)
+        await ingest.start()
+        await _flushed(ingest, 3)
+        await ingest.close()
+
+    asyncio.run(run())
+    assert messages.rows == {row["id"]: row for row in stored}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_a_live_workers_journal_is_left_alone(tmp_path, messages):
+    async def run():
+        live = _ingest(tmp_path, flush_interval=60)
+        row = await live.submit(_row("not flushed yet"))
+        other = _ingest(tmp_path)
+        await other.start()
+        await asyncio.sleep(0.05)
+        assert messages.rows == {}
+        assert [r["id"] for r in _journaled(tmp_path)] == [row["id"]]
+        await other.close()
+        await live.close()
+        return row
+
+    row = asyncio.run(run())
+    assert list(messages.rows) == [row["id"]]
+
+
+def test_staging_directories_are_removed_once_stale(tmp_path, messages):
+    stale, fresh = tmp_path / ".worker-1-aaaaaaaa", tmp_path / ".worker-2-bbbbbbbb"
+    for staging in (stale, fresh):
+        staging.mkdir(parents=True)
+        (staging / "lock").touch()
+    old = time.time() - ingest_module.STAGING_MAX_AGE - 1
+    os.utime(stale, (old, old))
+
+    async def run():
+        ingest = _ingest(tmp_path)
+        await ingest.start()
+        assert ingest._dir.name.startswith("worker-") and ingest._dir.is_dir()
+        assert not list(tmp_path.glob(f".{ingest._dir.name}"))
+        await ingest.close()
+
+    asyncio.run(run())
+    assert not stale.exists()
+    assert fresh.is_dir()
+
+
+def test_rejected_rows_are_dead_lettered_and_the_rest_stored(tmp_path, messages):
+    async def run():
+        ingest = _ingest(tmp_path)
+        rows = [await ingest.submit(_row(body)) for body in ("fine", REJECTED, "also fine")]
+        await _flushed(ingest, 3)
+        assert (ingest.flushed, ingest.dead_lettered) == (2, 1)
+        await ingest.close()
+        return rows
+
+    rows = asyncio.run(run())
+    assert set(messages.rows) == {rows[0]["id"], rows[2]["id"]}
+    letters = [orjson.loads(line) for line in (tmp_path / DEAD_LETTER_FILE).read_bytes().splitlines()]
+    assert [letter["row"] for letter in letters] == [rows[1]]
+    assert _journaled(tmp_path) == []
+
+
+def test_outages_are_retried(tmp_path, messages):
+    messages.outages = 1
+
+    async def run():
+        ingest = _ingest(tmp_path)
+        row = await ingest.submit(_row("hello"))
+        await _flushed(ingest, 1)
+        await ingest.close()
+        return row
+
+    row = asyncio.run(run())
+    assert list(messages.rows) == [row["id"]] and messages.calls == 2
+    assert not (tmp_path / DEAD_LETTER_FILE).exists()
+
+
+def test_rows_unstored_at_shutdown_stay_journaled(tmp_path, messages):
+    messages.outages = 1
+
+    async def shut_down_during_outage():
+        ingest = _ingest(tmp_path, flush_interval=60)
+        row = await ingest.submit(_row("hello"))
+        await ingest.close()  # before the flusher ran; the last attempt fails
+        return row
+
+    async def restart():
+        ingest = _ingest(tmp_path)
+        await ingest.start()
+        await _flushed(ingest, 1)
+        await ingest.close()
+
+    row = asyncio.run(shut_down_during_outage())
+    assert messages.rows == {}
+    assert [r["id"] for r in _journaled(tmp_path)] == [row["id"]]
+    asyncio.run(restart())
+    assert list(messages.rows) == [row["id"]]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,198 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core import message_search
+from app.core.message_search import MessageSearchIndex, _merge_segments
+from app.core.repositories import Repositories, set_repositories
+from benchmarks.fake_supabase import FakeSupabase
+
+A, B = "aaaaaaaa-0000-0000-0000-000000000001", "bbbbbbbb-0000-0000-0000-000000000002"
+_START = datetime.now(timezone.utc) - timedelta(hours=1)
+
+
+def _row(n: int, body: str, conversation_id: str = "c1") -> dict:
+    return {
+        "id": str(uuid.UUID(int=n + 1)),
+        "conversation_id": conversation_id,
+        "sender_id": A,
+        "receiver_id": B,
+        "created_at": (_START + timedelta(seconds=n)).isoformat(),
+        "body": body,
+    }
+
+
+def _open(root, **kwargs) -> MessageSearchIndex:
+    kwargs.setdefault("segment_docs", 1000)
+    kwargs.setdefault("merge_factor", 10)
+    index = MessageSearchIndex(root=str(root), **kwargs)
+    index.open()
+    return index
+
+
+def _ids(index: MessageSearchIndex, q: str, conversation_ids=("c1",), limit: int = 100) -> list[str]:
+    return [item["id"] for item in index.search(q, conversation_ids, limit)[0]]
+
+
+def _all_pages(index: MessageSearchIndex, q: str, conversation_ids=("c1",)) -> list[str]:
+    seen, cursor = [], None
+    while True:
+        items, cursor = index.search(q, conversation_ids, 2, cursor)
+        seen += [item["id"] for item in items]
+        if cursor is None:
+            return seen
+
+
+@pytest.fixture
+def repos():
+    fake = FakeSupabase(asynchronous=True)
+    set_repositories(Repositories(fake))
+    yield fake
+    set_repositories(None)
+
+
+def test_live_rows_are_searchable_and_scoped_to_conversations(tmp_path):
+    index = _open(tmp_path)
+    index.add(_row(0, "the quick brown fox"))
+    index.add(_row(1, "a lazy dog", "c2"))
+    index.add(_row(2, "fox and dog", "c2"))
+    assert _ids(index, "fox") == [_row(0, "").get("id")]
+    assert _ids(index, "fox dog", ["c1", "c2"]) == [_row(2, "")["id"]]
+    assert _ids(index, "cat", ["c1", "c2"]) == []
+    assert index.dm_conversations(A) == ["c1", "c2"]
+
+
+def test_flushed_segment_reads_back_after_reopen(tmp_path):
+    index = _open(tmp_path)
+    rows = [_row(n, f"fox number {n}") for n in range(5)]
+    for row in rows:
+        index.add(row)
+    before = index.search("fox", ["c1"], 10)[0]
+    asyncio.run(index.flush())
+    assert [s.docs for s in index._segments] == [5] and len(index._live) == 0
+    assert index.search("fox", ["c1"], 10)[0] == before
+    asyncio.run(index.close())
+
+    reopened = _open(tmp_path)
+    items = reopened.search("fox", ["c1"], 10)[0]
+    assert items == before
+    by_id = {row["id"]: row for row in rows}
+    for item in items:
+        assert {k: item[k] for k in message_search.DOC_FIELDS} == by_id[item["id"]]
+    assert reopened.dm_conversations(B) == ["c1"]
+    asyncio.run(reopened.close())
+
+
+def test_merges_keep_every_message_once(tmp_path):
+    index = _open(tmp_path, segment_docs=2, merge_factor=2)
+    for n in range(8):
+        index.add(_row(n, f"fox {n}"))
+        if n % 2:
+            asyncio.run(index.flush())
+    # 4 flushed pairs -> 2 merged fours -> one segment of 8
+    assert [s.docs for s in index._segments] == [8]
+    assert sorted(p.name for p in tmp_path.glob("seg-*.meta")) == [f"{index._segments[0].prefix.name}.meta"]
+    expected = {_row(n, "")["id"] for n in range(8)}
+    assert set(_ids(index, "fox")) == expected
+    paged = _all_pages(index, "fox")
+    assert len(paged) == 8 and set(paged) == expected
+    asyncio.run(index.close())
+
+
+def test_catch_up_loads_the_table_then_only_what_is_new(tmp_path, repos):
+    messages = repos.store.table("messages")
+    for n in range(7):
+        messages.add(_row(n, f"fox {n}"))
+    index = _open(tmp_path, segment_docs=3)
+    asyncio.run(index._catch_up())
+    asyncio.run(index.flush())
+    assert index.doc_count == 7
+    asyncio.run(index.close())
+
+    messages.add(_row(7, "fox 7"))
+    reopened = _open(tmp_path, segment_docs=3)
+    asyncio.run(reopened._catch_up())
+    asyncio.run(reopened.flush())
+    # the re-read margin overlaps what the segments hold; nothing is indexed twice
+    assert reopened.doc_count == 8
+    assert len(_ids(reopened, "fox")) == 8
+    asyncio.run(reopened.close())
+
+
+def test_reader_follows_the_writer(tmp_path):
+    writer = _open(tmp_path)
+    reader = _open(tmp_path)
+    assert writer.writer and not reader.writer
+    row = _row(0, "shared fox")
+    writer.add(row)
+    reader.add(row)  # every worker gets every message
+    asyncio.run(writer.flush())
+    asyncio.run(reader._follow())
+    assert len(reader._segments) == 1 and len(reader._live) == 0
+    assert _ids(reader, "fox") == [row["id"]]
+    asyncio.run(reader.close())
+    asyncio.run(writer.close())
+
+
+def test_half_written_segment_is_removed_on_open(tmp_path):
+    index = _open(tmp_path)
+    index.add(_row(0, "kept fox"))
+    asyncio.run(index.flush())
+    asyncio.run(index.close())
+    # a flush that died before its .meta landed
+    for suffix in (".docs", ".post", ".meta.tmp"):
+        (tmp_path / f"seg-00000099{suffix}").write_bytes(b"junk")
+
+    reopened = _open(tmp_path)
+    assert not list(tmp_path.glob("seg-00000099*"))
+    assert _ids(reopened, "fox") == [_row(0, "")["id"]]
+    asyncio.run(reopened.close())
+
+
+def test_merge_interrupted_before_deleting_its_inputs(tmp_path):
+    index = _open(tmp_path)
+    for n in range(4):
+        index.add(_row(n, f"fox {n}"))
+        if n % 2:
+            asyncio.run(index.flush())
+    inputs = list(index._segments)
+    # the merged segment landed, then the writer died before deleting the inputs
+    _merge_segments(tmp_path / "seg-00000099", inputs)
+    asyncio.run(index.close())
+
+    reopened = _open(tmp_path)
+    assert [s.prefix.name for s in reopened._segments] == ["seg-00000099"]
+    for segment in inputs:
+        assert not segment.prefix.with_suffix(".meta").exists()
+    assert sorted(_ids(reopened, "fox")) == sorted(_row(n, "")["id"] for n in range(4))
+    asyncio.run(reopened.close())
+
+
+def test_torn_conversation_log_line_is_dropped(tmp_path):
+    index = _open(tmp_path)
+    index.add(_row(0, "fox", "c1"))
+    asyncio.run(index.flush())
+    asyncio.run(index.close())
+    with open(tmp_path / "conversations.log", "ab") as log:
+        log.write(b"half-a-conversation-id")  # no newline: the write was cut off
+
+    reopened = _open(tmp_path)
+    reopened.add(_row(1, "fox", "c2"))
+    asyncio.run(reopened.flush())
+    asyncio.run(reopened.close())
+    assert (tmp_path / "conversations.log").read_bytes() == b"c1\nc2\n"
+
+    again = _open(tmp_path)
+    assert _ids(again, "fox", ["c2"]) == [_row(1, "")["id"]]
+    assert _ids(again, "fox", ["c1"]) == [_row(0, "")["id"]]
+    asyncio.run(again.close())
+
+
+def test_index_directory_is_private(tmp_path):
+    root = tmp_path / "index"
+    root.mkdir(mode=0o755)
+    index = _open(root)
+    assert root.stat().st_mode & 0o777 == 0o700
+    asyncio.run(index.close())
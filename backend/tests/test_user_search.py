@@ -0,0 +1,76 @@
+from app.core.user_search import UserSearchIndex
+
+USERNAMES = ["abby", "crabcake", "grab", "dabney", "zed", "robert", "roberta", "bobsmith99"]
+
+
+def _row(n: int, username: str, first_name: str | None = None, last_name: str | None = None) -> dict:
+    return {
+        "id": f"00000000-0000-0000-0000-{n:012d}",
+        "username": username,
+        "first_name": first_name,
+        "last_name": last_name,
+        "phone": "+100000000",
+        "avatar_url": "https://example.com/a.png",
+        "created_at": "2026-01-01T00:00:00+00:00",
+    }
+
+
+def _index(rows=None) -> UserSearchIndex:
+    index = UserSearchIndex(fuzzy_threshold=0.3, max_scan=20000)
+    index.load(rows or [_row(n, u) for n, u in enumerate(USERNAMES)])
+    return index
+
+
+def _usernames(index: UserSearchIndex, q: str, limit: int = 20) -> list[str]:
+    user_ids = index.search(q, limit)[0]
+    return [index._docs[user_id][0] for user_id in user_ids]
+
+
+def _pages(index: UserSearchIndex, q: str, limit: int) -> list[str]:
+    found, cursor = [], None
+    while True:
+        user_ids, cursor = index.search(q, limit, cursor)
+        found += user_ids
+        if cursor is None:
+            return found
+
+
+def test_keeps_only_the_searched_fields():
+    index = _index([_row(1, "Alice", "Al", "Zed")])
+    assert index._docs == {_row(1, "")["id"]: ("Alice", "Al", "Zed")}
+    assert index.search("al", 10)[0] == [_row(1, "")["id"]]
+
+
+def test_prefix_matches_come_first():
+    assert _usernames(_index(), "robe") == ["robert", "roberta"]
+
+
+def test_short_queries_match_inside_usernames():
+    # prefixes first, then usernames containing the query in username order
+    assert _usernames(_index(), "ab") == ["abby", "crabcake", "dabney", "grab"]
+    assert _usernames(_index(), "z") == ["zed"]
+    assert _usernames(_index(), "e") == ["crabcake", "dabney", "robert", "roberta", "zed"]
+
+
+def test_longer_substrings_still_match():
+    assert _usernames(_index(), "smith") == ["bobsmith99"]
+    assert _usernames(_index(), "cake") == ["crabcake"]
+
+
+def test_pages_cover_every_match_once():
+    index = _index([_row(n, f"user{n:03d}x{n % 7}") for n in range(300)])
+    for q in ("us", "x1", "r0", "user1"):
+        expected = set(index.search(q, 1000)[0])
+        paged = _pages(index, q, 7)
+        assert len(paged) == len(set(paged)) and set(paged) == expected
+
+
+def test_renames_are_applied():
+    index = _index()
+    row = _row(0, "abby")
+    index.apply({**row, "username": "tabitha", "first_name": "Tabby"})
+    assert _usernames(index, "abby") == []
+    assert _usernames(index, "tab") == ["tabitha"]
+    assert index._docs[row["id"]] == ("tabitha", "Tabby", None)
+    index.remove(row["id"])
+    assert _usernames(index, "tab") == []
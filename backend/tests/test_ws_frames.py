@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.v1.ws import FrameTooLarge, receive_message
+from app.core.config import get_settings
+
+WS_MAX_FRAME_BYTES = get_settings().ws_max_frame_bytes
+
+
+def _receive(frame: dict) -> dict:
+    async def receive():
+        return {"type": "websocket.receive", **frame}
+
+    conn = SimpleNamespace(websocket=SimpleNamespace(receive=receive), wire_format="json")
+    return asyncio.run(receive_message(conn))
+
+
+def _text(body: str) -> str:
+    return '{"type":"message","body":"' + body + '"}'
+
+
+def test_text_frames_are_measured_in_bytes():
+    overhead = len(_text(""))
+    # fits in characters, not in UTF-8 bytes
+    wide = _text("é" * ((WS_MAX_FRAME_BYTES - overhead) // 2 + 1))
+    assert len(wide) <= WS_MAX_FRAME_BYTES
+    with pytest.raises(FrameTooLarge):
+        _receive({"text": wide})
+    fits = "é" * ((WS_MAX_FRAME_BYTES - overhead) // 2)
+    assert _receive({"text": _text(fits)})["body"] == fits
+
+
+def test_binary_and_ascii_limits():
+    with pytest.raises(FrameTooLarge):
+        _receive({"text": _text("x" * WS_MAX_FRAME_BYTES)})
+    with pytest.raises(FrameTooLarge):
+        _receive({"bytes": b"x" * (WS_MAX_FRAME_BYTES + 1)})
+    body = "x" * (WS_MAX_FRAME_BYTES - len(_text("")))
+    assert _receive({"text": _text(body)})["body"] == body
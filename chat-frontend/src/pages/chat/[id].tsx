@@ -71,11 +71,16 @@ useEffect(() => {
     if (!router.isReady || !user?.id || !otherUserId) return;
 
     console.log("⚡ Connecting to WebSocket:", user.id);
-    const ws = new WebSocket(`ws://localhost:8000/ws/chat/${user.id}`);
+    const token = encodeURIComponent(localStorage.getItem("token") ?? "");
+    const ws = new WebSocket(`ws://localhost:8000/ws/chat/${user.id}?token=${token}`);
 
     ws.onopen = () => console.log("✅ WebSocket connected");
     ws.onmessage = (event) => {
       const msg = JSON.parse(event.data);
+      if (msg.type === "ping") {
+        ws.send(JSON.stringify({ type: "pong" }));
+        return;
+      }
       const relevant =
         (String(msg.sender_id) === String(user.id) && String(msg.receiver_id) === String(otherUserId)) ||
         (String(msg.sender_id) === String(otherUserId) && String(msg.receiver_id) === String(user.id));